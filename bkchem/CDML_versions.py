@@ -200,7 +200,7 @@ class CDML_transformer_14_15(object):
         elif m.getAttribute( "type") == "biradical":
           multiplicity += 2
       if not a.hasAttribute("multiplicity"):
-        a.setAttribute( "multiplicity", multiplicity)
+        a.setAttribute( "multiplicity", str( multiplicity))
 
 
 
@@ -311,7 +311,7 @@ class atom(drawable_chem_vertex, oasa.atom):
       if self.item:
         warn( "drawing atom that is probably drawn", UserWarning, 2)
       x, y = self.x, self.y
-      self.item = self.paper.create_line( x, y, x, y, tags=("atom", 'nonSVG'), fill='')
+      self.item = self._create_item( 'line', (x, y, x, y), tags=("atom", 'nonSVG'), fill='')
       self.selector = None
       if not redraw:
         [m.draw() for m in self.marks]
@@ -0,0 +1,202 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Conversion of many files at once using a pool of worker processes.
+
+Every worker runs its own headless application (see headless.py), the files
+are read by the native reader or the import plugins and written by the export
+plugins. A failure of one file is reported and the conversion goes on.
+
+usage: bkchem -c [options] FILE_OR_DIR ...
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import optparse
+import traceback
+import multiprocessing
+
+import headless
+import plugins
+
+from singleton_store import Store
+
+
+
+native_extensions = ('.svg', '.svgz', '.cdml', '.cdgz')
+
+# the Cairo exporters are preferred when an export format is given by its extension
+preferred_exporters = ("PNG (Cairo)", "PDF (Cairo)", "SVG_Cairo", "PS_Cairo")
+
+
+def get_importer_name( file_name):
+  """returns the name of the import plugin for file_name, None for native files"""
+  ext = os.path.splitext( file_name)[1].lower()
+  if ext in native_extensions:
+    return None
+  for plugin in plugins.get_plugins():
+    if plugin.has_importer and ext in plugin.extensions:
+      return plugin.name
+  raise ValueError( "no import plugin for files with extension '%s'" % ext)
+
+
+def get_exporter( format):
+  """returns the export plugin given by its name or by file extension"""
+  ext = "." + format.lower().lstrip( ".")
+  candidates = []
+  for plugin in plugins.get_plugins():
+    if not plugin.has_exporter:
+      continue
+    if plugin.name == format:
+      return plugin
+    if ext in plugin.extensions:
+      candidates.append( plugin)
+  if not candidates:
+    raise ValueError( "unknown export format '%s'" % format)
+  candidates.sort( key=lambda p: p.name not in preferred_exporters)
+  return candidates[0]
+
+
+def find_input_files( paths):
+  """expands directories in paths to the files with known extensions"""
+  known = set( native_extensions)
+  for plugin in plugins.get_plugins():
+    if plugin.has_importer:
+      known.update( plugin.extensions)
+  known.discard( '.xml') # too generic to be picked up from a directory
+  ret = []
+  for path in paths:
+    if os.path.isdir( path):
+      for name in sorted( os.listdir( path)):
+        full = os.path.join( path, name)
+        if os.path.isfile( full) and os.path.splitext( name)[1].lower() in known:
+          ret.append( full)
+    else:
+      ret.append( path)
+  return ret
+
+
+
+## the worker part
+
+def init_worker():
+  """creates the application of the worker process"""
+  headless.headless_app()
+
+
+def convert_file( task):
+  """converts one file to all the requested formats;
+  returns (input_name, output_names, time, error message or None)"""
+  file_name, exporters, out_dir = task
+  app = Store.app
+  t = time.time()
+  outputs = []
+  try:
+    importer = get_importer_name( file_name)
+    if importer:
+      ok = app.plugin_import( importer, file_name)
+    else:
+      ok = app.load_CDML( file_name)
+    if not ok:
+      raise ValueError( "the file could not be read")
+    base = os.path.splitext( os.path.basename( file_name))[0]
+    for pl_id, ext in exporters:
+      out = os.path.join( out_dir or os.path.dirname( file_name), base + ext)
+      # some exporters (e.g. molfile) work on the selection
+      app.paper.select_all()
+      if not app.plugin_export( pl_id, out):
+        raise ValueError( "export to %s failed" % pl_id)
+      outputs.append( out)
+  except Exception:
+    return file_name, outputs, time.time() - t, traceback.format_exc().strip().splitlines()[-1]
+  finally:
+    app.paper.clean_paper()
+  return file_name, outputs, time.time() - t, None
+
+
+
+def convert( files, formats, out_dir=None, jobs=None, report=None):
+  """converts files to formats in jobs worker processes (number of CPUs by default),
+  report is called with the result of each file as returned by convert_file;
+  returns the list of all results"""
+  exporters = []
+  for f in formats:
+    plugin = get_exporter( f)
+    exporters.append( (plugin.name, plugin.extensions[0]))
+  if out_dir and not os.path.isdir( out_dir):
+    os.makedirs( out_dir)
+  tasks = [(f, exporters, out_dir) for f in files]
+  jobs = jobs or multiprocessing.cpu_count()
+
+  if jobs == 1:
+    init_worker()
+    results = map( convert_file, tasks)
+    pool = None
+  else:
+    pool = multiprocessing.Pool( min( jobs, len( tasks) or 1), initializer=init_worker)
+    results = pool.imap_unordered( convert_file, tasks)
+
+  ret = []
+  for res in results:
+    ret.append( res)
+    if report:
+      report( res)
+  if pool:
+    pool.close()
+    pool.join()
+  return ret
+
+
+def print_result( result):
+  file_name, outputs, t, error = result
+  if error:
+    print( "FAILED %7.3fs  %s: %s" % (t, file_name, error))
+  else:
+    print( "ok     %7.3fs  %s -> %s" % (t, file_name, ", ".join( outputs)))
+  sys.stdout.flush()
+
+
+
+def main( args):
+  parser = optparse.OptionParser( usage="%prog -c [options] FILE_OR_DIR ...")
+  parser.add_option( "-f", "--format", dest="formats", action="append", default=[],
+                     help="export format, plugin name or file extension (default png); may be repeated")
+  parser.add_option( "-o", "--output-dir", dest="out_dir", default=None,
+                     help="directory for the output files (default is the directory of the input)")
+  parser.add_option( "-j", "--jobs", dest="jobs", type="int", default=0,
+                     help="number of worker processes (default is the number of CPUs)")
+  opts, paths = parser.parse_args( args)
+  if not paths:
+    parser.error( "no input files given")
+
+  files = find_input_files( paths)
+  t = time.time()
+  results = convert( files, opts.formats or ['png'], out_dir=opts.out_dir, jobs=opts.jobs,
+                     report=print_result)
+  failed = [r for r in results if r[3]]
+  print( "converted %d of %d files in %.2fs" % (len( results) - len( failed), len( results), time.time() - t))
+  return failed and 1 or 0
+
+
+
+if __name__ == '__main__':
+  sys.exit( main( sys.argv[1:]))
@@ -30,6 +30,9 @@ import os_support
 
 sys.path.insert(1, os_support.get_module_path())
 
+# must be imported as soon as possible to measure the imports
+import startup_profile
+
 ### now starting for real
 import pref_manager
 
@@ -39,6 +42,7 @@ from singleton_store import Store
 Store.pm = pref_manager.pref_manager(
   [os_support.get_config_filename( "prefs.xml", level="global", mode='r'),
    os_support.get_config_filename( "prefs.xml", level="personal", mode='r')])
+startup_profile.mark( "preferences")
 
 
 ## first turn locale support on
@@ -94,6 +98,7 @@ else:
     builtins.__dict__['ngettext'] = gettext.ngettext
     Store.lang = "en"
 
+startup_profile.mark( "locale")
 
 
 import config
@@ -121,102 +126,123 @@ if not config.debug:
     sys.exit()
 
 
-from main import BKChem
-from splash import Splash
-from singleton_store import Store
+if __name__ == '__main__' and sys.argv[1:2] == ["-c"]:
+  # conversion of files without the GUI, Tk is not initialized at all
+  import batch_convert
+  sys.exit( batch_convert.main( sys.argv[2:]))
 
-myapp = BKChem()
-myapp.withdraw()
 
-if __name__ == '__main__':
+startup_profile.mark( "checks of modules")
 
-  import messages
-  enc = sys.getfilesystemencoding()
-  if not enc:
-    enc = sys.getdefaultencoding()
-  opts = [i.decode(enc) for i in sys.argv[1:]
-                          if ((sys.version_info[0] > 2 and isinstance(i, bytes)) or
-                              (sys.version_info[0] < 3 and isinstance(i, str)))]
-  opts.extend(i for i in sys.argv[1:]
-                  if ((sys.version_info[0] > 2 and isinstance(i, str)) or
-                      (sys.version_info[0] < 3 and isinstance(i, unicode))))
-
-  if "-v" in opts or "--version" in opts:
-    print("BKChem", config.current_BKChem_version)
-    sys.exit()
-  if "-h" in opts or "--help" in opts:
-    print(messages.usage_text)
-    sys.exit()
-  if "-H" in opts:
-    i = opts.index("-H")
-    del opts[i]
-    if len( opts) > i:
-      os_support.set_bkchem_private_dir( opts[i])
+
+# multiprocessing runs this script again as __mp_main__ (__parents_main__ in
+# Python 2 on Windows) to start the workers of the render pool and of the
+# bulk import, the application must not be created in them
+if __name__ not in ('__mp_main__', '__parents_main__'):
+
+  from main import BKChem
+  from splash import Splash
+  from singleton_store import Store
+
+  startup_profile.mark( "import of main")
+
+  myapp = BKChem()
+  myapp.withdraw()
+
+  startup_profile.mark( "creation of application")
+
+  if __name__ == '__main__':
+
+    import messages
+    enc = sys.getfilesystemencoding()
+    if not enc:
+      enc = sys.getdefaultencoding()
+    opts = [i.decode(enc) for i in sys.argv[1:]
+                            if ((sys.version_info[0] > 2 and isinstance(i, bytes)) or
+                                (sys.version_info[0] < 3 and isinstance(i, str)))]
+    opts.extend(i for i in sys.argv[1:]
+                    if ((sys.version_info[0] > 2 and isinstance(i, str)) or
+                        (sys.version_info[0] < 3 and isinstance(i, unicode))))
+
+    if "-v" in opts or "--version" in opts:
+      print("BKChem", config.current_BKChem_version)
+      sys.exit()
+    if "-h" in opts or "--help" in opts:
+      print(messages.usage_text)
+      sys.exit()
+    if "-H" in opts:
+      i = opts.index("-H")
       del opts[i]
-  if "-b" in opts:
-    i = opts.index("-b")
-    if len(opts) >= i:
-      # Batch mode
-      myapp.initialize_batch()
-      myapp.process_batch(opts)
-    sys.exit()
+      if len( opts) > i:
+        os_support.set_bkchem_private_dir( opts[i])
+        del opts[i]
+    if "-b" in opts:
+      i = opts.index("-b")
+      if len(opts) >= i:
+        # Batch mode
+        myapp.initialize_batch()
+        startup_profile.mark( "batch initialization")
+        startup_profile.report()
+        myapp.process_batch(opts)
+      sys.exit()
+    else:
+      # normal interactive mode
+      files = opts
+      # splash screen
+      splash = Splash()
+      splash.withdraw()
+      splash.update_idletasks()
+      width = splash.winfo_reqwidth()
+      height = splash.winfo_reqheight()
+      x = (myapp.winfo_screenwidth() - width) / 2 - myapp.winfo_vrootx()
+      y = (myapp.winfo_screenheight() - height) / 3 - myapp.winfo_vrooty()
+      if x < 0:
+          x = 0
+      if y < 0:
+          y = 0
+      geometry = '%dx%d+%d+%d' % (width, height, x, y)
+      splash.geometry(geometry)
+      splash.update_idletasks()
+      splash.deiconify()
+      myapp.update()
+
+      # application initialization
+      myapp.initialize()
+      for i in range( 0, len( files)):
+        if i > 0:
+          myapp.add_new_paper()
+        if os.path.isfile( files[i]):
+          myapp.load_CDML( file=files[i], replace=1)
+        else:
+          myapp.set_file_name( files[i], check_ext=1)
+
+      # destroy splash
+      splash.destroy()
+      del splash
+
+    # start the application
+    g = Store.pm.get_preference( 'geometry')
+    if g:
+      geometry = g
+    else:
+      geometry = "640x480+10+10"
+    myapp.geometry(geometry)
+    myapp.update_idletasks()
+    myapp.deiconify()
+    startup_profile.mark( "display of window")
+    startup_profile.report()
+    myapp.mainloop()
+
+  # the module was imported from outside
   else:
-    # normal interactive mode
-    files = opts
-    # splash screen
-    splash = Splash()
-    splash.withdraw()
-    splash.update_idletasks()
-    width = splash.winfo_reqwidth()
-    height = splash.winfo_reqheight()
-    x = (myapp.winfo_screenwidth() - width) / 2 - myapp.winfo_vrootx()
-    y = (myapp.winfo_screenheight() - height) / 3 - myapp.winfo_vrooty()
-    if x < 0:
-        x = 0
-    if y < 0:
-        y = 0
-    geometry = '%dx%d+%d+%d' % (width, height, x, y)
-    splash.geometry(geometry)
-    splash.update_idletasks()
-    splash.deiconify()
-    myapp.update()
-
     # application initialization
     myapp.initialize()
-    for i in range( 0, len( files)):
-      if i > 0:
-        myapp.add_new_paper()
-      if os.path.isfile( files[i]):
-        myapp.load_CDML( file=files[i], replace=1)
-      else:
-        myapp.set_file_name( files[i], check_ext=1)
-
-    # destroy splash
-    splash.destroy()
-    del splash
-
-  # start the application
-  g = Store.pm.get_preference( 'geometry')
-  if g:
-    geometry = g
-  else:
-    geometry = "640x480+10+10"
-  myapp.geometry(geometry)
-  myapp.update_idletasks()
-  myapp.deiconify()
-  myapp.mainloop()
-
-# the module was imported from outside
-else:
-  # application initialization
-  myapp.initialize()
-  # start the application
-  g = Store.pm.get_preference( 'geometry')
-  if g:
-    geometry = g
-  else:
-    geometry = "640x480+10+10"
-  myapp.geometry(geometry)
-  myapp.update_idletasks()
-  myapp.deiconify()
-
+    # start the application
+    g = Store.pm.get_preference( 'geometry')
+    if g:
+      geometry = g
+    else:
+      geometry = "640x480+10+10"
+    myapp.geometry(geometry)
+    myapp.update_idletasks()
+    myapp.deiconify()
@@ -34,6 +34,7 @@ import misc
 import dom_extensions
 
 from ftext import ftext
+from item_pool import item_pool
 from singleton_store import Store, Screen
 from parents import meta_enabled, line_colored, drawable, with_line, interactive, child_with_paper
 
@@ -82,6 +83,9 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     if atoms:
       self.atom1, self.atom2 = atoms
     self.selector = None
+    self._item_pool = None # items reused during redraw
+    self._transform = None # transforms the drawing back from the 3D projection
+    self._coords = None # projected coordinates of atoms used when drawing in 3D
 
     # implicit values
     self.center = None
@@ -288,37 +292,27 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
       if automatic == "both":
         self.center = center
     # the following lines ensure proper drawing in case 3D coordinates are involved
-    transform = None
-    self._transform = oasa.transform3d.transform3d()
     if self.order != 1 or self.type != 'n':
-      for n in self.atom1.neighbors + self.atom2.neighbors:
-        # self.atom1 and self.atom2 are in this list as well
-        if n.z != 0:
-          # engage 3d transform prior to detection of where to draw
-          transform = self._get_3dtransform_for_drawing()
-          break
+      transform, self._coords = self._get_3d_projection()
       if transform:
-        for n in self.molecule.atoms:
-          n.transform( transform)
         self._transform = transform.get_inverse()
     # / end of 3D
     # we call the draw method
-    self.__class__.__dict__[ method]( self)
-    # we have to cleanup after 3D stuff
-    if self._transform:
-      # if transform was used, we need to transform back
-      for n in self.molecule.atoms:
-        n.transform( self._transform)
+    try:
+      self.__class__.__dict__[ method]( self)
+    finally:
+      # we have to cleanup after 3D stuff
       self._transform = None
+      self._coords = None
 
 
   # THE DRAW HELPER METHODS
   def _where_to_draw_from_and_to( self):
-    x1, y1 = self.atom1.get_xy()
-    x2, y2 = self.atom2.get_xy()
+    x1, y1 = self._xy( self.atom1)
+    x2, y2 = self._xy( self.atom2)
     # at first check if the bboxes are not overlapping
-    bbox1 = list( misc.normalize_coords( self.atom1.bbox( substract_font_descent=True)))
-    bbox2 = list( misc.normalize_coords( self.atom2.bbox( substract_font_descent=True)))
+    bbox1 = list( misc.normalize_coords( self._atom_bbox( self.atom1)))
+    bbox2 = list( misc.normalize_coords( self._atom_bbox( self.atom2)))
     if geometry.do_rectangles_intersect( bbox1, bbox2):
       return None
     # then we continue with computation
@@ -620,8 +614,8 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
 
 
   def _draw_second_line( self, coords):
-    my_x1, my_y1 = self.atom1.get_xy()
-    my_x2, my_y2 = self.atom2.get_xy()
+    my_x1, my_y1 = self._xy( self.atom1)
+    my_x2, my_y2 = self._xy( self.atom2)
     my_coords = (my_x1,my_y1,my_x2,my_y2)
     x, y, x0, y0 = coords
     # shortening of the second bond
@@ -636,16 +630,19 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     side = geometry.on_which_side_is_point( my_coords, (x,y))
     for atom in (self.atom1,self.atom2):
       second_atom = atom is self.atom1 and self.atom2 or self.atom1
-      neighs = [n for n in atom.neighbors if geometry.on_which_side_is_point( my_coords, n.get_xy())==side and n is not second_atom]
+      ax, ay = self._xy( atom)
+      sx, sy = self._xy( second_atom)
+      neighs = [n for n in atom.neighbors if geometry.on_which_side_is_point( my_coords, self._xy( n))==side and n is not second_atom]
       for n in neighs:
-        dist2 = _k*geometry.point_distance(*my_coords)*geometry.on_which_side_is_point((atom.x, atom.y, n.x, n.y), (second_atom.x, second_atom.y))
-        xn1, yn1, xn2, yn2 = geometry.find_parallel( atom.x, atom.y, n.x, n.y, dist2)
+        nx, ny = self._xy( n)
+        dist2 = _k*geometry.point_distance(*my_coords)*geometry.on_which_side_is_point((ax, ay, nx, ny), (sx, sy))
+        xn1, yn1, xn2, yn2 = geometry.find_parallel( ax, ay, nx, ny, dist2)
         xp,yp,parallel,online = geometry.intersection_of_two_lines( x,y,x0,y0,xn1,yn1,xn2,yn2)
         if not parallel:
           if not geometry.is_point_beween_points_of_line( (x,y,x0,y0),(xp,yp)):
             # only shorten the line - do not elongate it
             continue
-          if geometry.point_distance( atom.x,atom.y,x,y) < geometry.point_distance( atom.x,atom.y,x0,y0):
+          if geometry.point_distance( ax,ay,x,y) < geometry.point_distance( ax,ay,x0,y0):
             x,y = xp, yp
           else:
             x0,y0 = xp, yp
@@ -681,6 +678,46 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     return t
 
 
+  def _get_3d_projection( self):
+    """returns (transform, coords) for drawing of bonds with some of the neighbors out
+    of the (x,y) plane - transform is the one from _get_3dtransform_for_drawing and coords
+    maps both atoms and their neighbors to their transformed (x,y) coordinates;
+    (None, None) is returned when no transformation is needed.
+    Only the atoms the drawing code looks at are transformed (and they are not moved),
+    which keeps the drawing independent of the size of the molecule."""
+    neighbors = self.atom1.neighbors + self.atom2.neighbors
+    # self.atom1 and self.atom2 are in this list as well
+    for n in neighbors:
+      if n.z != 0:
+        break
+    else:
+      return None, None
+    transform = self._get_3dtransform_for_drawing()
+    coords = {}
+    for n in neighbors + [self.atom1, self.atom2]:
+      if n not in coords:
+        coords[ n] = tuple( transform.transform_xyz( *n.get_xyz())[0:2])
+    return transform, coords
+
+
+  def _xy( self, atom):
+    """returns the (x,y) coordinates of atom in the coordinate system the bond is drawn in"""
+    if self._coords and atom in self._coords:
+      return self._coords[ atom]
+    return atom.get_xy()
+
+
+  def _atom_bbox( self, atom):
+    """returns the bbox of atom (without font descent) in the coordinate system the bond is drawn in"""
+    bbox = atom.bbox( substract_font_descent=True)
+    if self._coords and atom in self._coords:
+      x, y = self._coords[ atom]
+      dx = x - atom.x
+      dy = y - atom.y
+      bbox = (bbox[0]+dx, bbox[1]+dy, bbox[2]+dx, bbox[3]+dy)
+    return bbox
+
+
   # wedge bonds
   def _draw_w1( self):
     where = self._where_to_draw_from_and_to()
@@ -1002,8 +1039,19 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
       #print("redrawing non-dirty bond")
     sel = self.selector
     if self.item:
-      self.delete()
-    self.draw( automatic=recalc_side and "both" or "none")
+      # the old canvas items are reused by draw instead of being created again
+      self.paper.unregister_id( self.item)
+      self._item_pool = item_pool( self.paper, [self.item] + self.second + self.third + self.items)
+      self.item = None
+      self.second = []
+      self.third = []
+      self.items = []
+    try:
+      self.draw( automatic=recalc_side and "both" or "none")
+    finally:
+      if self._item_pool:
+        self._item_pool.delete()
+        self._item_pool = None
     # reselect
     if sel:
       self.select()
@@ -1309,28 +1357,25 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
 
   def _compute_sign_and_center( self):
     """returns tuple of (sign, center) where sign is the default sign of the self.bond_width"""
-    # check if we need to transform 3D before computation
-    transform = None
-    for n in self.atom1.neighbors + self.atom2.neighbors:
-      # self.atom1 and self.atom2 are in this list as well
-      if n.z != 0:
-        # engage 3d transform prior to detection of where to draw
-        transform = self._get_3dtransform_for_drawing()
-        break
-    if transform:
-      for n in self.atom1.neighbors + self.atom2.neighbors:
-        n.transform( transform)
-    # /end of check
-    line = self.atom1.get_xy() + self.atom2.get_xy()
+    # the neighbors are projected in case 3D coordinates are involved
+    coords_3d = self._coords
+    self._coords = self._get_3d_projection()[1]
+    try:
+      return self._compute_sign_and_center_from_coords()
+    finally:
+      self._coords = coords_3d
+
+
+  def _compute_sign_and_center_from_coords( self):
+    line = self._xy( self.atom1) + self._xy( self.atom2)
     atms = self.atom1.neighbors + self.atom2.neighbors
     atms = misc.difference( atms, [self.atom1, self.atom2])
-    coords = [a.get_xy() for a in atms]
+    coords = [self._xy( a) for a in atms]
     # searching for circles
     circles = 0
-    for ring in self.molecule.get_smallest_independent_cycles_dangerous_and_cached():
-      if self.atom1 in ring and self.atom2 in ring:
-        on_which_side = lambda xy: geometry.on_which_side_is_point( line, xy)
-        circles += sum(map(on_which_side, [a.get_xy() for a in ring if a not in self.atoms]))
+    for ring in self.molecule.get_ring_index().get_rings_with_bond( self):
+      on_which_side = lambda xy: geometry.on_which_side_is_point( line, xy)
+      circles += sum(map(on_which_side, [self._xy( a) for a in ring if a not in self.atoms]))
     if circles:
       side = circles
     else:
@@ -1361,12 +1406,6 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
           ret = (-1, 0)
         else:
           ret = (1, 0)
-    # transform back if necessary
-    if transform:
-      inv = transform.get_inverse()
-      for n in self.atom1.neighbors + self.atom2.neighbors:
-        n.transform( inv)
-    # /end of back transform
     return ret
 
 
@@ -1471,6 +1510,8 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     It is used during drawing of bonds in 3D"""
     if self._transform:
       coords = self._transform.transform_xy_flat_list( coords)
+    if self._item_pool:
+      return self._item_pool.create( 'line', coords, **kw)
     return self.paper.create_line( coords, **kw)
 
 
@@ -1480,6 +1521,8 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     It is used during drawing of bonds in 3D"""
     if self._transform:
       coords = self._transform.transform_xy_flat_list( coords)
+    if self._item_pool:
+      return self._item_pool.create( 'oval', coords, **kw)
     return self.paper.create_oval( coords, **kw)
 
 
@@ -1489,5 +1532,7 @@ class bond( meta_enabled, line_colored, drawable, with_line, interactive, child_
     It is used during drawing of bonds in 3D"""
     if self._transform:
       coords = self._transform.transform_xy_flat_list( coords)
+    if self._item_pool:
+      return self._item_pool.create( 'polygon', coords, **kw)
     return self.paper.create_polygon( coords, **kw)
 
@@ -0,0 +1,145 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Import of many SMILES or InChI strings at once.
+
+The strings are converted to structures (including the 2D coordinates) by a
+pool of worker processes. The molecules are then laid out in rows on the
+paper so that they do not overlap, and they are drawn at once at the end:
+
+  mols, errors = bulk_import.import_file( paper, "structures.smi")
+"""
+
+import traceback
+import multiprocessing
+
+import oasa_bridge
+
+from singleton_store import Screen
+
+
+# with less structures it is faster to convert them in this process
+min_parallel = 50
+
+
+
+def read_file( name):
+  """returns the list of (kind, text) of all the structures in the file name,
+  one structure per line; kind is 'inchi' for lines starting with 'InChI=',
+  'smiles' otherwise; only the first word of a line is used (it is often
+  followed by a name), empty lines and lines starting with # are skipped"""
+  ret = []
+  with open( name) as f:
+    for line in f:
+      line = line.strip()
+      if not line or line.startswith( "#"):
+        continue
+      text = line.split()[0]
+      ret.append( (get_kind( text), text))
+  return ret
+
+
+def get_kind( text):
+  if text.startswith( "InChI="):
+    return 'inchi'
+  return 'smiles'
+
+
+
+## the worker part
+
+def convert_text( task):
+  """converts one structure given as (kind, text);
+  returns (True, data as returned by oasa_bridge.oasa_mol_to_data) or (False, error message)"""
+  kind, text = task
+  try:
+    if kind == 'smiles':
+      mol = oasa_bridge.smiles_to_oasa_mol( text)
+    elif kind == 'inchi':
+      mol = oasa_bridge.inchi_to_oasa_mol( text)
+    else:
+      raise ValueError( "unknown kind of input '%s'" % kind)
+    return True, oasa_bridge.oasa_mol_to_data( mol)
+  except Exception:
+    return False, traceback.format_exc().strip().splitlines()[-1]
+
+
+
+def convert( tasks, jobs=None):
+  """converts the structures given as (kind, text) in jobs worker processes
+  (number of CPUs by default); returns the results of convert_text in the order of tasks"""
+  jobs = jobs or multiprocessing.cpu_count()
+  if jobs == 1 or len( tasks) < min_parallel:
+    return [convert_text( t) for t in tasks]
+  pool = multiprocessing.Pool( min( jobs, len( tasks)))
+  try:
+    return pool.map( convert_text, tasks, chunksize=max( 1, len( tasks) // (4*jobs)))
+  finally:
+    pool.close()
+    pool.join()
+
+
+def layout( mols, width, x0=0, y0=0, gap=20):
+  """places the mols (not drawn yet) in rows starting at x0, y0, each row
+  at most width wide, with gap between the molecules"""
+  x, y = x0, y0
+  row_height = 0
+  for m in mols:
+    xs = [a.x for a in m.atoms]
+    ys = [a.y for a in m.atoms]
+    w = max( xs) - min( xs)
+    h = max( ys) - min( ys)
+    if x > x0 and x + w > x0 + width:
+      # start a new row
+      x = x0
+      y += row_height + gap
+      row_height = 0
+    m.move( x - min( xs), y - min( ys))
+    x += w + gap
+    row_height = max( row_height, h)
+
+
+def import_texts( paper, tasks, jobs=None):
+  """imports the structures given as (kind, text) to paper;
+  returns (list of new molecules, list of (index in tasks, error message))"""
+  mols = []
+  errors = []
+  for i, (ok, result) in enumerate( convert( tasks, jobs=jobs)):
+    if ok:
+      try:
+        mols.append( oasa_bridge.oasa_mol_to_bkchem_mol( oasa_bridge.data_to_oasa_mol( result), paper))
+      except Exception:
+        errors.append( (i, traceback.format_exc().strip().splitlines()[-1]))
+    else:
+      errors.append( (i, result))
+  if mols:
+    gap = 2 * Screen.any_to_px( paper.standard.bond_length)
+    width = Screen.mm_to_px( paper._paper_properties['size_x'])
+    layout( mols, width - 2*gap, x0=gap, y0=gap, gap=gap)
+    paper.stack.extend( mols)
+    [m.draw() for m in mols]
+    paper.add_bindings()
+    paper.start_new_undo_record()
+  return mols, errors
+
+
+def import_file( paper, name, jobs=None):
+  """imports all the structures from the file name (see read_file) to paper,
+  returns the same as import_texts"""
+  return import_texts( paper, read_file( name), jobs=jobs)
@@ -0,0 +1,80 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Transformation of many points at once.
+
+The oasa transform and transform3d objects transform one point per call.
+When numpy is available, the functions here turn the transformation into
+an affine matrix and apply it to all the points in one matrix
+multiplication. Without numpy they fall back to the point by point
+transformation.
+"""
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+# below this number of points the conversion to numpy arrays does not pay off
+min_size = 16
+
+
+
+def get_matrix( tr):
+  """returns the 3x4 affine matrix [A|t] of the transform3d (or transform) tr,
+  the matrix is found by transforming the origin and the unit vectors"""
+  origin = tr.transform_xyz( 0, 0, 0)
+  m = numpy.empty( (3, 4))
+  for i, e in enumerate( ((1,0,0), (0,1,0), (0,0,1))):
+    m[:,i] = numpy.subtract( tr.transform_xyz( *e), origin)
+  m[:,3] = origin
+  return m
+
+
+def get_matrix_2d( tr):
+  """returns the 2x3 affine matrix [A|t] of the transform (or transform3d) tr in the (x,y) plane"""
+  x0, y0, x1, y1, x2, y2 = tr.transform_xy_flat_list( [0, 0, 1, 0, 0, 1])
+  return numpy.array( ((x1-x0, x2-x0, x0),
+                       (y1-y0, y2-y0, y0)), dtype=float)
+
+
+def transform_xyz_list( tr, coords):
+  """returns the list of transformed (x,y,z) points from coords"""
+  if numpy is None or len( coords) < min_size:
+    return [tuple( tr.transform_xyz( *c)) for c in coords]
+  m = get_matrix( tr)
+  points = numpy.array( coords, dtype=float).reshape( (-1, 3))
+  return [tuple( c) for c in (points.dot( m[:,0:3].T) + m[:,3]).tolist()]
+
+
+def transform_xy_flat_list( tr, coords):
+  """the same as tr.transform_xy_flat_list - returns the flat list [x1,y1,x2,y2,...]
+  of transformed coordinates"""
+  if numpy is None or len( coords) < 2*min_size:
+    return tr.transform_xy_flat_list( coords)
+  m = get_matrix_2d( tr)
+  points = numpy.array( coords, dtype=float).reshape( (-1, 2))
+  return (points.dot( m[:,0:2].T) + m[:,2]).ravel().tolist()
+
+
+def transform_atoms( tr, atoms):
+  """applies tr to the coordinates of atoms (including z), returns the list
+  of new (x,y,z) for each atom, the atoms are not modified"""
+  return transform_xyz_list( tr, [a.get_xyz() for a in atoms])
@@ -0,0 +1,111 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Streaming reader of CDML and CD-SVG files.
+
+Instead of building the DOM tree of the whole document the file is parsed
+with pulldom and only the subtree of one top-level object (molecule, arrow,
+standard, ...) exists at a time. The objects are read by the usual
+read_package methods, see paper.read_package_stream:
+
+  cdml, children = cdml_reader.read_CDML_file( "file.svgz")
+  if cdml:
+    paper.read_package_stream( cdml, children)
+"""
+
+import gzip
+
+from xml.dom import pulldom
+
+import data
+import config
+import CDML_versions
+
+
+gzip_magic = b'\x1f\x8b'
+
+
+def open_CDML_file( name):
+  """returns a binary file object for name, gzipped files are decompressed on the fly"""
+  f = open( name, "rb")
+  magic = f.read( 2)
+  f.seek( 0)
+  if magic == gzip_magic:
+    return gzip.GzipFile( fileobj=f, mode="rb")
+  return f
+
+
+def iterparse_CDML( stream, bufsize=2**16):
+  """parses the CDML or CD-SVG document from stream and yields the cdml element
+  (without children) first and then its child elements one by one,
+  each with its whole subtree; nothing is yielded when there is no cdml element"""
+  events = pulldom.parse( stream, bufsize=bufsize)
+  depth = None  # depth of the cdml element
+  level = 0
+  for event, node in events:
+    if event == pulldom.START_ELEMENT:
+      if depth is None:
+        if node.localName == 'cdml':
+          depth = level
+          yield node
+      elif level == depth + 1:
+        # builds the subtree and consumes the events up to the end of the element
+        events.expandNode( node)
+        yield node
+        continue
+      level += 1
+    elif event == pulldom.END_ELEMENT:
+      level -= 1
+      if depth is not None and level == depth:
+        # the rest of a CD-SVG document is of no interest
+        return
+
+
+def read_CDML_file( name):
+  """returns (cdml element, iterator over its children) for the file name,
+  (None, None) when there are no cdml data in it"""
+  f = open_CDML_file( name)
+  elements = _iterate_and_close( iterparse_CDML( f), f)
+  for cdml in elements:
+    return cdml, elements
+  return None, None
+
+
+def upgrade_element( element, version):
+  """transforms the top-level element of a document of CDML version to the current version,
+  returns the element"""
+  cdml = element.ownerDocument.createElement( 'cdml')
+  cdml.setAttribute( 'version', version)
+  cdml.appendChild( element)
+  CDML_versions.transform_dom_to_version( cdml, config.current_CDML_version)
+  cdml.removeChild( element)
+  return element
+
+
+def has_cdml_namespace( cdml):
+  """returns true if the cdml element is the root of the document or has the right namespace"""
+  return cdml.parentNode is cdml.ownerDocument or cdml.namespaceURI == data.cdml_namespace
+
+
+def _iterate_and_close( elements, f):
+  try:
+    for e in elements:
+      yield e
+  finally:
+    f.close()
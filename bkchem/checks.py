@@ -31,12 +31,12 @@ def check_linear_fragments(paper):
   """Check the state of linear fragments present on the paper.
 
   Also reset their appearance."""
-  #mols = paper.um.get_changed_molecules()
-  last_record = paper.um.get_last_record()
   for mol in paper.molecules:
     to_del = set()
     fs = [f for f in mol.fragments if f.type == "linear_form"]
-    if fs and (last_record is None or last_record.object_changed(mol)):
+    if fs and paper.um.object_changed(mol):
+      # the check may change the molecule
+      paper.mark_dirty( [mol])
       for f in fs:
         if mol.check_linear_form_fragment( f) == False:
           to_del.add( f)
@@ -26,11 +26,6 @@ from __future__ import generators
 
 import sys
 import xml.dom.minidom as dom
-try:
-  import tkinter.font as tkFont
-except ImportError:
-  import tkFont
-
 from math import atan2, sin, cos, pi, sqrt
 from warnings import warn
 
@@ -450,7 +445,7 @@ class plus(meta_enabled, interactive, point_drawable, with_font, area_colored, t
 
 
   def update_font( self):
-    self.font = tkFont.Font( family=self.font_family, size=self.font_size)
+    self.font = self.paper.create_font( family=self.font_family, size=self.font_size)
 
 
   def lift( self):
@@ -671,7 +666,7 @@ class text( meta_enabled, interactive, point_drawable, text_like, area_colored,
 
   def update_font( self):
     #if 'font_family' in self.__dict__ and 'font_size' in self.__dict__:
-    self.font = tkFont.Font( family=self.font_family, size=self.font_size)
+    self.font = self.paper.create_font( family=self.font_family, size=self.font_size)
 
 
   def scale_font( self, ratio):
@@ -127,6 +127,16 @@ def getChildrenNamed( element, name):
   return [o for o in element.childNodes if (not o.nodeValue) and (o.localName == name)]
 
 
+def getChildrenByName( element):
+  """returns a dictionary mapping local names to lists of child elements,
+  cheaper than repeated getChildrenNamed calls on elements with many children"""
+  ret = {}
+  for o in element.childNodes:
+    if not o.nodeValue:
+      ret.setdefault( o.localName, []).append( o)
+  return ret
+
+
 def isOnlyTags( text):
   """this function takes a !string! as an argument and returns true if text is only tags"""
   try:
@@ -165,3 +175,46 @@ def _atomicXPathSearch( element, path):
   else:
     return getChildrenNamed( element, path) #element.getElementsByTagName( path)
 
+
+
+
+class xml_stream_writer(object):
+  """Writes an XML document to a binary file part by part, formatted in the same
+  way as safe_indent formats the whole document. Only the parts written at once
+  have to exist as DOM trees:
+
+    out = xml_stream_writer( f)
+    out.start( root)      # only the start tag, children of root are ignored
+    out.write( element)   # whole element with its subtree
+    out.end()             # end tag of root
+  """
+
+  def __init__( self, file, step=2, dont_indent=("ftext","text")):
+    self.file = file
+    self.step = step
+    self.dont_indent = dont_indent
+    self._open = []
+    file.write( b'<?xml version="1.0" encoding="utf-8"?>')
+
+
+  def start( self, element):
+    self._write_indent()
+    tag = element.cloneNode( False).toxml( 'utf-8') # childless element gives <name .../>
+    self.file.write( tag[:-2] + b'>')
+    self._open.append( element.tagName)
+
+
+  def write( self, element):
+    self._write_indent()
+    safe_indent( element, level=len( self._open)*self.step, step=self.step, dont_indent=self.dont_indent)
+    self.file.write( element.toxml( 'utf-8'))
+
+
+  def end( self):
+    name = self._open.pop()
+    self.file.write( ("\n%s</%s>" % (len( self._open)*self.step*" ", name)).encode( 'utf-8'))
+
+
+  def _write_indent( self):
+    if self._open:
+      self.file.write( ("\n" + len( self._open)*self.step*" ").encode( 'utf-8'))
@@ -42,17 +42,12 @@ def export_CD_SVG(paper, filename, gzipped=0):
   except IOError as x:
     return 0
 
-  exporter = xml_writer.SVG_writer(paper)
-  exporter.construct_dom_tree(paper.top_levels)
-  doc = exporter.document
-  cdml = paper.get_package().childNodes[0]
-  doc.childNodes[0].appendChild(cdml)
-  dom_extensions.safe_indent(doc.childNodes[0],
-                             dont_indent=("text", "ftext", "user-data"))
-
-  s = doc.toxml('utf-8')
-  f.write(s)
-  f.close()
+  # the document is written one top level object at a time
+  try:
+    exporter = xml_writer.SVG_writer(paper)
+    exporter.write_xml_to_file(f, paper.top_levels, tail=paper.write_package)
+  finally:
+    f.close()
 
   return 1
 
@@ -71,13 +66,11 @@ def export_CDML(paper, filename, gzipped=0):
   except IOError as x:
     return 0
 
-  doc = paper.get_package()
-  dom_extensions.safe_indent(doc.childNodes[0],
-                             dont_indent=("text", "ftext", "user-data"))
-
-  s = doc.toxml('utf-8')
-  f.write(s)
-  f.close()
+  # the document is written one top level object at a time
+  try:
+    out = dom_extensions.xml_stream_writer(f, dont_indent=("text", "ftext", "user-data"))
+    paper.write_package(out)
+  finally:
+    f.close()
 
   return 1
-
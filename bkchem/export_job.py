@@ -0,0 +1,96 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Export of one paper to several files at once.
+
+The Cairo based exporters (PDF, PNG, SVG and PS) share one display list
+read from the paper only once, so each additional output costs only the
+drawing with Cairo. Other exporters are run as usual:
+
+  job = export_job( paper)
+  job.add( "mol.pdf")
+  job.add( "mol.png")
+  job.add( "mol-2x.png", format="PNG (Cairo)", scaling=(2, 2))
+  for name, error in job.run():
+    ...
+"""
+
+import os
+import traceback
+
+from singleton_store import Store
+
+
+
+class export_job(object):
+
+  def __init__( self, paper):
+    self.paper = paper
+    self.targets = []  # (filename, plugin, on_begin attrs)
+
+
+  def add( self, filename, format=None, scaling=None):
+    """adds filename to the outputs; format is the name of the export plugin,
+    by default the first one with the extension of filename; scaling (x, y)
+    is passed to the on_begin of the exporter, otherwise the exporter decides"""
+    plugin = format and Store.app.plugins.get( format) or get_plugin_for_file( filename)
+    if not plugin or not plugin.has_exporter:
+      raise ValueError( "no export plugin for '%s'" % (format or filename))
+    attrs = {}
+    if scaling:
+      attrs['scaling'] = scaling
+    self.targets.append( (filename, plugin, attrs))
+
+
+  def run( self):
+    """exports all the added files; returns the list of (filename, error message or None)"""
+    ret = []
+    display_list = None
+    for filename, plugin, attrs in self.targets:
+      try:
+        exporter = plugin.exporter( self.paper)
+        exporter.interactive = False
+        if not exporter.on_begin( **attrs):
+          ret.append( (filename, "export was canceled"))
+          continue
+        if hasattr( exporter, 'display_list'):
+          # on_begin unselects everything, so the paper is read after it
+          if display_list is None:
+            display_list = exporter.converter.get_display_list( self.paper)
+          exporter.display_list = display_list
+        exporter.write_to_file( filename)
+      except Exception:
+        ret.append( (filename, traceback.format_exc().strip().splitlines()[-1]))
+      else:
+        Store.log( _("exported file: ")+filename)
+        ret.append( (filename, None))
+    return ret
+
+
+
+def get_plugin_for_file( filename):
+  """returns the first export plugin of the application (Cairo ones preferred)
+  handling the extension of filename"""
+  ext = os.path.splitext( filename)[1].lower()
+  candidates = [Store.app.plugins[ name] for name in sorted( Store.app.plugins)]
+  candidates = [p for p in candidates if p.has_exporter and ext in p.extensions]
+  for p in candidates:
+    if "Cairo" in p.name:
+      return p
+  return candidates and candidates[0] or None
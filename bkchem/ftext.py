@@ -29,11 +29,6 @@ i - italic
 import sys
 import copy
 import xml.sax
-try:
-  import tkinter.font as tkFont
-except ImportError:
-  import tkFont
-
 import tuning
 import dom_extensions
 
@@ -53,19 +48,22 @@ class ftext(object):
     if font:
       self.font = font
     else:
-      self.font = tkFont.Font( family="Helvetica", size=12)
+      self.font = canvas.create_font( family="Helvetica", size=12)
     self._font_family = self.font.actual('family')
     self._font_size = int( self.font.actual('size'))
     self.pos = pos
     self.fill = fill
     self.justify = justify
+    self._item_pool = None
 
 
-  def draw( self):
+  def draw( self, item_pool=None):
+    """item_pool is an optional item_pool.item_pool with text items to reuse"""
     # split text to chunks
     chs = self.get_chunks()
     if not chs:
       return None
+    self._item_pool = item_pool
 
     self.items = []
     self._current_x = self.x
@@ -101,12 +99,17 @@ class ftext(object):
       x1, y1, x2, y2 = self.bbox()
       self.diff = x2 -x1 -self.font.measure( self.items[0].text[-1])/2.0 -2
     self.move( -self.diff, 0)
+    self._item_pool = None
     return self.bbox()
 
 
   def _draw_chunk( self, chunk, scale=1):
     weight = ''
     canvas = self.canvas
+    if self._item_pool:
+      canvas_create_text = lambda x, y, **kw: self._item_pool.create( 'text', (x, y), **kw)
+    else:
+      canvas_create_text = canvas.create_text
     x = self._current_x
     y = self._current_y
 
@@ -118,19 +121,19 @@ class ftext(object):
       weight = "normal"
 
     if 'sub' in chunk.attrs:
-      item = canvas.create_text( x+tuning.Tuning.Screen.pick_best_value("supsubscript_x_shift",self._font_size),
+      item = canvas_create_text( x+tuning.Tuning.Screen.pick_best_value("supsubscript_x_shift",self._font_size),
                                  y+tuning.Tuning.Screen.pick_best_value("subscript_y_shift",self._font_size),
                                  tags=self.tags, text=chunk.text,
                                  font=(self._font_family, int( round( self._font_size*scale)), weight),
                                  anchor="nw", justify=self.justify, fill=self.fill)
     elif 'sup' in chunk.attrs:
-      item = canvas.create_text( x+tuning.Tuning.Screen.pick_best_value("supsubscript_x_shift",self._font_size),
+      item = canvas_create_text( x+tuning.Tuning.Screen.pick_best_value("supsubscript_x_shift",self._font_size),
                                  y,
                                  tags=self.tags, text=chunk.text,
                                  font=(self._font_family, int( round( self._font_size*scale)), weight),
                                  anchor="sw", justify=self.justify, fill=self.fill)
     else:
-      item = canvas.create_text( x, y, tags=self.tags, text=chunk.text,
+      item = canvas_create_text( x, y, tags=self.tags, text=chunk.text,
                                  font=(self._font_family, int( round( self._font_size*scale)), weight),
                                  anchor="w",
                                  justify=self.justify,
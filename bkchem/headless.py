@@ -0,0 +1,263 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Application and paper that work without a Tk display.
+
+The headless_app provides the part of the BKChem application interface used
+in the batch mode (loading files, reading SMILES and InChI, running export
+plugins) on top of a headless_paper, which keeps its canvas items in memory.
+No Tk interpreter is created, so any number of processes may render at once:
+
+  import headless
+  app = headless.headless_app()
+  app.load_CDML( "molecule.svg")
+  app.plugin_export( "PNG (Cairo)", "molecule.png")
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+
+import os_support
+
+sys.path.insert( 1, os_support.get_module_path())
+
+import pref_manager
+from singleton_store import Store, Screen
+
+# the rest of BKChem expects the preference manager and the gettext functions
+# to be set up, bkchem.py does it on startup, we have to do it when used without it
+if not Store.pm:
+  Store.pm = pref_manager.pref_manager(
+    [os_support.get_config_filename( "prefs.xml", level="global", mode='r'),
+     os_support.get_config_filename( "prefs.xml", level="personal", mode='r')])
+
+if sys.version_info[0] > 2:
+  import builtins
+else:
+  import __builtin__ as builtins
+if '_' not in builtins.__dict__:
+  import gettext
+  builtins.__dict__['_'] = lambda m: m
+  builtins.__dict__['ngettext'] = gettext.ngettext
+
+
+import oasa
+import logger
+import plugins
+import molecule
+import oasa_bridge
+import cdml_reader
+import export_job
+import bulk_import
+
+from paper import chem_paper
+from id_manager import id_manager
+from temp_manager import template_manager
+from headless_canvas import headless_canvas, headless_font
+
+
+
+class headless_paper(headless_canvas, chem_paper):
+  """chem_paper drawing into the in-memory headless_canvas"""
+
+  def create_font(self, **kw):
+    return headless_font(**kw)
+
+
+
+class headless_app(object):
+  """Replacement of the BKChem application for the batch mode without Tk."""
+
+  in_batch_mode = 1
+  # plugins that need the Tk canvas (postscript of the canvas)
+  tk_only_plugins = ("PostScript (builtin)",)
+
+  def __init__( self):
+    Store.app = self
+    if not Screen.dpi:
+      Screen.dpi = headless_canvas.dpi
+    oasa.config.Config.molecule_class = molecule.molecule
+
+    self.mode = 'draw' # the same as in the batch mode of BKChem
+    self.save_dir = '.'
+    self._untitled_counter = 0
+
+    # the plugin modules are imported on first use
+    self.plugins = {}
+    for plugin in plugins.get_plugins():
+      if plugin.name not in self.tk_only_plugins:
+        self.plugins[ plugin.name] = plugin
+
+    self.papers = []
+    self.paper = None
+    self.add_new_paper()
+
+    self.init_singletons()
+
+
+  def init_singletons( self):
+    Store.logger = logger.logger()
+    Store.logger.handling = logger.batch_mode
+    Store.log = Store.logger.log
+
+    Store.id_manager = id_manager()
+
+    Store.tm = template_manager()
+    Store.tm.add_template_from_CDML( "templates.cdml")
+
+    Store.utm = template_manager()
+    [Store.utm.add_template_from_CDML( n) for n in os_support.get_local_templates()]
+
+    Store.gm = template_manager()
+    Store.gm.add_template_from_CDML( "groups.cdml")
+    Store.gm.add_template_from_CDML( "groups2.cdml")
+
+
+  def add_new_paper( self, name=''):
+    paper = headless_paper( file_name=self.get_name_dic( name))
+    self.papers.append( paper)
+    self.paper = paper
+    return True
+
+
+  def close_paper( self, paper=None):
+    p = paper or self.paper
+    self.papers.remove( p)
+    p.mrproper()
+    if p is self.paper:
+      self.paper = self.papers and self.papers[-1] or None
+    return 1
+
+
+  def get_name_dic( self, name=''):
+    if not name:
+      name = 'untitled%d.svg' % self._untitled_counter
+      self._untitled_counter += 1
+      return {'name': name, 'dir': self.save_dir, 'auto': 1, 'ord': 0}
+    d, name = os.path.split( name)
+    return {'name': name, 'dir': d or self.save_dir, 'auto': 0, 'ord': 0}
+
+
+  def update_status( self, signal, time=None):
+    pass
+
+
+  def request( self, type, **options):
+    return None
+
+
+  def load_CDML( self, file, replace=1):
+    """loads a CDML or CD-SVG file into the current paper, with replace=0
+    a new paper is created for it"""
+    doc, children = cdml_reader.read_CDML_file( file)
+    if not doc:
+      Store.log( _("cdml data are not present in SVG or are corrupted!"), message_type="error")
+      return 0
+    if not replace:
+      self.add_new_paper( name=file)
+    else:
+      self.paper.file_name = self.get_name_dic( file)
+    self.save_dir = os.path.dirname( file) or '.'
+    self.paper.clean_paper()
+    self.paper.read_package_stream( doc, children)
+    Store.log( _("loaded file: ")+self.paper.full_path)
+    return 1
+
+
+  def plugin_import( self, pl_id, filename):
+    plugin = self.plugins[ pl_id]
+    if plugin.importer.gives_molecule:
+      importer = plugin.importer( self.paper)
+    else:
+      importer = plugin.importer()
+    if not importer.on_begin():
+      return 0
+    if importer.gives_cdml:
+      doc = importer.get_cdml_dom( filename)
+      self.paper.clean_paper()
+      self.paper.read_package( doc)
+    else:
+      mols = importer.get_molecules( filename)
+      self.paper.clean_paper()
+      self.paper.create_background()
+      for m in mols:
+        self.paper.stack.append( m)
+        m.draw()
+      self.paper.add_bindings()
+      self.paper.start_new_undo_record()
+    Store.log( _("loaded file: ")+filename)
+    return 1
+
+
+  def plugin_export( self, pl_id, filename, interactive=False, on_begin_attrs=None):
+    plugin = self.plugins[ pl_id]
+    exporter = plugin.exporter( self.paper)
+    exporter.interactive = False
+    attrs = on_begin_attrs or {}
+    if not exporter.on_begin( **attrs):
+      return False
+    exporter.write_to_file( filename)
+    Store.log( _("exported file: ")+filename)
+    return True
+
+
+  def export_files( self, filenames):
+    """exports the paper to all filenames at once, the format is given by the extension;
+    returns the list of (filename, error message or None)"""
+    job = export_job.export_job( self.paper)
+    for name in filenames:
+      job.add( name)
+    return job.run()
+
+
+  def render_png_sizes( self, sizes, jobs=None):
+    """returns the paper as PNG images (bytes) with the longer side of each of sizes pixels"""
+    exporter = self.plugins["PNG (Cairo)"].exporter( self.paper)
+    return exporter.render_sizes( sizes, jobs=jobs)
+
+
+  def read_smiles( self, smiles):
+    mol = oasa_bridge.read_smiles( smiles, self.paper)
+    return self._add_molecule( mol)
+
+
+  def read_inchi( self, inchi):
+    mol = oasa_bridge.read_inchi( inchi, self.paper)
+    return self._add_molecule( mol)
+
+
+  def add_oasa_mol( self, mol):
+    """converts the oasa mol (with coordinates) and draws it on the paper"""
+    return self._add_molecule( oasa_bridge.oasa_mol_to_bkchem_mol( mol, self.paper))
+
+
+  def read_structures_file( self, name, jobs=None):
+    """reads all the SMILES and InChI strings from the file name, one per line;
+    returns (molecules, errors) as bulk_import.import_file"""
+    return bulk_import.import_file( self.paper, name, jobs=jobs)
+
+
+  def _add_molecule( self, mol):
+    self.paper.stack.append( mol)
+    mol.draw()
+    self.paper.add_bindings()
+    self.paper.start_new_undo_record()
+    return mol
@@ -0,0 +1,739 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""In-memory replacement of the Tk Canvas and Font used for rendering
+without a display (batch conversions, server side rendering).
+
+Only the part of the Canvas API used by the drawing code and the exporters
+is implemented. Item options are returned as strings, the same way Tk does it.
+"""
+
+from __future__ import division
+
+import re
+import math
+
+import misc
+
+
+
+# advance widths of the Helvetica font for characters 32-126 (in 1/1000 of em)
+_helvetica_widths = (
+  278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+  556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+  1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+  667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+  333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+  556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584)
+
+
+
+def parse_font_spec( spec):
+  """returns a dictionary of font options described by a Tk font specification,
+  that is either a sequence (family, size, styles) or its string form"""
+  if misc.myisstr( spec):
+    parts = [p.strip( "{}") for p in re.findall( r"\{[^}]*\}|\S+", spec)]
+  else:
+    parts = [p for p in spec]
+  ret = {}
+  if parts:
+    ret['family'] = parts[0]
+  if len( parts) > 1:
+    ret['size'] = int( float( parts[1]))
+  for style in " ".join( map( str, parts[2:])).split():
+    if style in ('normal', 'bold'):
+      ret['weight'] = style
+    elif style in ('roman', 'italic'):
+      ret['slant'] = style
+    elif style in ('underline', 'overstrike'):
+      ret[ style] = 1
+  return ret
+
+
+
+class headless_font(object):
+  """Replacement of tkFont.Font with metrics estimated from the widths of Helvetica."""
+
+  dpi = 96.0
+  bold_ratio = 1.07
+
+  def __init__( self, root=None, font=None, name=None, exists=False, **options):
+    self._options = {'family': 'helvetica', 'size': 12, 'weight': 'normal', 'slant': 'roman',
+                     'underline': 0, 'overstrike': 0}
+    if font:
+      self._options.update( parse_font_spec( font))
+    self._options.update( options)
+    self._options['size'] = int( self._options['size'])
+    self._measure_cache = {}
+
+
+  def actual( self, option=None, displayof=None):
+    if option:
+      return self._options[ option]
+    return dict( self._options)
+
+
+  def cget( self, option):
+    return self._options[ option]
+
+
+  def config( self, **options):
+    if not options:
+      return dict( self._options)
+    self._options.update( options)
+    self._measure_cache = {}
+
+  configure = config
+
+
+  def copy( self):
+    return headless_font( **self._options)
+
+
+  def _pixel_size( self):
+    size = self._options['size']
+    if size < 0:
+      return float( -size)
+    return size * self.dpi / 72.0
+
+
+  def measure( self, text, displayof=None):
+    if text in self._measure_cache:
+      return self._measure_cache[ text]
+    width = 0
+    for ch in text:
+      o = ord( ch)
+      if 32 <= o < 127:
+        width += _helvetica_widths[ o-32]
+      else:
+        width += 556
+    if self._options['weight'] == 'bold':
+      width *= self.bold_ratio
+    ret = int( round( width * self._pixel_size() / 1000.0))
+    self._measure_cache[ text] = ret
+    return ret
+
+
+  def metrics( self, *options, **kw):
+    size = self._pixel_size()
+    ascent = int( round( 0.931 * size))
+    descent = int( round( 0.225 * size))
+    ret = {'ascent': ascent, 'descent': descent, 'linespace': ascent + descent, 'fixed': 0}
+    if options:
+      return ret[ options[0]]
+    return ret
+
+
+
+class headless_event(object):
+  """Stand-in for the Tk event passed to handlers of generated events."""
+
+  def __init__( self, widget, **kw):
+    self.widget = widget
+    self.x = 0
+    self.y = 0
+    self.__dict__.update( kw)
+
+
+
+class headless_canvas_item(object):
+
+  __slots__ = ('type', 'coords', 'options', 'tags', 'z')
+
+  def __init__( self, type, coords, options, tags, z):
+    self.type = type
+    self.coords = coords
+    self.options = options
+    self.tags = tags
+    self.z = z
+
+
+
+class headless_canvas(object):
+  """Canvas keeping its items in memory.
+
+  It is meant to be mixed in before the Tk Canvas (see headless.headless_paper),
+  overriding all the methods that would otherwise talk to the Tk interpreter.
+  """
+
+  dpi = headless_font.dpi
+
+  _item_defaults = {
+    'line': {'fill': 'black', 'width': '1.0', 'arrow': 'none', 'arrowshape': '8 10 3',
+             'capstyle': 'butt', 'joinstyle': 'round', 'smooth': '0', 'splinesteps': '12',
+             'dash': ''},
+    'polygon': {'fill': 'black', 'outline': '', 'width': '1.0', 'joinstyle': 'round',
+                'smooth': '0', 'splinesteps': '12', 'dash': ''},
+    'rectangle': {'fill': '', 'outline': 'black', 'width': '1.0', 'dash': ''},
+    'oval': {'fill': '', 'outline': 'black', 'width': '1.0', 'dash': ''},
+    'arc': {'fill': '', 'outline': 'black', 'width': '1.0', 'dash': '', 'start': '0.0',
+            'extent': '90.0', 'style': 'pieslice'},
+    'text': {'fill': 'black', 'font': 'Helvetica 12', 'anchor': 'center', 'justify': 'left',
+             'text': '', 'width': '0', 'angle': '0.0'},
+    'image': {'anchor': 'center', 'image': ''},
+    'bitmap': {'anchor': 'center', 'bitmap': ''},
+    'window': {'anchor': 'center', 'window': '', 'width': '0', 'height': '0'},
+    }
+
+  _color_names = {
+    'black': (0,0,0), 'white': (255,255,255), 'red': (255,0,0), 'green': (0,255,0),
+    'blue': (0,0,255), 'yellow': (255,255,0), 'cyan': (0,255,255), 'magenta': (255,0,255),
+    'grey': (190,190,190), 'gray': (190,190,190), 'orange': (255,165,0), 'purple': (160,32,240),
+    'brown': (165,42,42), 'pink': (255,192,203), 'violet': (238,130,238), 'gold': (255,215,0),
+    'maroon': (176,48,96), 'navy': (0,0,128), 'darkgrey': (169,169,169), 'darkgray': (169,169,169),
+    'lightgrey': (211,211,211), 'lightgray': (211,211,211), 'darkred': (139,0,0),
+    'darkgreen': (0,100,0), 'darkblue': (0,0,139), 'darkorange': (255,140,0)}
+
+
+  def init_canvas( self, master, kw):
+    self.master = master
+    self._options = {'width': '640', 'height': '480', 'background': 'white'}
+    self._options.update( kw)
+    self._items = {}
+    self._tag_index = {}
+    self._top = 0
+    self._bottom = 0
+    self._last_item_id = 0
+    self._bindings = {}
+    self._tag_bindings = {}
+    self._fonts = {}
+    self._clipboard = ''
+
+
+  # widget configuration
+
+  def config( self, cnf=None, **kw):
+    if cnf:
+      kw.update( cnf)
+    if not kw:
+      return dict( (k, (k, '', '', '', v)) for k, v in self._options.items())
+    self._options.update( kw)
+
+  configure = config
+
+
+  def cget( self, key):
+    return _tcl_string( self._options.get( key, ''))
+
+  __getitem__ = cget
+
+
+  def __setitem__( self, key, value):
+    self.config( {key: value})
+
+
+  def keys( self):
+    return list( self._options.keys())
+
+
+  # item creation
+
+  def _create( self, type, args, kw):
+    args = list( args)
+    if args and isinstance( args[-1], dict):
+      kw.update( args.pop( -1))
+    tags = self._split_tags( kw.pop( 'tags', ()))
+    self._last_item_id += 1
+    self._top += 1
+    item = headless_canvas_item( type, self._to_coords( args), kw, tags, self._top)
+    self._items[ self._last_item_id] = item
+    for t in tags:
+      self._tag_index.setdefault( t, set()).add( self._last_item_id)
+    return self._last_item_id
+
+
+  def create_arc( self, *args, **kw):
+    return self._create( 'arc', args, kw)
+
+  def create_bitmap( self, *args, **kw):
+    return self._create( 'bitmap', args, kw)
+
+  def create_image( self, *args, **kw):
+    return self._create( 'image', args, kw)
+
+  def create_line( self, *args, **kw):
+    return self._create( 'line', args, kw)
+
+  def create_oval( self, *args, **kw):
+    return self._create( 'oval', args, kw)
+
+  def create_polygon( self, *args, **kw):
+    return self._create( 'polygon', args, kw)
+
+  def create_rectangle( self, *args, **kw):
+    return self._create( 'rectangle', args, kw)
+
+  def create_text( self, *args, **kw):
+    return self._create( 'text', args, kw)
+
+  def create_window( self, *args, **kw):
+    return self._create( 'window', args, kw)
+
+
+  # item search
+
+  def _find( self, tag_or_id):
+    """returns list of ids of items matching tag_or_id, not sorted"""
+    if isinstance( tag_or_id, int) or (misc.myisstr( tag_or_id) and tag_or_id.isdigit()):
+      i = int( tag_or_id)
+      return i in self._items and [i] or []
+    if tag_or_id == 'all':
+      return list( self._items.keys())
+    return list( self._tag_index.get( tag_or_id, ()))
+
+
+  def _sorted( self, ids):
+    return sorted( ids, key=lambda i: self._items[i].z)
+
+
+  def _first( self, tag_or_id):
+    ids = self._find( tag_or_id)
+    if not ids:
+      return None
+    if len( ids) == 1:
+      return self._items[ ids[0]]
+    return self._items[ self._sorted( ids)[0]]
+
+
+  def find_all( self):
+    return tuple( self._sorted( self._items.keys()))
+
+
+  def find_withtag( self, tag_or_id):
+    return tuple( self._sorted( self._find( tag_or_id)))
+
+
+  def find_overlapping( self, x1, y1, x2, y2):
+    ret = []
+    for i, item in self._items.items():
+      bbox = self._item_bbox( item)
+      if bbox and bbox[0] <= x2 and bbox[2] >= x1 and bbox[1] <= y2 and bbox[3] >= y1:
+        ret.append( i)
+    return tuple( self._sorted( ret))
+
+
+  def find_enclosed( self, x1, y1, x2, y2):
+    ret = []
+    for i, item in self._items.items():
+      bbox = self._item_bbox( item)
+      if bbox and bbox[0] > x1 and bbox[2] < x2 and bbox[1] > y1 and bbox[3] < y2:
+        ret.append( i)
+    return tuple( self._sorted( ret))
+
+
+  # tags
+
+  def _split_tags( self, tags):
+    if misc.myisstr( tags):
+      return tags.split()
+    return list( tags)
+
+
+  def gettags( self, tag_or_id):
+    item = self._first( tag_or_id)
+    return item and tuple( item.tags) or ()
+
+
+  def addtag_withtag( self, newtag, tag_or_id):
+    for i in self._find( tag_or_id):
+      item = self._items[ i]
+      if newtag not in item.tags:
+        item.tags.append( newtag)
+        self._tag_index.setdefault( newtag, set()).add( i)
+
+
+  def addtag_all( self, newtag):
+    self.addtag_withtag( newtag, 'all')
+
+
+  def dtag( self, tag_or_id, tag_to_delete=None):
+    if tag_to_delete is None:
+      tag_to_delete = tag_or_id
+    for i in self._find( tag_or_id):
+      item = self._items[ i]
+      if tag_to_delete in item.tags:
+        item.tags.remove( tag_to_delete)
+        self._tag_index[ tag_to_delete].discard( i)
+    if not self._tag_index.get( tag_to_delete, True):
+      del self._tag_index[ tag_to_delete]
+
+
+  # item manipulation
+
+  def type( self, tag_or_id):
+    item = self._first( tag_or_id)
+    return item and item.type or None
+
+
+  def coords( self, tag_or_id, *args):
+    item = self._first( tag_or_id)
+    if not item:
+      return []
+    if args:
+      item.coords = self._to_coords( args)
+    return list( item.coords)
+
+
+  def itemcget( self, tag_or_id, option):
+    item = self._first( tag_or_id)
+    return item and self._item_option( item, option) or ''
+
+
+  def _item_option( self, item, option):
+    if option == 'tags':
+      return " ".join( item.tags)
+    if option in item.options:
+      value = item.options[ option]
+      if option == 'width' and item.type != 'text':
+        return str( float( self.winfo_fpixels( value)))
+      return _tcl_string( value)
+    return self._item_defaults[ item.type].get( option, '')
+
+
+  def itemconfig( self, tag_or_id, cnf=None, **kw):
+    if misc.myisstr( cnf):
+      item = self._first( tag_or_id)
+      return item and (cnf, '', '', '', self.itemcget( tag_or_id, cnf)) or None
+    if cnf:
+      kw.update( cnf)
+    if not kw:
+      item = self._first( tag_or_id)
+      if not item:
+        return None
+      keys = set( self._item_defaults[ item.type].keys()) | set( item.options.keys()) | set( ['tags'])
+      return dict( (k, (k, '', '', '', self.itemcget( tag_or_id, k))) for k in keys)
+    tags = None
+    if 'tags' in kw:
+      tags = self._split_tags( kw.pop( 'tags'))
+    for i in self._find( tag_or_id):
+      item = self._items[ i]
+      item.options.update( kw)
+      if tags is not None:
+        for t in item.tags:
+          self._tag_index[ t].discard( i)
+        item.tags = list( tags)
+        for t in tags:
+          self._tag_index.setdefault( t, set()).add( i)
+
+  itemconfigure = itemconfig
+
+
+  def move( self, tag_or_id, dx, dy):
+    dx = float( dx)
+    dy = float( dy)
+    for i in self._find( tag_or_id):
+      item = self._items[ i]
+      item.coords = [c + (n % 2 and dy or dx) for n, c in enumerate( item.coords)]
+
+
+  def scale( self, tag_or_id, x0, y0, xs, ys):
+    x0, y0, xs, ys = map( float, (x0, y0, xs, ys))
+    for i in self._find( tag_or_id):
+      item = self._items[ i]
+      item.coords = [n % 2 and (y0 + (c-y0)*ys) or (x0 + (c-x0)*xs) for n, c in enumerate( item.coords)]
+
+
+  def delete( self, *args):
+    for tag_or_id in args:
+      for i in self._find( tag_or_id):
+        item = self._items.pop( i)
+        for t in item.tags:
+          self._tag_index[ t].discard( i)
+          if not self._tag_index[ t]:
+            del self._tag_index[ t]
+
+
+  def lift( self, tag_or_id, above_this=None):
+    ids = self._sorted( self._find( tag_or_id))
+    if above_this is None:
+      for i in ids:
+        self._top += 1
+        self._items[ i].z = self._top
+    else:
+      others = self._find( above_this)
+      if others:
+        z = max( self._items[ i].z for i in others)
+        self._restack( ids, z)
+
+  tag_raise = lift
+
+
+  def lower( self, tag_or_id, below_this=None):
+    ids = self._sorted( self._find( tag_or_id))
+    if below_this is None:
+      for i in reversed( ids):
+        self._bottom -= 1
+        self._items[ i].z = self._bottom
+    else:
+      others = self._find( below_this)
+      if others:
+        z = min( self._items[ i].z for i in others)
+        self._restack( ids, z, below=True)
+
+  tag_lower = lower
+
+
+  def _restack( self, ids, z, below=False):
+    """puts items with ids right above (or below) the item with stacking order z"""
+    moved = set( ids)
+    order = []
+    for i in self.find_all():
+      if i in moved:
+        continue
+      if below and self._items[ i].z == z:
+        order.extend( ids)
+      order.append( i)
+      if not below and self._items[ i].z == z:
+        order.extend( ids)
+    for n, i in enumerate( order):
+      self._items[ i].z = n
+    self._bottom = 0
+    self._top = len( order)
+
+
+  # geometry
+
+  def bbox( self, *args):
+    boxes = []
+    for tag_or_id in args:
+      for i in self._find( tag_or_id):
+        bbox = self._item_bbox( self._items[ i])
+        if bbox:
+          boxes.append( bbox)
+    if not boxes:
+      return None
+    return (min( b[0] for b in boxes), min( b[1] for b in boxes),
+            max( b[2] for b in boxes), max( b[3] for b in boxes))
+
+
+  def _item_bbox( self, item):
+    cs = item.coords
+    if not cs:
+      return None
+    if item.type == 'text':
+      return self._text_bbox( item)
+    xs = cs[0::2]
+    ys = cs[1::2]
+    pad = 0
+    if item.type == 'line' or self._item_option( item, 'outline'):
+      pad = float( self._item_option( item, 'width')) / 2
+    if item.type == 'line' and self._item_option( item, 'arrow') != 'none':
+      pad += float( self._item_option( item, 'arrowshape').split()[2])
+    return (int( math.floor( min( xs) - pad)), int( math.floor( min( ys) - pad)),
+            int( math.ceil( max( xs) + pad)), int( math.ceil( max( ys) + pad)))
+
+
+  def _text_bbox( self, item):
+    x, y = item.coords[:2]
+    font = self._get_font( item.options.get( 'font', self._item_defaults['text']['font']))
+    lines = _tcl_string( item.options.get( 'text', '')).split( "\n")
+    w = max( font.measure( l) for l in lines)
+    h = font.metrics( 'linespace') * len( lines)
+    anchor = item.options.get( 'anchor', 'center')
+    if anchor == 'center':
+      anchor = ''
+    if 'w' in anchor:
+      x1 = x
+    elif 'e' in anchor:
+      x1 = x - w
+    else:
+      x1 = x - w / 2
+    if 'n' in anchor:
+      y1 = y
+    elif 's' in anchor:
+      y1 = y - h
+    else:
+      y1 = y - h / 2
+    return (int( math.floor( x1)), int( math.floor( y1)),
+            int( math.ceil( x1 + w)), int( math.ceil( y1 + h)))
+
+
+  def _get_font( self, spec):
+    key = _tcl_string( spec)
+    if key not in self._fonts:
+      self._fonts[ key] = headless_font( font=spec)
+    return self._fonts[ key]
+
+
+  def _to_coords( self, args):
+    ret = []
+    for a in args:
+      if isinstance( a, (list, tuple)):
+        ret.extend( self._to_coords( a))
+      else:
+        ret.append( self.winfo_fpixels( a))
+    return ret
+
+
+  def canvasx( self, screenx, gridspacing=None):
+    return float( screenx)
+
+
+  def canvasy( self, screeny, gridspacing=None):
+    return float( screeny)
+
+
+  # window information
+
+  def winfo_fpixels( self, number):
+    value, unit = misc.split_number_and_unit( number)
+    if value is None:
+      raise ValueError( "bad screen distance \"%s\"" % number)
+    if unit == 'c':
+      return value * self.dpi / 2.54
+    elif unit == 'm':
+      return value * self.dpi / 25.4
+    elif unit == 'i':
+      return value * self.dpi
+    elif unit == 'p':
+      return value * self.dpi / 72.0
+    return value
+
+
+  def winfo_pixels( self, number):
+    return int( round( self.winfo_fpixels( number)))
+
+
+  def winfo_width( self):
+    return self.winfo_pixels( self._options['width'])
+
+
+  def winfo_height( self):
+    return self.winfo_pixels( self._options['height'])
+
+
+  def winfo_rgb( self, color):
+    name = color.lower().replace( " ", "")
+    if name.startswith( "#"):
+      digits = name[1:]
+      n = len( digits) // 3
+      if n not in (1,2,3,4) or len( digits) % 3:
+        raise ValueError( "unknown color name \"%s\"" % color)
+      rgb = [int( digits[i*n:(i+1)*n], 16) for i in range( 3)]
+      # Tk scales the values to 16 bits by repeating the digits
+      return tuple( int( (c * 0xffff) // (16**n - 1)) for c in rgb)
+    m = re.match( r"gr[ae]y(\d+)$", name)
+    if m and int( m.group(1)) <= 100:
+      v = int( round( int( m.group(1)) * 2.55))
+      rgb = (v, v, v)
+    elif name in self._color_names:
+      rgb = self._color_names[ name]
+    else:
+      raise ValueError( "unknown color name \"%s\"" % color)
+    return tuple( c * 257 for c in rgb)
+
+
+  # events
+
+  def bind( self, sequence=None, func=None, add=None):
+    if func:
+      if not add:
+        self._bindings[ sequence] = []
+      self._bindings.setdefault( sequence, []).append( func)
+      return str( id( func))
+    return ''
+
+
+  def unbind( self, sequence, funcid=None):
+    self._bindings.pop( sequence, None)
+
+
+  def tag_bind( self, tag_or_id, sequence=None, func=None, add=None):
+    if func:
+      self._tag_bindings[ (tag_or_id, sequence)] = func
+      return str( id( func))
+    return ''
+
+
+  def tag_unbind( self, tag_or_id, sequence, funcid=None):
+    self._tag_bindings.pop( (tag_or_id, sequence), None)
+
+
+  def event_generate( self, sequence, **kw):
+    for func in self._bindings.get( sequence, ()):
+      func( headless_event( self, **kw))
+
+
+  # the rest of the widget interface used by the paper
+
+  def focus_set( self):
+    pass
+
+  focus = focus_set
+
+
+  def bell( self, displayof=0):
+    pass
+
+
+  def update( self):
+    pass
+
+
+  def update_idletasks( self):
+    pass
+
+
+  def after_idle( self, func, *args):
+    """there is no event loop, idle is now"""
+    func( *args)
+    return None
+
+
+  def after_cancel( self, id):
+    pass
+
+
+  def xview( self, *args):
+    pass
+
+
+  def yview( self, *args):
+    pass
+
+
+  def clipboard_clear( self, **kw):
+    self._clipboard = ''
+
+
+  def clipboard_append( self, string, **kw):
+    self._clipboard += string
+
+
+  def destroy( self):
+    self.delete( 'all')
+
+
+
+def _tcl_string( value):
+  """converts a python value to the string Tk would give back for it"""
+  if misc.myisstr( value):
+    return value
+  if isinstance( value, (list, tuple)):
+    return " ".join( map( _tcl_element, value))
+  if isinstance( value, bool):
+    return value and '1' or '0'
+  return str( value)
+
+
+def _tcl_element( value):
+  s = _tcl_string( value)
+  if not s or re.search( r"\s", s):
+    return "{%s}" % s
+  return s
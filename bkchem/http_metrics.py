@@ -0,0 +1,125 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Metrics of the http server in the Prometheus text format.
+
+The server counts the requests per route and status and observes their
+latency, the render pool reports the time of the rendering phases. The
+statistics of the other parts (cache, pool) are added as samples when the
+metrics are formatted:
+
+  metrics.observe_request( "/smiles", "GET", 200, 0.012)
+  text = metrics.format( samples=[("bkchem_render_cache_entries", "gauge", "...", {}, 12)])
+"""
+
+import threading
+
+
+
+class histogram(object):
+
+  # upper bounds of the buckets in seconds
+  buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+  def __init__( self):
+    self.counts = [0] * len( self.buckets)
+    self.count = 0
+    self.sum = 0.0
+
+
+  def observe( self, value):
+    for i, bound in enumerate( self.buckets):
+      if value <= bound:
+        self.counts[ i] += 1
+        break
+    self.count += 1
+    self.sum += value
+
+
+  def get_lines( self, name, labels):
+    """returns the lines of the histogram in the Prometheus text format"""
+    ret = []
+    total = 0
+    for bound, count in zip( self.buckets, self.counts):
+      total += count
+      ret.append( "%s_bucket%s %d" % (name, format_labels( labels, le=repr( float( bound))), total))
+    ret.append( "%s_bucket%s %d" % (name, format_labels( labels, le="+Inf"), self.count))
+    ret.append( "%s_sum%s %r" % (name, format_labels( labels), self.sum))
+    ret.append( "%s_count%s %d" % (name, format_labels( labels), self.count))
+    return ret
+
+
+
+class metrics(object):
+
+  def __init__( self):
+    self._lock = threading.Lock()
+    self.requests = {}  # (route, method, status) -> count
+    self.latency = {}   # route -> histogram
+    self.phases = {}    # phase -> histogram
+
+
+  def observe_request( self, route, method, status, seconds):
+    with self._lock:
+      key = (route, method, status)
+      self.requests[ key] = self.requests.get( key, 0) + 1
+      self.latency.setdefault( route, histogram()).observe( seconds)
+
+
+  def observe_phases( self, timings):
+    """timings is a dict phase -> seconds of one rendering"""
+    with self._lock:
+      for phase, seconds in timings.items():
+        self.phases.setdefault( phase, histogram()).observe( seconds)
+
+
+  def format( self, samples=()):
+    """returns all the metrics in the Prometheus text format, samples are additional
+    metrics given as (name, type, help, labels, value)"""
+    lines = []
+    with self._lock:
+      lines.append( "# HELP bkchem_http_requests_total Number of http requests.")
+      lines.append( "# TYPE bkchem_http_requests_total counter")
+      for (route, method, status), count in sorted( self.requests.items()):
+        lines.append( "bkchem_http_requests_total%s %d" % (format_labels( {'route': route, 'method': method, 'status': status}), count))
+      lines.append( "# HELP bkchem_http_request_duration_seconds Time of handling of http requests.")
+      lines.append( "# TYPE bkchem_http_request_duration_seconds histogram")
+      for route, h in sorted( self.latency.items()):
+        lines.extend( h.get_lines( "bkchem_http_request_duration_seconds", {'route': route}))
+      lines.append( "# HELP bkchem_render_phase_duration_seconds Time of the phases of rendering in the workers.")
+      lines.append( "# TYPE bkchem_render_phase_duration_seconds histogram")
+      for phase, h in sorted( self.phases.items()):
+        lines.extend( h.get_lines( "bkchem_render_phase_duration_seconds", {'phase': phase}))
+    for name, type, help, labels, value in samples:
+      lines.append( "# HELP %s %s" % (name, help))
+      lines.append( "# TYPE %s %s" % (name, type))
+      lines.append( "%s%s %r" % (name, format_labels( labels), float( value)))
+    return "\n".join( lines) + "\n"
+
+
+
+def format_labels( labels, **more):
+  labels = dict( labels, **more)
+  if not labels:
+    return ""
+  return "{%s}" % ",".join( '%s="%s"' % (k, escape_label( labels[k])) for k in sorted( labels))
+
+
+def escape_label( value):
+  return str( value).replace( "\\", "\\\\").replace( "\n", "\\n").replace( '"', '\\"')
@@ -30,6 +30,7 @@ import BaseHTTPServer
 import xml.dom.minidom as dom
 
 import xml_writer
+import render_cache
 import xml_serializer
 
 from singleton_store import Store
@@ -79,33 +80,60 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
     self.send_header("Content-Type", "image/svg+xml")
     self.end_headers()
 
+    self.wfile.write( self._get_content_svg())
+
+
+  def _get_content_svg( self):
     exporter = xml_writer.SVG_writer( Store.app.paper)
     exporter.construct_dom_tree( Store.app.paper.top_levels)
-    self.wfile.write(exporter.document.toxml('utf-8'))
+    return exporter.document.toxml('utf-8')
 
 
   def servedir_smiles( self, path_list):
     if not len( path_list) == 1:
       self.return_error()
     else:
-      Store.app.paper.clean_paper()
-      Store.app.paper.create_background()
-      Store.app.read_smiles( path_list[0])
-      self.serve__content_svg()
+      self._serve_rendered( 'smiles', path_list[0], Store.app.read_smiles)
 
 
   def servedir_inchi( self, path_list):
-    Store.app.paper.clean_paper()
-    Store.app.paper.create_background()
-    Store.app.read_inchi( '/'.join( path_list))
-    self.serve__content_svg()
+    self._serve_rendered( 'inchi', '/'.join( path_list), Store.app.read_inchi)
 
 
   def servedir_gtml( self, path_list):
-    Store.app.paper.clean_paper()
-    Store.app.paper.create_background()
-    Store.app.plugin_import( 'GTML', '/'.join( path_list))
-    self.serve__content_svg()
+    self._serve_rendered( 'gtml', '/'.join( path_list), lambda name: Store.app.plugin_import( 'GTML', name))
+
+
+  def _serve_rendered( self, kind, data, read):
+    """serves the SVG of the structure read from data by the read function,
+    the result is taken from the cache when possible"""
+    cache = self.server.render_cache
+    if kind == 'gtml':
+      # the file on the server can change, it is not cached
+      key = None
+    else:
+      key = cache.make_key( kind, data, format='svg',
+                            standard=cache.get_standard_fingerprint( Store.app.paper.standard))
+    etag = '"%s"' % key
+    if key and etag in self.headers.get( 'If-None-Match', ''):
+      self.send_response( 304)
+      self.send_header( "ETag", etag)
+      self.end_headers()
+      return
+    svg = key and cache.get( key)
+    if not svg:
+      Store.app.paper.clean_paper()
+      Store.app.paper.create_background()
+      read( data)
+      svg = self._get_content_svg()
+      if key:
+        cache.put( key, svg)
+    self.send_response( 200)
+    self.send_header("Content-Type", "image/svg+xml")
+    if key:
+      self.send_header("ETag", etag)
+    self.end_headers()
+    self.wfile.write( svg)
 
 
   def return_error( self):
@@ -134,4 +162,5 @@ class bkchem_http_server( BaseHTTPServer.HTTPServer):
 
   def __init__( self, *args):
     BaseHTTPServer.HTTPServer.__init__( self, *args)
+    self.render_cache = render_cache.render_cache()
 
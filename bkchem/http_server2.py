@@ -19,19 +19,54 @@
 
 """Here is the http server that server data from application on demand.
 
+Requests are handled in threads. The stateless rendering requests (/smiles,
+/inchi, /gtml) are passed to a pool of worker processes with their own papers
+and their results are cached, the rest works with the paper of the application
+and is serialized by a lock.
+
+POST /batch renders many structures in one request. The body is JSON:
+
+  {"format": "svg" or "png", "size": longer side of PNG images in pixels (optional),
+   "items": [{"kind": "smiles", "inchi" or "molfile", "data": "...", "name": "..."}, ...]}
+
+an item can also be just a SMILES or InChI string. The response is a zip
+archive with one image per successfully rendered item and index.json listing
+the name and either the file or the error message of every item.
+
+GET /metrics returns the metrics of the server in the Prometheus text
+format. When the server is given an access log, every request is written
+there as one line of JSON.
 """
 
 from __future__ import print_function
 
+import io
+import sys
+import json
 import time
-import string
 import os.path
-import urlparse
-import BaseHTTPServer
+import zipfile
+import threading
+import multiprocessing
 import xml.dom.minidom as dom
-
+try:
+  import BaseHTTPServer
+  import SocketServer
+  import urlparse
+  from urllib import unquote
+except ImportError:
+  import http.server as BaseHTTPServer
+  import socketserver as SocketServer
+  import urllib.parse as urlparse
+  from urllib.parse import unquote
+
+import misc
 import xml_writer
 import oasa_bridge
+import bulk_import
+import render_pool
+import http_metrics
+import render_cache
 import xml_serializer
 
 from singleton_store import Store
@@ -42,6 +77,22 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
   dirs = ('smiles','inchi','gtml','images')
 
+  # gtml is read from a file on the server that can change, it is not cached
+  cached_kinds = ('smiles','inchi','molfile')
+  # the kinds of input accepted by /batch (gtml is read from a file on the server)
+  batch_kinds = ('smiles','inchi','molfile')
+  batch_formats = ('svg','png')
+  max_batch_items = 1000
+  # the longer side of a PNG image and the sum of the (square) areas of the PNG images of a batch
+  max_image_size = 4096
+  max_batch_pixels = 64*1000*1000
+  max_body_size = 16*1024*1024
+
+  # keep-alive connections, every response must have Content-Length
+  protocol_version = "HTTP/1.1"
+  # idle keep-alive connections are closed after this time (in seconds)
+  timeout = 30
+
   def __init__( self, *args):
     BaseHTTPServer.BaseHTTPRequestHandler.__init__( self, *args)
 
@@ -52,8 +103,8 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
     if len( path_list) == 1 or path_list[0] not in self.dirs:
       # these are static pages
-      path = string.replace( path, ".", "_")
-      path = string.replace( path, "/", "__")
+      path = path.replace( ".", "_")
+      path = path.replace( "/", "__")
       method = 'serve' + path
 
       if method in self.__class__.__dict__:
@@ -66,32 +117,20 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
 
   def serve__content_xml( self):
-    t = time.time()
-    self.send_response( 200)
-    self.send_header("Content-Type", "text/xml")
-    self.end_headers()
-
     doc = dom.Document()
-    xml_serializer.serialize( Store.app.paper, doc, doc)
-    self.wfile.write(doc.toxml('utf-8'))
-    print("%.2f ms" % (1000*(time.time() - t)))
+    with self.server.app_lock:
+      xml_serializer.serialize( Store.app.paper, doc, doc)
+    self._send( doc.toxml('utf-8'), "text/xml")
 
 
   def serve__content_svg( self):
-    self.send_response( 200)
-    self.send_header("Content-Type", "image/svg+xml")
-    self.end_headers()
-
-    exporter = xml_writer.SVG_writer( Store.app.paper)
-    exporter.construct_dom_tree( Store.app.paper.top_levels)
-    self.wfile.write(exporter.document.toxml('utf-8'))
+    with self.server.app_lock:
+      exporter = xml_writer.SVG_writer( Store.app.paper)
+      exporter.construct_dom_tree( Store.app.paper.top_levels)
+    self._send( exporter.document.toxml('utf-8'), "image/svg+xml")
 
 
   def serve__content_html( self):
-    self.send_response( 200)
-    self.send_header("Content-Type", "text/html")
-    self.end_headers()
-
     result = '''
     <html>
     <head>
@@ -135,36 +174,80 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
     </body>
     </html>
     ''' % {'smiles': self._get_all_smiles()}
-    self.wfile.write( result)
+    self._send( result.encode( 'utf-8'), "text/html")
 
 
   def serve__content_png( self):
-    Store.app.plugin_export( "PNG (Cairo)", filename="http_temp.png", interactive=False)
-    self._serve_file( "http_temp.png", "image/png")
+    with self.server.app_lock:
+      Store.app.plugin_export( "PNG (Cairo)", filename="http_temp.png", interactive=False)
+      self._serve_file( "http_temp.png", "image/png")
 
 
   def servedir_smiles( self, path_list):
     if not len( path_list) == 1:
       self.return_error()
     else:
-      Store.app.paper.clean_paper()
-      Store.app.paper.create_background()
-      Store.app.read_smiles( path_list[0])
-      self.serve__content_svg()
+      self._serve_rendered( 'smiles', path_list[0])
 
 
   def servedir_inchi( self, path_list):
-    Store.app.paper.clean_paper()
-    Store.app.paper.create_background()
-    Store.app.read_inchi( '/'.join( path_list))
-    self.serve__content_svg()
+    self._serve_rendered( 'inchi', '/'.join( path_list))
 
 
   def servedir_gtml( self, path_list):
-    Store.app.paper.clean_paper()
-    Store.app.paper.create_background()
-    Store.app.plugin_import( 'GTML', '/'.join( path_list))
-    self.serve__content_svg()
+    self._serve_rendered( 'gtml', '/'.join( path_list))
+
+
+  def _serve_rendered( self, kind, data):
+    """renders the structure in the worker pool and serves it as SVG"""
+    data = unquote( data)
+    cache = self.server.render_cache
+    # the workers render with the standard of the application, the same one is in the key
+    standard = Store.app.paper.standard
+    if kind not in self.cached_kinds:
+      key = None
+    else:
+      key = self._make_key( kind, data, standard, format='svg')
+    etag = '"%s"' % key
+    if key and etag in self.headers.get( 'If-None-Match', ''):
+      self.send_response( 304)
+      self.send_header( "ETag", etag)
+      self.end_headers()
+      return
+    svg = key and cache.get( key)
+    if svg:
+      self._send( svg, "image/svg+xml", headers={'ETag': etag})
+      return
+    try:
+      svg = self.server.render_pool.render( kind, data, timings=self._timings, standard=standard)
+    except render_pool.pool_busy_error:
+      self._send( b"<html><body><h1>Service unavailable</h1><p>The server is overloaded, try again later</p></body></html>",
+                  status=503, headers={'Retry-After': '1'})
+    except multiprocessing.TimeoutError:
+      self._send( b"<html><body><h1>Gateway timeout</h1><p>The rendering took too long</p></body></html>", status=504)
+    except render_pool.render_error as e:
+      self._send( ("<html><body><h1>Bad request</h1><p>%s</p></body></html>" % e).encode( 'utf-8'), status=400)
+    else:
+      if key:
+        cache.put( key, svg)
+        self._send( svg, "image/svg+xml", headers={'ETag': etag})
+      else:
+        self._send( svg, "image/svg+xml")
+
+
+  def _make_key( self, kind, data, standard, **options):
+    """returns the cache key of the structure rendered with the drawing standard"""
+    options['standard'] = self.server.render_cache.get_standard_fingerprint( standard)
+    return self.server.render_cache.make_key( kind, data, **options)
+
+
+  def serve__cache_xml( self):
+    stats = self.server.render_cache.get_stats()
+    self._serve_xml( "<cache %s/>" % " ".join( '%s="%s"' % (k, stats[k]) for k in sorted( stats)))
+
+
+  def serve__metrics( self):
+    self._send( self.server.format_metrics().encode( 'utf-8'), "text/plain; version=0.0.4")
 
 
   def servedir_images( self, path_list):
@@ -176,11 +259,7 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
 
   def return_error( self):
-    self.send_response( 400)
-    self.send_header("Content-Type", "text/html")
-    self.end_headers()
-
-    self.wfile.write("<html><body><h1>Bad request</h1><p>This address does not exist</p></body></html>")
+    self._send( b"<html><body><h1>Bad request</h1><p>This address does not exist</p></body></html>", status=400)
 
 
   def do_GET( self):
@@ -190,17 +269,124 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
       if "action" in attrs:
         method = "_action_"+attrs['action']
         if hasattr( self, method):
-          getattr( self, method)( attrs)
-          smiles = self._get_all_smiles()
+          with self.server.app_lock:
+            getattr( self, method)( attrs)
+            smiles = self._get_all_smiles()
           #smiles = "SMILES not available"
           self._serve_xml( "<smiles>%s</smiles>" % smiles)
-
+        else:
+          self.return_error()
       else:
         self.serve__content_html()
     else:
       self.do_GET_fallback()
 
 
+  def do_POST( self):
+    protocol, address, path, parameters, query, fragment = urlparse.urlparse( self.path)
+    if self.headers.get( 'Content-Length') is None:
+      self.close_connection = True
+      self._send( b"<html><body><h1>Length required</h1></body></html>", status=411)
+      return
+    try:
+      length = int( self.headers.get( 'Content-Length'))
+      if length < 0:
+        raise ValueError( length)
+    except ValueError:
+      # the body can not be read, the connection can not be used any more
+      self.close_connection = True
+      self._send( b"<html><body><h1>Bad request</h1><p>Invalid Content-Length</p></body></html>", status=400)
+      return
+    if length > self.max_body_size:
+      self.close_connection = True
+      self._send( b"<html><body><h1>Request too large</h1></body></html>", status=413)
+      return
+    body = self.rfile.read( length)
+    if path == "/batch":
+      self.serve_batch( body)
+    else:
+      self.return_error()
+
+
+  def serve_batch( self, body):
+    try:
+      format, size, items = self._parse_batch( body)
+    except ValueError as e:
+      self._send( ("<html><body><h1>Bad request</h1><p>%s</p></body></html>" % e).encode( 'utf-8'), status=400)
+      return
+
+    # only the structures not in the cache are rendered
+    cache = self.server.render_cache
+    options = {'format': format}
+    if size:
+      options['size'] = size
+    standard = Store.app.paper.standard
+    keys = [self._make_key( kind, data, standard, **options) for name, kind, data in items]
+    results = [cache.get( key) for key in keys]
+    missing = [i for i, r in enumerate( results) if r is None]
+    try:
+      rendered = self.server.render_pool.render_batch( [items[i][1:] for i in missing], format=format, size=size,
+                                                       timings=self._timings, standard=standard)
+    except render_pool.pool_busy_error:
+      self._send( b"<html><body><h1>Service unavailable</h1><p>The server is overloaded, try again later</p></body></html>",
+                  status=503, headers={'Retry-After': '1'})
+      return
+    results = [(True, r) for r in results]
+    for i, (ok, result) in zip( missing, rendered):
+      results[ i] = (ok, result)
+      if ok:
+        cache.put( keys[ i], result)
+
+    f = io.BytesIO()
+    archive = zipfile.ZipFile( f, 'w', format == 'png' and zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED)
+    index = []
+    for i, ((name, kind, data), (ok, result)) in enumerate( zip( items, results)):
+      entry = {'index': i, 'name': name}
+      if ok:
+        entry['file'] = "%04d.%s" % (i, format)
+        archive.writestr( entry['file'], result)
+      else:
+        entry['error'] = result
+      index.append( entry)
+    archive.writestr( "index.json", json.dumps( index, indent=1))
+    archive.close()
+    self._send( f.getvalue(), "application/zip")
+
+
+  def _parse_batch( self, body):
+    """returns (format, size, list of (name, kind, data)) from the JSON body of /batch,
+    raises ValueError when the request is not valid"""
+    try:
+      request = json.loads( body.decode( 'utf-8'))
+    except (ValueError, UnicodeDecodeError):
+      raise ValueError( "the body is not valid JSON")
+    if not isinstance( request, dict) or not isinstance( request.get( 'items'), list):
+      raise ValueError( "the list of items is missing")
+    format = request.get( 'format', 'svg')
+    if format not in self.batch_formats:
+      raise ValueError( "unknown format '%s'" % format)
+    size = request.get( 'size')
+    if size is not None and (isinstance( size, bool) or not isinstance( size, int) or
+                             not 0 < size <= self.max_image_size):
+      raise ValueError( "size must be a number of pixels up to %d" % self.max_image_size)
+    if len( request['items']) > self.max_batch_items:
+      raise ValueError( "at most %d items can be rendered at once" % self.max_batch_items)
+    if format == 'png' and size and len( request['items']) * size * size > self.max_batch_pixels:
+      raise ValueError( "at most %d items of size %d can be rendered at once" % (self.max_batch_pixels // (size * size), size))
+    items = []
+    for i, item in enumerate( request['items']):
+      if not isinstance( item, dict):
+        item = {'data': item}
+      data = item.get( 'data')
+      if not data or not misc.myisstr( data):
+        raise ValueError( "item %d has no data" % i)
+      kind = item.get( 'kind') or bulk_import.get_kind( data)
+      if kind not in self.batch_kinds:
+        raise ValueError( "item %d has unknown kind '%s'" % (i, kind))
+      items.append( (item.get( 'name', str( i)), kind, data))
+    return format, size, items
+
+
   def _action_click( self, attrs):
     x = float( attrs['x'])-8
     y = float( attrs['y'])-9
@@ -238,21 +424,24 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
 
   def _serve_xml( self, text):
-    self.send_response( 200)
-    self.send_header("Content-Type", "text/xml")
-    self.end_headers()
-
-    self.wfile.write( text)
+    self._send( text.encode( 'utf-8'), "text/xml")
 
 
   def _serve_file( self, filename, content_type="image/png"):
-    self.send_response( 200)
-    self.send_header("Content-Type", content_type)
-    self.end_headers()
+    with open( filename, "rb") as f:
+      self._send( f.read(), content_type)
 
-    f = file( filename, "rb")
-    self.wfile.write( f.read())
-    f.close()
+
+  def _send( self, body, content_type="text/html", status=200, headers=None):
+    self._bytes = len( body)
+    self.send_response( status)
+    self.send_header( "Content-Type", content_type)
+    self.send_header( "Content-Length", str( len( body)))
+    for k, v in (headers or {}).items():
+      self.send_header( k, v)
+    self.end_headers()
+    if self.command != 'HEAD':
+      self.wfile.write( body)
 
 
   def _get_attrs( self, query):
@@ -267,30 +456,125 @@ class bkchem_http_handler( BaseHTTPServer.BaseHTTPRequestHandler):
 
   def _get_all_smiles( self):
     sms = []
-    for m in Store.app.paper.molecules:
-      sms.append( oasa_bridge.mol_to_smiles( m))
+    with self.server.app_lock:
+      for m in Store.app.paper.molecules:
+        sms.append( oasa_bridge.mol_to_smiles( m))
     smiles = ", ".join( sms)
     return smiles
 
 
-  # LOGGING
-  def log_request( self, *args):
-    pass
+  def _get_route( self):
+    """returns the path of the request reduced to the route it is handled by"""
+    path = urlparse.urlparse( self.path)[2]
+    path_list = list(filter(None, path.split("/")))
+    if not path_list:
+      return "/"
+    if len( path_list) > 1 and path_list[0] in self.dirs:
+      return "/" + path_list[0]
+    if path == "/batch" or 'serve' + path.replace( ".", "_").replace( "/", "__") in self.__class__.__dict__:
+      return path
+    return "other"
 
 
-  def log_message( self, *args):
-    pass
+  # LOGGING
+  def parse_request( self):
+    self._start = time.time()
+    self._status = None
+    self._bytes = 0
+    self._timings = {}
+    return BaseHTTPServer.BaseHTTPRequestHandler.parse_request( self)
+
+
+  def handle_one_request( self):
+    self._start = None
+    BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request( self)
+    if self._start is not None and self._status is not None:
+      duration = time.time() - self._start
+      route = self._get_route()
+      self.server.metrics.observe_request( route, self.command, self._status, duration)
+      self.server.write_access_log( {'time': time.strftime( "%Y-%m-%dT%H:%M:%SZ", time.gmtime( self._start)),
+                                     'client': self.client_address[0],
+                                     'method': self.command,
+                                     'path': self.path,
+                                     'route': route,
+                                     'status': self._status,
+                                     'bytes': self._bytes,
+                                     'duration_ms': round( 1000*duration, 3),
+                                     'phases_ms': dict( (k, round( 1000*v, 3)) for k, v in self._timings.items())})
+
+
+  def log_request( self, code='-', size='-'):
+    # called by send_response
+    self._status = int( code)
 
 
-  def log_error( self, *args):
+  def log_message( self, *args):
     pass
 
 
-
-class bkchem_http_server( BaseHTTPServer.HTTPServer):
-
-  def __init__( self, *args):
-    BaseHTTPServer.HTTPServer.__init__( self, *args)
+  def log_error( self, format, *args):
+    self.server.write_access_log( {'time': time.strftime( "%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                                   'client': self.client_address[0],
+                                   'error': format % args})
+
+
+
+class bkchem_http_server( SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+  daemon_threads = True
+
+  def __init__( self, server_address, handler_class, workers=None, max_queue=None,
+                cache_size=32*1024*1024, cache_dir=None, access_log=None):
+    """access_log is a file where the requests are logged"""
+    BaseHTTPServer.HTTPServer.__init__( self, server_address, handler_class)
+    # the paper of the application is not thread safe
+    self.app_lock = threading.RLock()
+    self.metrics = http_metrics.metrics()
+    self.render_pool = render_pool.render_pool( workers=workers, max_queue=max_queue,
+                                                observer=self.metrics.observe_phases)
+    self.render_cache = render_cache.render_cache( max_size=cache_size, directory=cache_dir)
+    self.access_log = access_log
+    self._log_lock = threading.Lock()
+
+
+  def write_access_log( self, record):
+    if self.access_log:
+      line = json.dumps( record, sort_keys=True)
+      with self._log_lock:
+        self.access_log.write( line + "\n")
+        self.access_log.flush()
+
+
+  def format_metrics( self):
+    """returns the metrics of the server in the Prometheus text format"""
+    samples = []
+    cache = self.render_cache.get_stats()
+    samples.append( ("bkchem_render_cache_hits_total", "counter", "Renderings served from the memory cache.", {}, cache['hits']))
+    samples.append( ("bkchem_render_cache_disk_hits_total", "counter", "Renderings served from the disk cache.", {}, cache['disk_hits']))
+    samples.append( ("bkchem_render_cache_misses_total", "counter", "Renderings not found in the cache.", {}, cache['misses']))
+    samples.append( ("bkchem_render_cache_hit_ratio", "gauge", "Part of renderings served from the cache.", {}, cache['hit_rate']))
+    samples.append( ("bkchem_render_cache_entries", "gauge", "Number of renderings in the memory cache.", {}, cache['entries']))
+    samples.append( ("bkchem_render_cache_size_bytes", "gauge", "Size of the memory cache.", {}, cache['size']))
+    pool = self.render_pool.get_stats()
+    samples.append( ("bkchem_render_workers", "gauge", "Number of rendering processes.", {}, pool['workers']))
+    samples.append( ("bkchem_render_queue_depth", "gauge", "Rendering jobs waiting for a worker.", {}, pool['queued']))
+    samples.append( ("bkchem_render_jobs_running", "gauge", "Rendering jobs being processed.", {}, pool['running']))
+    samples.append( ("bkchem_render_jobs_total", "counter", "Finished rendering jobs.", {}, pool['jobs']))
+    samples.append( ("bkchem_render_refused_total", "counter", "Requests refused because the queue was full.", {}, pool['refused']))
+    samples.append( ("bkchem_render_busy_seconds_total", "counter", "Time the workers spent rendering.", {}, pool['busy_time']))
+    samples.append( ("bkchem_render_worker_utilization", "gauge", "Part of the time the workers were rendering.", {}, pool['utilization']))
+    paper = Store.app and Store.app.paper
+    if paper is not None and hasattr( paper, 'redraw_scheduler'):
+      redraws = paper.redraw_scheduler.get_stats()
+      samples.append( ("bkchem_paper_redraws_requested_total", "counter", "Redraws requested on the paper.", {}, redraws['requested']))
+      samples.append( ("bkchem_paper_redraws_performed_total", "counter", "Redraws performed on the paper.", {}, redraws['performed']))
+      samples.append( ("bkchem_paper_redraws_pending", "gauge", "Redraws waiting on the paper.", {}, redraws['pending']))
+    return self.metrics.format( samples=samples)
+
+
+  def server_close( self):
+    BaseHTTPServer.HTTPServer.server_close( self)
+    self.render_pool.close()
 
 
 
@@ -300,3 +584,48 @@ class Event(object):
     self.x = x
     self.y = y
 
+
+
+
+def main( args):
+  """runs the server without the GUI"""
+  import optparse
+  import headless
+  parser = optparse.OptionParser( usage="%prog [options]")
+  parser.add_option( "-p", "--port", dest="port", type="int", default=8008)
+  parser.add_option( "-w", "--workers", dest="workers", type="int", default=0,
+                     help="number of rendering processes (default is the number of CPUs)")
+  parser.add_option( "-q", "--max-queue", dest="max_queue", type="int", default=None,
+                     help="number of requests waiting for a worker before new ones are refused")
+  parser.add_option( "-c", "--cache-size", dest="cache_size", type="int", default=32,
+                     help="size of the in-memory cache of rendered structures in MB")
+  parser.add_option( "-d", "--cache-dir", dest="cache_dir", default=None,
+                     help="directory where the rendered structures are cached on disk")
+  parser.add_option( "-l", "--access-log", dest="access_log", default=None,
+                     help="file where the requests are logged as lines of JSON, - for stderr")
+  opts, rest = parser.parse_args( args)
+
+  if opts.access_log == "-":
+    access_log = sys.stderr
+  elif opts.access_log:
+    access_log = open( opts.access_log, "a")
+  else:
+    access_log = None
+
+  headless.headless_app()
+  httpd = bkchem_http_server( ('', opts.port), bkchem_http_handler,
+                              workers=opts.workers or None, max_queue=opts.max_queue,
+                              cache_size=opts.cache_size*1024*1024, cache_dir=opts.cache_dir,
+                              access_log=access_log)
+  try:
+    httpd.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  httpd.server_close()
+  if access_log and access_log is not sys.stderr:
+    access_log.close()
+
+
+
+if __name__ == '__main__':
+  main( sys.argv[1:])
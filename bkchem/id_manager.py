@@ -17,21 +17,35 @@
 
 #--------------------------------------------------------------------------
 
-from random import randint
+"""Registry of ids of all the objects of the application.
+
+"""
+
 from warnings import warn
 
 
 
 class id_manager(object):
+  """Bidirectional mapping between ids and objects.
 
+  Both directions are kept in dictionaries so that all the lookups
+  take constant time. The reverse index is keyed by id() of the object
+  because some of the registered objects are not hashable.
+  """
   def __init__(self):
     self.id_map = {}
+    self._object_map = {}
+    self._counters = {}
 
 
   def register_id(self, obj, Id):
     if self.is_registered_object(obj):
       raise ValueError("Object is already registered " + str(obj))
+    if Id in self.id_map:
+      # the object registered under this id is replaced
+      del self._object_map[id(self.id_map[Id])]
     self.id_map[Id] = obj
+    self._object_map[id(obj)] = Id
 
 
   def unregister_id(self, Id, obj):
@@ -39,6 +53,7 @@ class id_manager(object):
       if self.id_map[Id] != obj:
         raise ValueError("Id and object do not correspond")
       del self.id_map[Id]
+      del self._object_map[id(obj)]
     except KeyError:
       raise ValueError("Id %s is not registered" % Id)
 
@@ -52,9 +67,17 @@ class id_manager(object):
 
 
   def generate_id(self, prefix='id'):
+    """Returns an unused id made of prefix and a number.
+
+    The numbers for each prefix are allocated sequentially, ids that are
+    already taken (for instance read from a file) are skipped.
+    """
+    i = self._counters.get(prefix, 0)
     while True:
-      Id = prefix + str(randint(1, 100000))
+      i += 1
+      Id = prefix + str(i)
       if Id not in self.id_map:
+        self._counters[prefix] = i
         return Id
 
 
@@ -65,16 +88,12 @@ class id_manager(object):
 
 
   def is_registered_object(self, obj):
-    return (obj in self.id_map.values())
+    return id(obj) in self._object_map
 
 
   def get_id_of_object(self, obj):
-    for k, v in self.id_map.items():
-      if v == obj:
-        return k
-    return None
+    return self._object_map.get(id(obj), None)
 
 
   def unregister_object(self, obj):
     self.unregister_id(self.get_id_of_object(obj), obj)
-
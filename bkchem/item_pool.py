@@ -0,0 +1,78 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Pool of canvas items left from the previous drawing of an object.
+
+Redraw of an object takes its old items into a pool and draws the object
+again, asking the pool instead of the canvas for new items. An item of the
+right type is then only moved and reconfigured in place instead of being
+deleted and created again. Items not used by the new drawing are deleted:
+
+  pool = item_pool( paper, old_items)
+  item = pool.create( 'line', (x1, y1, x2, y2), fill='black')
+  ...
+  pool.delete()
+"""
+
+import collections
+
+
+
+class item_pool(object):
+
+  # options reset on reused items when not given explicitly so that they look
+  # the same as newly created items
+  defaults = {'line': {'width': 1, 'capstyle': 'butt', 'joinstyle': 'round', 'smooth': 0, 'arrow': 'none'},
+              'polygon': {'width': 1, 'outline': '', 'joinstyle': 'round', 'smooth': 0},
+              'rectangle': {'width': 1, 'fill': '', 'outline': 'black'},
+              'oval': {'width': 1, 'fill': '', 'outline': 'black'},
+              'text': {'anchor': 'center', 'justify': 'left'},
+              }
+
+  def __init__( self, canvas, items):
+    self.canvas = canvas
+    self.reused = 0
+    self._items = collections.OrderedDict()  # type -> list of items
+    for i in items:
+      if i:
+        self._items.setdefault( canvas.type( i), []).append( i)
+
+
+  def create( self, type, coords, **kw):
+    """returns an item of type placed at coords and configured according to kw,
+    the same as canvas.create_<type>( coords, **kw) would"""
+    items = self._items.get( type)
+    if not items:
+      return getattr( self.canvas, "create_"+type)( coords, **kw)
+    item = items.pop( 0)
+    self.canvas.coords( item, tuple( coords))
+    options = dict( self.defaults.get( type, {}))
+    options['tags'] = ()
+    options.update( kw)
+    self.canvas.itemconfig( item, **options)
+    self.reused += 1
+    return item
+
+
+  def delete( self):
+    """deletes the items that were not reused"""
+    for items in self._items.values():
+      for i in items:
+        self.canvas.delete( i)
+    self._items.clear()
@@ -28,7 +28,6 @@ import oasa
 import string
 import warnings
 import collections
-import xml.dom.minidom as dom
 
 try:
   from tkinter import *
@@ -40,7 +39,6 @@ except ImportError:
   import tkMessageBox
 
 import Pmw
-import data
 import misc
 import modes
 import config
@@ -54,9 +52,11 @@ import molecule
 import os_support
 import interactors
 import oasa_bridge
-import dom_extensions
+import cdml_reader
+import bulk_import
 import non_xml_writer
 import import_checker
+import startup_profile
 import plugins.plugin
 
 from paper import chem_paper
@@ -92,6 +92,7 @@ class BKChem( Tk):
   def initialize( self):
     self.in_batch_mode = 0
     self.init_basics()
+    startup_profile.mark( "initialize: basics")
 
     # main drawing part
     self.papers = []
@@ -99,18 +100,22 @@ class BKChem( Tk):
                                   raisecommand=self.change_paper,
                                   borderwidth=config.border_width)
     self.add_new_paper()
+    startup_profile.mark( "initialize: paper")
 
     # template and group managers
     self.init_singletons()
+    startup_profile.mark( "initialize: templates and plugins")
 
     # menu initialization
     self.init_menu()
     self.init_plugins_menu()
+    startup_profile.mark( "initialize: menus")
 
     # modes initialization
     self.init_modes()
     self.mode = 'draw' # this is normaly not a string but it makes things easier on startup
     self.init_mode_buttons()
+    startup_profile.mark( "initialize: modes")
 
     # edit pool
     self.editPool = editPool( self.main_frame, width=60)
@@ -247,6 +252,7 @@ class BKChem( Tk):
       ( _("Chemistry"), 'separator'),
       ( _("Chemistry"), 'command', _('Read SMILES'), None, _("Read a SMILES string and convert it to structure"), self.read_smiles, None),
       ( _("Chemistry"), 'command', _('Read InChI'), None, _("Read an InChI string and convert it to structure"), self.read_inchi, None),
+      ( _("Chemistry"), 'command', _('Read SMILES and InChI from file'), None, _("Read many SMILES or InChI strings from a file, one per line, and lay out the structures on the paper"), self.read_structures_file, None),
       ( _("Chemistry"), 'separator'),
       ( _("Chemistry"), 'command', _('Generate SMILES'), None, _("Generate SMILES for the selected structure"), self.gen_smiles, 'selected_mols'),
       ( _("Chemistry"), 'command', _('Generate InChI'), None, _("Generate an InChI for the selected structure by calling the InChI program"), self.gen_inchi,
@@ -368,17 +374,10 @@ class BKChem( Tk):
     self.main_frame.rowconfigure( 4, weight=1)
     self.main_frame.columnconfigure( 0, weight=1)
 
+    # the plugin modules are imported on first use
     self.plugins = {}
-    if plugins.__all__:
-      for name in plugins.__all__:
-        plugin = plugins.__dict__[ name]
-        self.plugins[ plugin.name] = plugin
-
-        # support for tuning of piddle
-        if plugin.name.endswith( "(Piddle)"):
-          from plugins import tk2piddle
-          import tuning
-          tk2piddle.tk2piddle.text_x_shift = tuning.Tuning.Piddle.text_x_shift
+    for plugin in plugins.get_plugins():
+      self.plugins[ plugin.name] = plugin
 
     self.paper = None
 
@@ -388,16 +387,14 @@ class BKChem( Tk):
     names = sorted(self.plugins.keys())
     for name in names:
       plugin = self.plugins[ name]
-      local_name = hasattr( plugin, "local_name") and getattr( plugin, "local_name") or plugin.name
-      if ('importer' in  plugin.__dict__) and plugin.importer:
-        doc_string = hasattr( plugin.importer, "doc_string") and getattr( plugin.importer, "doc_string") or plugin.importer.__doc__
+      local_name = plugin.local_name or plugin.name
+      if plugin.has_importer:
         self.menu.addmenuitem( _("Import"), 'command', label=local_name,
-                               statusHelp=doc_string,
+                               statusHelp=plugin.importer_doc,
                                command=misc.lazy_apply( self.plugin_import, (plugin.name,)))
-      if ('exporter' in plugin.__dict__) and plugin.exporter:
-        doc_string = hasattr( plugin.exporter, "doc_string") and getattr( plugin.exporter, "doc_string") or plugin.exporter.__doc__
+      if plugin.has_exporter:
         self.menu.addmenuitem( _("Export"), 'command', label=local_name,
-                               statusHelp=doc_string,
+                               statusHelp=plugin.exporter_doc,
                                command=misc.lazy_apply( self.plugin_export, (plugin.name,)))
 
 
@@ -839,73 +836,43 @@ class BKChem( Tk):
   def _load_CDML_file( self, a, draw=True):
     if a != '':
       self.save_dir, save_file = os.path.split( a)
-      ## try if the file is gzipped
-      # try to open the file
+      ## the file is read in a streaming way, gzipped files are recognized automatically
       try:
-        import gzip
-        inp = gzip.open( a, "rb")
+        doc, children = cdml_reader.read_CDML_file( a)
       except IOError:
         # can't read the file
         Store.log( _("cannot open file ") + a)
         return None
-      # is it a gzip file?
-      it_is_gzip = 1
-      try:
-        s = inp.read()
-      except IOError:
-        # not a gzip file
-        it_is_gzip = 0
-      # if it's gzip file parse it
-      if it_is_gzip:
-        try:
-          doc = dom.parseString(s)
-        except:
-          Store.log( _("error reading file"))
-          inp.close()
-          return None
-        inp.close()
-        del gzip
-        doc = [n for n in doc.childNodes if n.nodeType == doc.ELEMENT_NODE][0]
-      else:
-      ## otherwise it should be normal xml file
-        ## try to parse it
-        try:
-          doc = dom.parse( a)
-        except IndexError:
-          Store.log( _("error reading file"))
+      except Exception:
+        Store.log( _("error reading file"))
+        return None
+      if not doc:
+        ## sorry but there is no cdml in the svg file
+        Store.log(_("cdml data are not present in SVG or are corrupted!"))
+        return None
+      ## check if the CDML data in CD-SVG have the right namespace
+      if not cdml_reader.has_cdml_namespace( doc):
+        # ask if we should proceed with incorrect namespace
+        proceed = tkMessageBox.askokcancel(_("Proceed?"),
+                                           _("CDML data seem present in SVG but have wrong namespace. Proceed?"),
+                                           default='ok',
+                                           parent=self)
+        if not proceed:
+          Store.log(_("file not loaded"))
           return None
-        ## if it works check if its CDML of CD-SVG file
-        doc = [n for n in doc.childNodes if n.nodeType == doc.ELEMENT_NODE][0]
-      ## check if its CD-SVG or CDML
-      if doc.nodeName != 'cdml':
-        ## first try if there is the right namespace
-        if hasattr( doc, 'getElementsByTagNameNS'):
-          docs = doc.getElementsByTagNameNS( data.cdml_namespace, 'cdml')
-        else:
-          Store.log( _("File was not loaded"), message_type="error")
-          return None  # I don't know why this happens, but we simply ignore the document
-        if docs:
-          doc = docs[0]
-        else:
-          # if not, try it without it
-          docs = doc.getElementsByTagName( 'cdml')
-          if docs:
-            # ask if we should proceed with incorrect namespace
-            proceed = tkMessageBox.askokcancel(_("Proceed?"),
-                                               _("CDML data seem present in SVG but have wrong namespace. Proceed?"),
-                                               default='ok',
-                                               parent=self)
-            if proceed:
-              doc = docs[0]
-            else:
-              Store.log(_("file not loaded"))
-              return None
-          else:
-            ## sorry but there is no cdml in the svg file
-            Store.log(_("cdml data are not present in SVG or are corrupted!"))
-            return None
       self.paper.clean_paper()
-      self.paper.read_package( doc, draw=draw)
+      try:
+        self.paper.read_package_stream( doc, children, draw=draw)
+      except Exception:
+        # the file is broken somewhere after the part already read
+        try:
+          self.paper.onread_id_sandbox_finish()
+        except AttributeError:
+          # the reading failed after the id sandbox was closed
+          pass
+        self.paper.clean_paper()
+        Store.log( _("error reading file"))
+        return None
       if not misc.myisstr(self.mode):
         self.mode.startup()
       Store.log( _("loaded file: ")+self.paper.full_path)
@@ -929,11 +896,10 @@ class BKChem( Tk):
         e.__traceback__ = x
         raise e
       exporter = SVG_writer( self.paper)
-      exporter.construct_dom_tree( self.paper.top_levels)
-      dom_extensions.safe_indent( exporter.document.childNodes[0])
-      s = exporter.document.toxml('utf-8')
-      inp.write(s)
-      inp.close()
+      try:
+        exporter.write_xml_to_file( inp, self.paper.top_levels, dont_indent=("ftext","text"))
+      finally:
+        inp.close()
       Store.log( _("exported to SVG file: ")+svg_file)
 
 
@@ -999,7 +965,7 @@ class BKChem( Tk):
         if tkMessageBox.askokcancel( _("Forget changes?"),_("Forget changes in currently visiting file?"), default='ok', parent=self) == 0:
           return 0
       types = []
-      if 'extensions' in plugin.__dict__ and plugin.extensions:
+      if plugin.extensions:
         for e in plugin.extensions:
           types.append( (plugin.name+" "+_("file"), e))
       types.append( (_("All files"),"*"))
@@ -1063,7 +1029,7 @@ class BKChem( Tk):
     if not filename:
       file_name = self.paper.get_base_name()
       types = []
-      if 'extensions' in plugin.__dict__ and plugin.extensions:
+      if plugin.extensions:
         file_name += plugin.extensions[0]
         for e in plugin.extensions:
           types.append( (plugin.name+" "+_("file"), e))
@@ -1219,6 +1185,27 @@ Enter InChI:""")
       self.paper.start_new_undo_record()
 
 
+  def read_structures_file( self, name=None):
+    """reads all the SMILES and InChI strings from a file, one per line"""
+    if not oasa_bridge.oasa_available:
+      return
+    if not name:
+      name = askopenfilename( defaultextension = "",
+                              initialdir = self.save_dir,
+                              title = _("Read SMILES and InChI from file"),
+                              parent = self,
+                              filetypes=((_("SMILES and InChI files"), (".smi", ".smiles", ".inchi", ".txt")),
+                                         (_("All files"),"*")))
+      if not name:
+        return
+    mols, errors = bulk_import.import_file( self.paper, name)
+    Store.log( _("%d structures were read from %s") % (len( mols), name))
+    if errors:
+      tkMessageBox.showwarning( _("Error processing %s") % name,
+                                _("%d structures could not be read, the first error was:\n\n%s") % (len( errors), errors[0][1]))
+    return mols
+
+
   def gen_smiles(self):
     if not oasa_bridge.oasa_available:
       return
@@ -26,11 +26,6 @@ from __future__ import division
 import math
 import warnings
 import xml.dom.minidom as dom
-try:
-  import tkinter.font as tkFont
-except ImportError:
-  import tkFont
-
 from oasa import geometry
 from oasa import transform
 
@@ -512,7 +507,7 @@ class text_mark( mark):
   def get_svg_element( self, doc):
     e = doc.createElement( 'g')
     x, y = self.x, self.y
-    font = tkFont.Font( family=self.atom.font_family, size=self.size)
+    font = self.paper.create_font( family=self.atom.font_family, size=self.size)
     dx = font.measure( self.text) / 2
     y += font.metrics('descent')
 
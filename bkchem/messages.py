@@ -122,5 +122,10 @@ options:
  -H DIR          overrides the BKChem home dir
                  (where standard drawing setting, user-defined templates etc. are stored.)
  -b SCRIPT       start BKChem in batch mode, run SCRIPT and exit
+ -c FILES        convert FILES (or directories) without the GUI using
+                 a pool of processes, run 'bkchem -c --help' for options
  -v, --version   show program version and exit
+ --profile-startup
+                 print the time spent importing modules and initializing
+                 the application (also set by BKCHEM_PROFILE_STARTUP)
 """)
@@ -52,6 +52,7 @@ import messages
 import interactors
 import external_data
 import dom_extensions
+import bulk_transform
 import special_parents
 import helper_graphics as hg
 
@@ -474,6 +475,7 @@ class edit_mode(basic_mode):
         self._end_of_empty_drag( self._startx, self._starty, event.x, event.y)
         Store.app.paper.delete( self._selection_rect)
       elif self._dragging == 1:
+        Store.app.paper.redraw_scheduler.flush()
         # repositioning of atoms and double bonds
         atoms = [j for i in [o.neighbors for o in Store.app.paper.selected
                                              if (isinstance(o, oasa.graph.vertex) and
@@ -484,11 +486,13 @@ class edit_mode(basic_mode):
         [o.redraw() for o in atoms]
         [self.reposition_bonds_around_atom( o) for o in atoms]
         [self.reposition_bonds_around_bond( o) for o in self._bonds_to_update]
+        # only the moved top levels (and those changed by handle_overlap) could change
+        dirty = Store.app.paper.selected_to_unique_top_levels()[0] + [a.molecule for a in atoms]
         Store.app.paper.handle_overlap()
-        Store.app.paper.start_new_undo_record()
+        Store.app.paper.start_new_undo_record( dirty=dirty)
       elif self._dragging == 2:
         Store.app.paper.handle_overlap()
-        Store.app.paper.start_new_undo_record()
+        Store.app.paper.start_new_undo_record( dirty=[self._dragged_molecule])
       elif self._dragging == 4:
         if self.focused:
           # the unfocus will otherwise not happen and cursor won't be restored
@@ -596,8 +600,9 @@ class edit_mode(basic_mode):
       [o.move( dx, dy) for o in Store.app.paper.selected]
       if self._moving_selected_arrow:
         self._moving_selected_arrow.move( dx, dy)
-      [o.redraw() for o in self._bonds_to_update]
-      [o.redraw() for o in self._arrows_to_update]
+      # redrawn once when Tk gets idle, not for every motion event
+      [Store.app.paper.redraw_scheduler.schedule( o) for o in self._bonds_to_update]
+      [Store.app.paper.redraw_scheduler.schedule( o) for o in self._arrows_to_update]
       self._startx, self._starty = event.x, event.y
     elif self._dragging == 2:
       self._dragged_molecule.move( dx, dy)
@@ -726,7 +731,9 @@ class edit_mode(basic_mode):
     if Store.app.paper.um.get_last_record_name() == "arrow-key-move":
       Store.app.paper.um.delete_last_record()
     Store.app.paper.add_bindings()
-    Store.app.paper.start_new_undo_record( name="arrow-key-move")
+    # only the moved objects need to be recorded
+    dirty = Store.app.paper.selected + list( _bonds_to_update) + _arrows_to_update
+    Store.app.paper.start_new_undo_record( name="arrow-key-move", dirty=dirty)
 
 
   def _expand_groups( self):
@@ -1377,9 +1384,7 @@ class rotate_mode( edit_mode):
           sig = abs(dx1) > abs(dy1) and misc.signum(dx1) or misc.signum(dy1)
           angle = round( sig * math.sqrt(dx1**2 +dy1**2) / 50.0, 3)
           t = geometry.create_transformation_to_rotate_around_particular_axis( self._fixed.atom2.get_xyz(), self._fixed.atom1.get_xyz(), angle)
-          for a in self._rotated_atoms:
-            x, y, z = a.x, a.y, a.z
-            x, y, z = t.transform_xyz( x, y, z)
+          for a, (x, y, z) in zip( self._rotated_atoms, bulk_transform.transform_atoms( t, self._rotated_atoms)):
             a.move_to( x, y)
             a.z = z
           for a in self._rotated_mol.bonds:
@@ -1392,9 +1397,7 @@ class rotate_mode( edit_mode):
           tr.set_move( -self._centerx, -self._centery, 0)
           tr.set_rotation( -angle2, angle1, 0)
           tr.set_move( self._centerx, self._centery, 0)
-          for a in self._rotated_mol.atoms:
-            x, y, z = a.x, a.y, a.z
-            x, y, z = tr.transform_xyz( x, y, z)
+          for a, (x, y, z) in zip( self._rotated_mol.atoms, bulk_transform.transform_atoms( tr, self._rotated_mol.atoms)):
             a.move_to( x, y)
             a.z = z
           for a in self._rotated_mol.bonds:
@@ -1806,7 +1809,7 @@ class mark_mode( edit_mode):
 
     if Store.app.paper.um.get_last_record_name() == "arrow-key-move":
       Store.app.paper.um.delete_last_record()
-    Store.app.paper.start_new_undo_record( name="arrow-key-move")
+    Store.app.paper.start_new_undo_record( name="arrow-key-move", dirty=to_move)
 
 
   def startup( self):
@@ -33,6 +33,9 @@ from oasa import periodic_table as PT
 from math import atan2, sin, cos, pi, sqrt
 
 import misc
+import ring_index
+import spatial_index
+import bulk_transform
 import dom_extensions
 import bkchem_exceptions
 import groups_table as GT
@@ -81,6 +84,7 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
     self.t_atom = None
     self.display_form = ''  # this is a (html like) text that defines how to present the molecule in linear form
     self.fragments = set()
+    self._ring_index = None
     if package:
       self.read_package( package)
 
@@ -330,12 +334,13 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
     self.name = package.getAttribute( 'name')
     if package.getAttribute( 'id'):
       self.id = package.getAttribute( 'id')
+    children = dom_extensions.getChildrenByName( package)
     for name, cls in {'atom': atom, 'group': group, 'text': textatom, 'query': queryatom}.items():
-      for a in dom_extensions.simpleXPathSearch( package, name):
+      for a in children.get( name, []):
         self.insert_atom( cls( standard=std, package=a, molecule=self))
 
     self._id_map = [a.id for a in self.atoms]
-    for b in dom_extensions.simpleXPathSearch( package, 'bond'):
+    for b in children.get( 'bond', []):
       bnd = bond( standard=std, package=b, molecule=self)
       self.add_edge( bnd.atom1, bnd.atom2, bnd)
     # template related attributes
@@ -354,7 +359,7 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
       self.display_form = ''.join( [e.toxml('utf-8') for e in df.childNodes])
 
     # fragments
-    for fel in dom_extensions.simpleXPathSearch( package, "fragment"):
+    for fel in children.get( 'fragment', []):
       f = fragment()
       try:
         f.read_package( fel)
@@ -363,7 +368,7 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
       else:
         self.fragments.add( f)
 
-    ud = dom_extensions.getChildrenNamed( package, "user-data")
+    ud = children.get( 'user-data')
     if ud:
       self.user_data = [u.cloneNode( True) for u in ud]
 
@@ -425,21 +430,28 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
   def handle_overlap( self):
     "deletes one of overlaping atoms and updates the bonds"
     to_delete = []
+    to_delete_set = set()
     bonds_to_check = set() # this can speedup the following for b in bonds_to_check by factor of 10 for big mols
-    for i in range( len( self.atoms)):
-      for j in range( i+1, len( self.atoms)):
-        a = self.atoms[i]
-        b = self.atoms[j]
-        if (abs( a.x-b.x) < 4) and (abs( a.y-b.y) <4):
-          if a not in to_delete:
-            for e,v in b.get_neighbor_edge_pairs():
-              e.change_atoms( b, a)
-              a.add_neighbor( v, e)
-              v.add_neighbor( a, e)
-              bonds_to_check.add( e)
-            to_delete.append( b)
-    deleted = misc.filter_unique( to_delete)
-    [self.delete_atom( o) for o in deleted]
+    index = spatial_index.grid_index( cell_size=4, objects=self.atoms)
+    order = dict( (a, i) for i, a in enumerate( self.atoms))
+    for i, a in enumerate( self.atoms):
+      if a in to_delete_set:
+        continue
+      near = [b for b in index.find_near( a.x, a.y, 4) if order[b] > i and b not in to_delete_set]
+      near.sort( key=order.get)
+      for b in near:
+        for e,v in b.get_neighbor_edge_pairs():
+          e.change_atoms( b, a)
+          a.add_neighbor( v, e)
+          v.add_neighbor( a, e)
+          bonds_to_check.add( e)
+        to_delete.append( b)
+        to_delete_set.add( b)
+    deleted = to_delete
+    if deleted:
+      # removing the atoms one by one with delete_atom would be quadratic
+      self.vertices[:] = [v for v in self.vertices if v not in to_delete_set]
+      [o.delete() for o in deleted]
     # after all is done, find and delete orphan bonds and update the others
     to_redraw = []
     bonds = set( self.bonds)
@@ -582,10 +594,20 @@ class molecule( container, top_level, id_enabled, oasa.molecule, with_paper):
                                 self.atoms.index(b.atom2)))
 
 
+  def get_ring_index( self):
+    """returns ring_index of the smallest independent cycles, it is rebuilt only when
+    oasa recomputes the cycles, which happens after change of topology"""
+    cycles = self.get_smallest_independent_cycles_dangerous_and_cached()
+    if not self._ring_index or self._ring_index.cycles is not cycles:
+      self._ring_index = ring_index.ring_index( cycles)
+    return self._ring_index
+
+
   def transform( self, tr):
     """applies given transformation to its children"""
-    for a in self.atoms:
-      a.transform( tr)
+    # the coordinates of all atoms are transformed at once
+    for a, xyz in zip( self.atoms, bulk_transform.transform_atoms( tr, self.atoms)):
+      a.transform_to( tr, *xyz)
     for b in self.bonds:
       b.transform( tr)
 
@@ -18,6 +18,7 @@
 #--------------------------------------------------------------------------
 
 import math
+import weakref
 
 oasa_available = 1
 try:
@@ -36,12 +37,26 @@ from singleton_store import Screen
 
 
 def read_smiles( text, paper):
+  return oasa_mol_to_bkchem_mol( smiles_to_oasa_mol( text), paper)
+
+
+def smiles_to_oasa_mol( text, calc_coords=True):
   mol = oasa.smiles.text_to_mol( text)
+  if calc_coords:
+    calculate_coords( mol)
+  return mol
+
+
+def calculate_coords( mol):
+  """computes the 2D coordinates of the oasa mol"""
   oasa.coords_generator.calculate_coords( mol, bond_length=1.0, force=1)
-  return oasa_mol_to_bkchem_mol( mol, paper)
 
 
 def mol_to_smiles( mol):
+  return _get_cached( mol, 'smiles', lambda: _mol_to_smiles( mol))
+
+
+def _mol_to_smiles( mol):
   m = bkchem_mol_to_oasa_mol( mol)
   m.remove_unimportant_hydrogens()
   c = oasa.smiles.converter()
@@ -50,13 +65,21 @@ def mol_to_smiles( mol):
 
 
 def read_inchi( text, paper):
-  mol = oasa.inchi.text_to_mol( text, calc_coords=1, include_hydrogens=False)
-  #oasa.coords_generator.calculate_coords( mol, bond_length=1.0, force=1)
-  m = oasa_mol_to_bkchem_mol( mol, paper)
+  m = oasa_mol_to_bkchem_mol( inchi_to_oasa_mol( text), paper)
   return m
 
 
+def inchi_to_oasa_mol( text, calc_coords=True):
+  mol = oasa.inchi.text_to_mol( text, calc_coords=calc_coords and 1 or 0, include_hydrogens=False)
+  #oasa.coords_generator.calculate_coords( mol, bond_length=1.0, force=1)
+  return mol
+
+
 def mol_to_inchi( mol, program):
+  return _get_cached( mol, ('inchi', program), lambda: _mol_to_inchi( mol, program))
+
+
+def _mol_to_inchi( mol, program):
   m = bkchem_mol_to_oasa_mol( mol)
   # we do not use mol_to_text because generate_inchi_and_inchikey returns extra warning messages
   _inchi, _key, _warnings = oasa.inchi.generate_inchi_and_inchikey( m, program=program, fixed_hs=False)
@@ -92,9 +115,11 @@ def oasa_mol_to_bkchem_mol( mol, paper):
   miny = None
   maxy = None
   # atoms
+  atom_map = {}
   for a in mol.vertices:
     a2 = oasa_atom_to_bkchem_atom( a, paper, m)
     m.insert_atom( a2)
+    atom_map[ a] = a2
     if calc_position:
       # data for rescaling
       if not maxx or a2.x > maxx:
@@ -110,15 +135,14 @@ def oasa_mol_to_bkchem_mol( mol, paper):
   for b in mol.edges:
     b2 = oasa_bond_to_bkchem_bond( b, paper)
     aa1, aa2 = b.vertices
-    atom1 = m.atoms[ mol.vertices.index( aa1)]
-    atom2 = m.atoms[ mol.vertices.index( aa2)]
-    m.add_edge( atom1, atom2, b2)
+    m.add_edge( atom_map[ aa1], atom_map[ aa2], b2)
     b2.molecule = m
     if calc_position:
       bond_lengths.append( math.sqrt( (b2.atom1.x-b2.atom2.x)**2 + (b2.atom1.y-b2.atom2.y)**2))
   # rescale
   if calc_position:
-    bl = sum( bond_lengths) / len( bond_lengths)
+    # the coordinates generated by oasa use bond length 1.0
+    bl = bond_lengths and sum( bond_lengths) / len( bond_lengths) or 1.0
     scale = Screen.any_to_px( paper.standard.bond_length) / bl
     movex = (maxx+minx)/2
     movey = (maxy+miny)/2
@@ -157,13 +181,14 @@ def oasa_bond_to_bkchem_bond( b, paper):
 # BKCHEM -> OASA
 def bkchem_mol_to_oasa_mol( mol):
   m = oasa.molecule()
+  atom_map = {}
   for a in mol.atoms:
-    m.add_vertex( bkchem_atom_to_oasa_atom( a))
+    atom_map[ a] = m.add_vertex( bkchem_atom_to_oasa_atom( a))
   for b in mol.bonds:
     b2 = bkchem_bond_to_oasa_bond( b)
     aa1, aa2 = b.atoms
-    v1 = m.vertices[ mol.atoms.index( aa1)]
-    v2 = m.vertices[ mol.atoms.index( aa2)]
+    v1 = atom_map[ aa1]
+    v2 = atom_map[ aa2]
     b2.vertices = (v1, v2)
     m.add_edge( v1, v2, b2)
   return m
@@ -189,6 +214,70 @@ def bkchem_bond_to_oasa_bond( b):
   return ret
 
 
+# ==================================================
+# OASA -> PLAIN DATA -> OASA
+# used to pass molecules between processes
+
+def oasa_mol_to_data( mol):
+  """returns (atoms, bonds) describing mol by tuples of plain values"""
+  index = dict( (a, i) for i, a in enumerate( mol.vertices))
+  atoms = [(a.symbol, a.x, a.y, a.z, a.charge, a.isotope, a.valency, a.multiplicity,
+            a.properties_.get( 'inchi_number', None))
+           for a in mol.vertices]
+  bonds = [(index[ b.vertices[0]], index[ b.vertices[1]], b.order, b.type) for b in mol.edges]
+  return atoms, bonds
+
+
+def data_to_oasa_mol( data):
+  """the reverse of oasa_mol_to_data"""
+  atoms, bonds = data
+  m = oasa.molecule()
+  vs = []
+  for symbol, x, y, z, charge, isotope, valency, multiplicity, number in atoms:
+    a = oasa.atom( symbol=symbol)
+    a.x, a.y, a.z = x, y, z
+    a.charge = charge
+    a.isotope = isotope
+    a.valency = valency
+    a.multiplicity = multiplicity
+    if number is not None:
+      a.properties_['inchi_number'] = number
+    vs.append( m.add_vertex( a))
+  for i, j, order, type in bonds:
+    b = oasa.bond( order=order, type=type)
+    b.vertices = (vs[ i], vs[ j])
+    m.add_edge( vs[ i], vs[ j], b)
+  return m
+
+
+# ==================================================
+# CACHE
+# the exports of a molecule are cached until it changes
+
+_cache = weakref.WeakKeyDictionary() # bkchem molecule -> (signature, {key: result})
+
+
+def get_signature( mol):
+  """returns a value that changes whenever anything converted to OASA changes in mol"""
+  index = dict( (a, i) for i, a in enumerate( mol.atoms))
+  atoms = tuple( (a.symbol, a.get_xyz(), a.charge, a.multiplicity, a.valency, getattr( a, 'isotope', None))
+                 for a in mol.atoms)
+  bonds = tuple( (index[ b.atom1], index[ b.atom2], b.order, b.type) for b in mol.bonds)
+  return atoms, bonds
+
+
+def _get_cached( mol, key, compute):
+  signature = get_signature( mol)
+  cached = _cache.get( mol)
+  if not cached or cached[0] != signature:
+    cached = (signature, {})
+    _cache[ mol] = cached
+  results = cached[1]
+  if key not in results:
+    results[ key] = compute()
+  return results[ key]
+
+
 ### TODO
 
 # coordinates transformations
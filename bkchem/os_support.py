@@ -192,3 +192,14 @@ def get_bkchem_run_dir():
       path = path.decode(sys.getfilesystemencoding())
   return path
 
+
+
+def replace_file( source, target):
+  """renames source to target, an existing target is replaced
+  (os.rename does not do it on Windows and os.replace is not in Python 2)"""
+  if hasattr( os, "replace"):
+    os.replace( source, target)
+  else:
+    if os.name == "nt" and os.path.exists( target):
+      os.remove( target)
+    os.rename( source, target)
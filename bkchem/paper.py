@@ -67,6 +67,8 @@ import messages
 import os_support
 import xml_writer
 import interactors
+import spatial_index
+import cdml_reader
 import CDML_versions
 import dom_extensions
 
@@ -76,6 +78,7 @@ from textatom import textatom
 from molecule import molecule
 from reaction import reaction
 from id_manager import id_manager
+from redraw_scheduler import redraw_scheduler
 from temp_manager import template_manager
 from singleton_store import Store, Screen
 from helper_graphics import selection_rect
@@ -94,7 +97,7 @@ class chem_paper(Canvas, object):
 
 
   def __init__(self, master=None, file_name={}, **kw):
-    Canvas.__init__(self, master, kw)
+    self.init_canvas(master, kw)
 
     self.clipboard = None
 
@@ -105,6 +108,7 @@ class chem_paper(Canvas, object):
     self.__in_id      = 0
     self._id_2_object = {}
     self.stack        = []
+    self._undo_dirty  = set()  # objects changed outside of the modes, see mark_dirty
 
     # bindings to input events
     self.set_bindings()
@@ -114,6 +118,9 @@ class chem_paper(Canvas, object):
     # undo manages
     self.um = undo.undo_manager( self)  # undo manager
 
+    # redraws coalesced until Tk gets idle
+    self.redraw_scheduler = redraw_scheduler(self)
+
     # external data management
     self.edm = external_data_manager()
     self.edm.load_available_definitions()
@@ -130,6 +137,16 @@ class chem_paper(Canvas, object):
     self._do_not_focus = [] # this is to enable an ugly hack in a drag-and-focus hack
 
 
+  def init_canvas(self, master, kw):
+    """initializes the underlying canvas, overriden in headless_paper"""
+    Canvas.__init__(self, master, kw)
+
+
+  def create_font(self, **kw):
+    """returns a font object (with measure and metrics methods) for text drawn on this paper"""
+    return tkFont.Font(**kw)
+
+
   def set_bindings( self):
     if not Store.app.in_batch_mode:
       self.bind("<B1-Motion>",         self._drag1)
@@ -523,12 +540,64 @@ class chem_paper(Canvas, object):
     original_version = CDML.getAttribute('version')
     success = CDML_versions.transform_dom_to_version(CDML, config.current_CDML_version)
     if not success:
-      if not tkMessageBox.askokcancel(_('Proceed'),
-                                      _('''This CDML document does not seem to have supported version.
-                                      \n Do you want to proceed reading this document?'''),
-                                      default = 'ok',
-                                      parent=self):
+      if not self._ask_unsupported_version():
+        return None
+    standards = self._read_package_header(CDML)
+    for p in CDML.childNodes:
+      if p.nodeName in data.loadable_types:
+        self._read_package_object(p, original_version, draw=draw)
+    self._read_package_finish(standards, CDML.getElementsByTagName("external-data"), draw=draw)
+
+
+  def read_package_stream(self, CDML, children, draw=True):
+    """reads the document the same way as read_package, the children of the CDML element
+    are however given by an iterable (see cdml_reader.iterparse_CDML) and each of them is
+    upgraded to the current CDML version and read on its own, so that the whole
+    document does not have to be in memory at once"""
+    self.onread_id_sandbox_activate() # to sandbox the ids
+
+    original_version = CDML.getAttribute('version')
+    # CDML has no children here, for old versions the upgrade adds the default standard to it
+    success = CDML_versions.transform_dom_to_version(CDML, config.current_CDML_version)
+    if not success:
+      if not self._ask_unsupported_version():
         return None
+    default_standards = dom_extensions.getChildrenNamed(CDML, 'standard')
+    standards = None
+    external_data = []
+    for p in children:
+      if original_version != config.current_CDML_version:
+        p = cdml_reader.upgrade_element(p, original_version)
+      if p.nodeName in ('paper', 'viewport', 'standard'):
+        # header elements are collected until the first object is read
+        if standards is None:
+          if p.nodeName == 'standard':
+            # the standard from the file is preferred to the one added by the upgrade
+            [CDML.removeChild(st) for st in default_standards]
+            default_standards = []
+          CDML.appendChild(p)
+      elif p.nodeName in data.loadable_types:
+        if standards is None:
+          standards = self._read_package_header(CDML)
+        self._read_package_object(p, original_version, draw=draw)
+      elif p.nodeName == "external-data":
+        external_data.append(p)
+    if standards is None:
+      standards = self._read_package_header(CDML)
+    self._read_package_finish(standards, external_data, draw=draw)
+
+
+  def _ask_unsupported_version(self):
+    return tkMessageBox.askokcancel(_('Proceed'),
+                                    _('''This CDML document does not seem to have supported version.
+                                    \n Do you want to proceed reading this document?'''),
+                                    default = 'ok',
+                                    parent=self)
+
+
+  def _read_package_header(self, CDML):
+    """reads paper properties, viewport and standard from CDML,
+    returns (new_standard, old_standard)"""
     # paper properties
     paper = [o for o in CDML.childNodes
                    if (not o.nodeValue) and (o.localName == 'paper')]
@@ -560,28 +629,34 @@ class chem_paper(Canvas, object):
     old_standard = self.standard
     if new_standard:
       self.standard = new_standard
-    for p in CDML.childNodes:
-      if p.nodeName in data.loadable_types:
-        o = self.add_object_from_package(p)
-        if not o:
-          continue
-        if o.object_type == 'molecule':
-          if not o.is_connected():
-            mols = o.get_disconnected_subgraphs()
-          else:
-            mols = [o]
-          for mol in mols:
-            if float(original_version) < 0.12:
-              # we need to know if the bond is positioned according to the rules or the other way
-              # it is however very expensive for large molecules with many double bonds and therefore
-              # it was in version '0.12' of CDML moved to the saved package and does not have to be
-              # checked on start anymore
-              [b.post_read_analysis() for b in mol.bonds]
-          if draw:
-            [mol.draw(automatic="none") for mol in mols]
-        else:
-          if draw:
-            o.draw()
+    return new_standard, old_standard
+
+
+  def _read_package_object(self, p, original_version, draw=True):
+    o = self.add_object_from_package(p)
+    if not o:
+      return
+    if o.object_type == 'molecule':
+      if not o.is_connected():
+        mols = o.get_disconnected_subgraphs()
+      else:
+        mols = [o]
+      for mol in mols:
+        if float(original_version) < 0.12:
+          # we need to know if the bond is positioned according to the rules or the other way
+          # it is however very expensive for large molecules with many double bonds and therefore
+          # it was in version '0.12' of CDML moved to the saved package and does not have to be
+          # checked on start anymore
+          [b.post_read_analysis() for b in mol.bonds]
+      if draw:
+        [mol.draw(automatic="none") for mol in mols]
+    else:
+      if draw:
+        o.draw()
+
+
+  def _read_package_finish(self, standards, external_data, draw=True):
+    new_standard, old_standard = standards
     # now check if the old standard differs
     if new_standard and old_standard != self.standard and not Store.app.in_batch_mode:
       if not tkMessageBox.askokcancel(_('Replace standard values'),
@@ -591,9 +666,7 @@ class chem_paper(Canvas, object):
         self.standard = old_standard
 
     # external data
-    ees = CDML.getElementsByTagName("external-data")
-    if ees:
-      [self.edm.read_package(ee) for ee in ees]
+    [self.edm.read_package(ee) for ee in external_data]
 
     # finish
     # we close the sandbox and generate new ids for everything
@@ -630,42 +703,63 @@ class chem_paper(Canvas, object):
 
   def get_package(self):
     doc = dom.Document()
-    root = dom_extensions.elementUnder(doc, 'cdml', attributes = (('version', config.current_CDML_version),
+    root = self._create_package_root(doc)
+    for part in self.get_package_parts(doc):
+      root.appendChild(part)
+    return doc
+
+
+  def write_package(self, out):
+    """writes the CDML package to out (dom_extensions.xml_stream_writer),
+    only one top-level element exists as a DOM tree at a time"""
+    doc = dom.Document()
+    out.start(self._create_package_root(doc))
+    for part in self.get_package_parts(doc):
+      out.write(part)
+      part.unlink()
+    out.end()
+
+
+  def _create_package_root(self, doc):
+    return dom_extensions.elementUnder(doc, 'cdml', attributes = (('version', config.current_CDML_version),
                                                                   ('xmlns',   data.cdml_namespace)))
-    info = dom_extensions.elementUnder(root, 'info')
+
+
+  def get_package_parts(self, doc):
+    """yields the top-level elements of the CDML package one by one"""
+    info = doc.createElement('info')
     dom_extensions.textOnlyElementUnder(info,
                                         'author_program',
                                         'BKChem',
                                         attributes=(('version', config.current_BKChem_version),))
-    paper = dom_extensions.elementUnder(root,
-                                        'paper',
-                                        attributes=(('type', self._paper_properties['type']),
-                                                    ('orientation', self._paper_properties['orientation']),
-                                                    ('crop_svg', '%d' % self._paper_properties['crop_svg']),
-                                                    ('crop_margin', '%d' % self._paper_properties['crop_margin']),
-                                                    ('use_real_minus', '%d' % self._paper_properties['use_real_minus']),
-                                                    ('replace_minus', '%d' % self._paper_properties['replace_minus'])
-                                                   )
-                                       )
+    yield info
+    paper = doc.createElement('paper')
+    dom_extensions.setAttributes(paper, (('type', self._paper_properties['type']),
+                                         ('orientation', self._paper_properties['orientation']),
+                                         ('crop_svg', '%d' % self._paper_properties['crop_svg']),
+                                         ('crop_margin', '%d' % self._paper_properties['crop_margin']),
+                                         ('use_real_minus', '%d' % self._paper_properties['use_real_minus']),
+                                         ('replace_minus', '%d' % self._paper_properties['replace_minus'])
+                                        )
+                                )
     if self._paper_properties['type'] == 'custom':
       dom_extensions.setAttributes(paper, (('size_x', '%d' % self._paper_properties['size_x']),
                                            ('size_y', '%d' % self._paper_properties['size_y'])))
-    dom_extensions.elementUnder(root,
-                                'viewport',
-                                attributes=(('viewport', '%f %f %f %f' % self._view),))
-    root.appendChild(self.standard.get_package(doc))
+    yield paper
+    viewport = doc.createElement('viewport')
+    viewport.setAttribute('viewport', '%f %f %f %f' % self._view)
+    yield viewport
+    yield self.standard.get_package(doc)
     for o in self.stack:
-      root.appendChild(o.get_package(doc))
+      yield o.get_package(doc)
     for a in self.arrows:
       if not a.reaction.is_empty():
-        root.appendChild(a.reaction.get_package(doc))
+        yield a.reaction.get_package(doc)
 
     # external data
     edm_doc = self.edm.get_package(doc)
     if edm_doc:
-      root.appendChild(edm_doc)
-
-    return doc
+      yield edm_doc
 
 
   def mrproper(self):
@@ -717,6 +811,7 @@ class chem_paper(Canvas, object):
 
   def clean_paper(self):
     "removes all items from paper and deletes them from molecules and items"
+    self.redraw_scheduler.cancel()
     self.unselect_all()
     self.delete('all')
     self.background = None
@@ -730,6 +825,7 @@ class chem_paper(Canvas, object):
 
     del self.stack
     self.stack = []
+    self._undo_dirty.clear()
     self.um.clean()
     self.changes_made = 0
 
@@ -742,15 +838,17 @@ class chem_paper(Canvas, object):
   def handle_overlap(self):
     "puts overlaping molecules together to one and then calles handle_overlap(a1, a2) for that molecule"
     overlap = []
-    for a in self.find_withtag('atom'):
-      x, y = self.id_to_object(a).get_xy()
-      for b in self.find_overlapping(x-2, y-2, x+2, y+2):
-        if (a != b) and ('atom' in self.gettags(b)):
-          a1 = self.id_to_object(a)
-          a2 = self.id_to_object(b)
-          if (abs(a1.x - a2.x) < 2) and (abs(a1.y - a2.y) < 2):
-            if (not [a2,a1] in overlap) and a1.z == a2.z:
+    overlap_seen = {}
+    index = spatial_index.grid_index(cell_size=4, objects=[a for m in self.molecules for a in m.atoms])
+    for m in self.molecules:
+      for a1 in m.atoms:
+        if not a1.item:
+          continue
+        for a2 in index.find_near(a1.x, a1.y, 2):
+          if a2 is not a1 and a2.item and a1.z == a2.z:
+            if a1 not in overlap_seen.get(a2, ()):
               overlap.append([a1,a2])
+              overlap_seen.setdefault(a1, set()).add(a2)
 
     deleted = []
     if overlap:
@@ -762,6 +860,7 @@ class chem_paper(Canvas, object):
           mol = a_eatenby_b2[a_eatenby_b1.index(mol)]
         while (mol2 in a_eatenby_b1):
           mol2 = a_eatenby_b2[a_eatenby_b1.index(mol2)]
+        self.mark_dirty([mol, mol2])
         if mol != mol2 and (mol2 not in a_eatenby_b1):
           mol.eat_molecule(mol2)
           a_eatenby_b1.append(mol2)
@@ -846,7 +945,7 @@ class chem_paper(Canvas, object):
 
 
   def is_registered_id(self, ID):
-    return ID in self._id_2_object.keys()
+    return ID in self._id_2_object
 
 
   def new_molecule(self):
@@ -1273,15 +1372,28 @@ class chem_paper(Canvas, object):
     Store.log(_("selected top_levels were exported to clipboard in SVG"))
 
 
-  def start_new_undo_record(self, name=''):
+  def start_new_undo_record(self, name='', dirty=None):
+    """dirty may be a list of objects changed since the last record,
+    only these (together with the ones given to mark_dirty) are then examined
+    by the undo manager; without it the whole paper is compared, which is what
+    all the records not made by moving of atoms and molecules do"""
     if name != "arrow-key-move":
       self.before_undo_record()
     if not self.changes_made:
       self.changes_made = 1
-    self.um.start_new_record(name=name)
+    if dirty is not None:
+      dirty = list(dirty) + list(self._undo_dirty)
+    self._undo_dirty.clear()
+    self.um.start_new_record(name=name, dirty=dirty)
     self.after_undo_record()
 
 
+  def mark_dirty(self, objects):
+    """marks objects as changed for the next undo record made with a dirty list,
+    used by code that changes objects the caller does not know about"""
+    self._undo_dirty.update(objects)
+
+
   def before_undo_record(self):
     """this method is place where periodical checks and other things that should be done before
     undo is recorded should be done"""
@@ -19,6 +19,7 @@
 
 import os
 import sys
+import pickle
 import xml.dom.minidom as dom
 
 import debug
@@ -41,21 +42,36 @@ class plugin_manager(object):
     dir1 = os_support.get_bkchem_private_dir()
     dir1 = os.path.join( dir1, 'plugins')
     dirs = dir2 + [dir1]
+    # the descriptions are cached, the XML files are parsed only when changed
+    cache = self._read_cache()
+    changed = False
     for dir in dirs:
       if not os.path.isdir( dir):
         continue
       for name in os.listdir( dir):
         base, ext = os.path.splitext( name)
         if ext == ".xml":
+          path = os.path.join( dir, name)
+          st = os.stat( path)
+          key = (st.st_mtime, st.st_size, Store.lang)
+          if path in cache and cache[ path][0] == key:
+            if cache[ path][1]:
+              self._add_plugin( *cache[ path][1])
+            continue
           #try:
-          self.read_plugin_file( dir, name)
+          cache[ path] = (key, self.read_plugin_file( dir, name))
+          changed = True
           #except:
           #  debug.log( "could not load plugin file", name)
+    if changed:
+      self._write_cache( cache)
 
     return self.plugins.keys()
 
 
   def read_plugin_file( self, dir, name):
+    """reads the plugin description, registers the plugin and returns the arguments
+    of the plugin_handler (None when the file does not describe a plugin)"""
     doc = dom.parse( os.path.join( dir, name))
     root = doc.childNodes[0]
     plugin_type = root.getAttribute( 'type') or 'script'
@@ -75,11 +91,42 @@ class plugin_manager(object):
           menu = dom_ext.getAllTextFromElement( menus[0])
         else:
           menu = ""
+        args = (name, file, plugin_type, self._select_correct_text( descs), menu)
+        self._add_plugin( *args)
+        return args
+    return None
 
-        plugin = plugin_handler( name, file, type=plugin_type,
-                                 desc=self._select_correct_text( descs),
-                                 menu=menu)
-        self.plugins[ name] = plugin
+
+  def _add_plugin( self, name, file, plugin_type, desc, menu):
+    self.plugins[ name] = plugin_handler( name, file, type=plugin_type, desc=desc, menu=menu)
+
+
+  def _get_cache_name( self):
+    dir = os_support.create_personal_config_directory( "cache")
+    if dir:
+      return os.path.join( dir, "script-plugins.cache")
+    return None
+
+
+  def _read_cache( self):
+    name = self._get_cache_name()
+    if name:
+      try:
+        with open( name, "rb") as f:
+          return pickle.load( f)
+      except Exception:
+        pass
+    return {}
+
+
+  def _write_cache( self, cache):
+    name = self._get_cache_name()
+    if name:
+      try:
+        with open( name, "wb") as f:
+          pickle.dump( cache, f, 2)
+      except (IOError, OSError, pickle.PickleError):
+        pass
 
 
   def run_plugin( self, name):
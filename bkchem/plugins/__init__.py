@@ -17,8 +17,33 @@
 
 #--------------------------------------------------------------------------
 
+"""Import and export plugins.
+
+The plugin modules are imported only when they are used for the first time.
+Their metadata (name, extensions, local_name, documentation of the importer
+and exporter) are read from the source without running it and cached in
+a manifest in the personal config directory, so that the menus can be
+built at startup without importing the plugins and their dependencies
+(cairo, piddle, ...). Plugins with missing dependencies are left out.
+
+  for plugin in plugins.get_plugins():
+    if plugin.has_exporter:
+      exporter = plugin.exporter( paper)   # the module is imported here
+"""
+
 from __future__ import print_function
 
+import os
+import sys
+import ast
+import time
+import pickle
+import tempfile
+
+import os_support
+import startup_profile
+
+
 __all__ = []
 
 # 'bitmap' and 'gtml' were removed for the release
@@ -36,14 +61,231 @@ _names = ["CML",
           "ps_cairo",
           "CDXML"]
 
-import sys
+_dir = os.path.dirname( os.path.abspath( __file__))
+
+# increase when the format of the manifest changes
+manifest_format = 1
+
+
+class lazy_plugin(object):
+  """Stands for a plugin module, imports it when the importer or exporter is needed."""
+
+  def __init__( self, module_name, meta):
+    self.module_name = module_name
+    self.name = meta['name']
+    self.extensions = meta['extensions']
+    self.local_name = meta['local_name'] and _( meta['local_name']) or None
+    self.has_importer = bool( meta['importer'])
+    self.has_exporter = bool( meta['exporter'])
+    self.importer_doc = meta['docs'].get( meta['importer']) and _( meta['docs'][ meta['importer']]) or ''
+    self.exporter_doc = meta['docs'].get( meta['exporter']) and _( meta['docs'][ meta['exporter']]) or ''
+    self._module = None
+
+
+  @property
+  def module( self):
+    if not self._module:
+      t = time.time()
+      self._module = __import__( __name__ + "." + self.module_name, fromlist=[self.module_name])
+      startup_profile.record( "plugin " + self.module_name, time.time() - t)
+    return self._module
+
+
+  @property
+  def importer( self):
+    if not self.has_importer:
+      raise AttributeError( "plugin %s has no importer" % self.name)
+    return self.module.importer
+
+
+  @property
+  def exporter( self):
+    if not self.has_exporter:
+      raise AttributeError( "plugin %s has no exporter" % self.name)
+    return self.module.exporter
+
+
+
+_plugins = None
+
+def get_plugins():
+  """returns the list of available plugins (lazy_plugin instances)"""
+  global _plugins
+  if _plugins is None:
+    t = time.time()
+    manifest = _read_manifest()
+    changed = []
+    _plugins = []
+    for name in _names:
+      meta = _get_metadata( name, manifest, changed)
+      if meta and meta['name'] and _requirements_available( name, manifest, changed):
+        _plugins.append( lazy_plugin( name, meta))
+        __all__.append( name)
+      else:
+        print("Could not load module %s" % name, file=sys.stderr)
+    if changed:
+      _write_manifest( manifest)
+    startup_profile.record( "plugins manifest", time.time() - t)
+  return _plugins
+
+
+def get_plugin( name):
+  """returns the plugin with name (as given by the name attribute of the plugin), None if there is none"""
+  for plugin in get_plugins():
+    if plugin.name == name:
+      return plugin
+  return None
+
+
 
-for _name in _names:
+## metadata
+
+def _get_metadata( module_name, manifest, changed):
+  """returns the metadata of module_name from manifest, reads the source
+  and updates manifest when the cached ones are outdated"""
+  path = _get_module_file( module_name)
+  if not path:
+    return None
+  st = os.stat( path)
+  cached = manifest.get( module_name)
+  if cached and cached[:2] == (st.st_mtime, st.st_size):
+    return cached[2]
   try:
-    exec('from . import %s' % _name)
-    __all__.append(_name)
-  except (IOError, ImportError):
-    print("Could not load module %s" % _name, file=sys.stderr)
+    meta = read_metadata( path)
+  except (SyntaxError, ValueError, IOError):
+    meta = None
+  manifest[ module_name] = (st.st_mtime, st.st_size, meta)
+  changed.append( module_name)
+  return meta
+
+
+def _get_module_file( module_name):
+  for path in (os.path.join( _dir, module_name + ".py"),
+               os.path.join( _dir, module_name, "__init__.py")):
+    if os.path.isfile( path):
+      return path
+  return None
+
+
+def read_metadata( path):
+  """reads the plugin metadata from the module source in path without running it"""
+  with open( path, "rb") as f:
+    tree = ast.parse( f.read(), path)
+  meta = {'name': None, 'extensions': [], 'local_name': None,
+          'importer': None, 'exporter': None, 'docs': {},
+          'modules': [], 'siblings': []}
+  for node in tree.body:
+    if isinstance( node, ast.Assign) and len( node.targets) == 1 and isinstance( node.targets[0], ast.Name):
+      key = node.targets[0].id
+      if key in ('importer', 'exporter') and isinstance( node.value, ast.Name):
+        meta[ key] = node.value.id
+      elif key in ('name', 'extensions', 'local_name'):
+        meta[ key] = _get_value( node.value)
+    elif isinstance( node, ast.ClassDef):
+      meta['docs'][ node.name] = _get_class_doc( node)
+    elif isinstance( node, ast.Import):
+      meta['modules'].extend( a.name for a in node.names)
+    elif isinstance( node, ast.ImportFrom):
+      if node.level:
+        if node.module:
+          meta['siblings'].append( node.module.split( ".")[0])
+        else:
+          meta['siblings'].extend( a.name for a in node.names)
+      else:
+        meta['modules'].append( node.module)
+    # imports in try blocks have alternatives and are not required
+  return meta
+
+
+def _get_value( node):
+  """returns the value of a literal, also when marked for translation by _()"""
+  if isinstance( node, ast.Call) and isinstance( node.func, ast.Name) and node.func.id == '_':
+    node = node.args[0]
+  return ast.literal_eval( node)
+
+
+def _get_class_doc( node):
+  for n in node.body:
+    if isinstance( n, ast.Assign) and len( n.targets) == 1 and \
+       isinstance( n.targets[0], ast.Name) and n.targets[0].id == 'doc_string':
+      return _get_value( n.value)
+  return ast.get_docstring( node)
+
+
+
+## requirements
+
+def _requirements_available( module_name, manifest, changed, checked=None):
+  """checks that the modules imported by the plugin (and its sibling modules) exist,
+  without importing them"""
+  checked = checked if checked is not None else set()
+  if module_name in checked:
+    return True
+  checked.add( module_name)
+  meta = _get_metadata( module_name, manifest, changed)
+  if not meta:
+    return False
+  for name in meta['modules']:
+    if not _module_available( name):
+      return False
+  for name in meta['siblings']:
+    if not _requirements_available( name, manifest, changed, checked):
+      return False
+  return True
 
-del _name
-del _names
+
+def _module_available( name):
+  top = name.split( ".")[0]
+  if top in sys.modules:
+    return True
+  try:
+    import importlib.util
+  except ImportError:
+    import imp
+    try:
+      imp.find_module( top)
+    except ImportError:
+      return False
+    return True
+  return importlib.util.find_spec( top) is not None
+
+
+
+## manifest cache
+
+def _get_manifest_name():
+  dir = os_support.create_personal_config_directory( "cache")
+  if not dir:
+    return None
+  return os.path.join( dir, "plugins-py%d.manifest" % sys.version_info[0])
+
+
+def _read_manifest():
+  name = _get_manifest_name()
+  if not name:
+    return {}
+  try:
+    with open( name, "rb") as f:
+      manifest = pickle.load( f)
+  except Exception:
+    # missing, broken or written by an incompatible version
+    return {}
+  if manifest.get( '__format__') != manifest_format or manifest.get( '__dir__') != _dir:
+    return {}
+  return manifest
+
+
+def _write_manifest( manifest):
+  name = _get_manifest_name()
+  if not name:
+    return
+  manifest['__format__'] = manifest_format
+  manifest['__dir__'] = _dir
+  try:
+    # write to a temporary file first, more processes might start at once
+    handle, tmp_name = tempfile.mkstemp( dir=os.path.dirname( name))
+    with os.fdopen( handle, "wb") as f:
+      pickle.dump( manifest, f, 2)
+    os_support.replace_file( tmp_name, name)
+  except (IOError, OSError, pickle.PickleError):
+    pass
@@ -39,6 +39,8 @@ class cairo_exporter(plugin.exporter):
       self.converter_class = tk2piddle
     else:
       self.converter_class = converter_class
+    # when set (to the result of converter.get_display_list), it is drawn instead of the paper
+    self.display_list = None
 
 
   def init_surface( self):
@@ -102,6 +104,7 @@ class cairo_exporter(plugin.exporter):
     self.filename = name
     self.surface = self.init_surface()
     self.context = self.init_context()
-    self.converter.export_to_cairo( self.paper, self.context, transformer=self.transformer)
+    self.converter.export_to_cairo( self.paper, self.context, transformer=self.transformer,
+                                    display_list=self.display_list)
     self.save()
 
@@ -19,10 +19,15 @@
 
 from oasa import transform
 
+import tuning
+
 from . import plugin
 from .tk2piddle import tk2piddle
 from singleton_store import Screen, Store
 
+# support for tuning of piddle
+tk2piddle.text_x_shift = tuning.Tuning.Piddle.text_x_shift
+
 
 
 class piddle_exporter(plugin.exporter):
@@ -17,8 +17,11 @@
 
 #--------------------------------------------------------------------------
 
+import io
 import sys
+import copy
 import cairo
+import multiprocessing.pool
 try:
     import tkinter as Tkinter
 except ImportError:
@@ -52,10 +55,14 @@ support and antialiased fonts. The output should look the same as the PDF (Cairo
   def init_context( self):
     """to be overriden; should be called after init_surface"""
     context = cairo.Context( self.surface)
+    self._paint_background( context, self.pagesize)
+    return context
+
+
+  def _paint_background( self, context, pagesize):
     context.set_source_rgba( *self.background_color)
-    context.rectangle( 0, 0, self.pagesize[0], self.pagesize[1])
+    context.rectangle( 0, 0, pagesize[0], pagesize[1])
     context.fill()
-    return context
 
 
   def get_scaling( self, x, y):
@@ -75,6 +82,42 @@ support and antialiased fonts. The output should look the same as the PDF (Cairo
     self.surface.finish()
 
 
+  def render_sizes( self, sizes, jobs=None):
+    """renders one PNG image for each of sizes, size being the length of the longer side
+    of the image in pixels (for a 2x variant just add the doubled size); the paper is read
+    only once and the images are drawn in jobs threads; returns the list of PNG images
+    as bytes in the order of sizes, None when there is nothing to export"""
+    self.interactive = False
+    if not self.on_begin( scaling=(1.0, 1.0)):
+      return None
+    display_list = self.display_list or self.converter.get_display_list( self.paper)
+    jobs = jobs or min( len( sizes), multiprocessing.cpu_count())
+    pool = multiprocessing.pool.ThreadPool( max( 1, jobs))
+    try:
+      return pool.map( lambda size: self._render_size( display_list, size), sizes)
+    finally:
+      pool.close()
+      pool.join()
+
+
+  def _render_size( self, display_list, size):
+    w, h = self.pagesize
+    ratio = float( size) / max( w, h, 1)
+    transformer = copy.deepcopy( self.transformer)
+    transformer.set_scaling_xy( ratio, ratio)
+    pagesize = (max( 1, int( round( w*ratio))), max( 1, int( round( h*ratio))))
+    surface = cairo.ImageSurface( cairo.FORMAT_ARGB32, pagesize[0], pagesize[1])
+    context = cairo.Context( surface)
+    self._paint_background( context, pagesize)
+    # the converter keeps the drawing state, each thread needs its own
+    converter = self.converter_class( **self.attrs)
+    converter.export_to_cairo( self.paper, context, transformer=transformer, display_list=display_list)
+    f = io.BytesIO()
+    surface.write_to_png( f)
+    surface.finish()
+    return f.getvalue()
+
+
 
 # PLUGIN INTERFACE SPECIFICATION
 name = "PNG (Cairo)"
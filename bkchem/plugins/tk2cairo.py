@@ -24,11 +24,6 @@ import string
 
 import cairo
 
-try:
-    import tkinter.font as tkFont
-except ImportError:
-    import tkFont
-
 from oasa import transform
 from oasa import geometry
 
@@ -51,12 +46,18 @@ class tk2cairo(object):
             'bevel': cairo.LINE_JOIN_BEVEL}
 
 
+  # options parsed as numbers or names when drawing, text and fonts are kept as they are
+  _parsed_options = ('width', 'smooth', 'arrow', 'arrowshape', 'capstyle', 'joinstyle')
+
+
   def __init__( self, text_to_curves=False):
     self.text_to_curves = text_to_curves
     self._font_size_remap_cache = {}
 
 
-  def export_to_cairo( self, tk_canvas, cairo_context, transformer=None):
+  def export_to_cairo( self, tk_canvas, cairo_context, transformer=None, display_list=None):
+    """draws the content of tk_canvas to cairo_context; when display_list (as returned
+    by get_display_list) is given, it is drawn instead and tk_canvas is not used at all"""
     self.context = cairo_context
     self.paper = tk_canvas
     if not transformer:
@@ -64,16 +65,81 @@ class tk2cairo(object):
     else:
       self.transformer = transformer
     self.width_scaling = self.transformer.get_scaling()
-    self.draw_document()
+    # the cached font sizes depend on the scaling
+    self._font_size_remap_cache = {}
+    if display_list is None:
+      display_list = self.get_display_list( tk_canvas)
+    self.draw_document( display_list)
+
+
+  def get_display_list( self, tk_canvas):
+    """returns the list of (type, coords, options) of all the exported items of tk_canvas
+    in the stacking order; it contains everything needed for drawing (colors are already
+    converted to rgb and the text metrics taken from Tk), so it can be drawn repeatedly
+    without the canvas"""
+    hidden = set( tk_canvas.find_withtag( "no_export"))
+    colors = {}
+    fonts = {}
+    ret = []
+    for item in tk_canvas.find_all():
+      if item in hidden:
+        continue
+      type = tk_canvas.type( item)
+      # all the options at once instead of one itemcget call per option
+      options = dict( (k, v[-1]) for k, v in tk_canvas.itemconfigure( item).items())
+      for key in self._parsed_options:
+        if key in options:
+          options[ key] = str( options[ key])
+      for key in ('fill', 'outline', 'font'):
+        if key in options and not misc.myisstr( options[ key]):
+          # Tcl objects are not hashable, the values are used as cache keys
+          options[ key] = str( options[ key])
+      for key in ('fill', 'outline'):
+        if key in options:
+          options[ key] = self._get_rgb( tk_canvas, options[ key], colors)
+      if type == 'text':
+        options['bbox'] = tk_canvas.bbox( item)
+        if options['font'] not in fonts:
+          fonts[ options['font']] = self._get_font_info( tk_canvas, options['font'])
+        font = fonts[ options['font']]
+        if len( options['text']) > 5:
+          options['text_length'] = font['tk_font'].measure( options['text'])
+        options['font'] = font
+      ret.append( (type, tk_canvas.coords( item), options))
+    for font in fonts.values():
+      del font['tk_font']
+    return ret
+
+
+  def _get_rgb( self, tk_canvas, color, cache):
+    """returns color as (r,g,b) with values from 0 to 1, None for no color"""
+    if not color:
+      return None
+    if color not in cache:
+      cache[ color] = tuple( x/65535.0 for x in tk_canvas.winfo_rgb( color))
+    return cache[ color]
+
+
+  def _get_font_info( self, tk_canvas, font):
+    """returns a dict describing the Tk font for text drawing"""
+    afont = tk_canvas.create_font( font=font)
+    conf = afont.config()
+    return {'family': conf['family'],
+            'size': conf['size'],
+            'slant': conf['slant'],
+            'weight': conf['weight'],
+            'descent': afont.metrics()['descent'],
+            'sample_length': afont.measure( string.ascii_letters + string.punctuation),
+            'tk_font': afont}
 
 
   def set_cairo_color( self, color):
+    """color is (r,g,b) as in the display list"""
     if not color:
       self.context.set_source_rgba( 0,0,0,1)
       return False
     else:
-      colors = self.paper.winfo_rgb( color)
-      self.context.set_source_rgb( *map( lambda x: x/65535.0, colors))
+      self.context.set_source_rgb( *color)
       return True
 
 
@@ -88,35 +154,32 @@ class tk2cairo(object):
     return self.width_scaling * w
 
 
-  def draw_document( self):
+  def draw_document( self, display_list):
     # initial values
     self.context.set_fill_rule( cairo.FILL_RULE_EVEN_ODD)
-    # the conversion function for coordinates
-    for item in self.paper.find_all():
-      if not "no_export" in self.paper.gettags( item):
-        method = "_draw_" + self.paper.type( item)
-        if not hasattr( self, method):
-          print("Method to draw %s is not implemented" % self.paper.type( item))
-        else:
-          getattr( self, method)( item)
+    for type, coords, options in display_list:
+      method = "_draw_" + type
+      if not hasattr( self, method):
+        print("Method to draw %s is not implemented" % type)
+      else:
+        getattr( self, method)( list( coords), options)
     self.context.show_page()
 
 
-  def _draw_line( self, item):
-    if self.paper.itemcget( item, 'fill') != '':
+  def _draw_line( self, coords, options):
+    if options['fill']:
       # arrows at first as they make the lines bellow them shorter
       start = None
       end = None
-      arrows = self.paper.itemcget( item, 'arrow')
+      arrows = options['arrow']
       if arrows != "none":
-        color = self.paper.itemcget( item, 'fill')
-        coords = self.paper.coords( item)
+        color = options['fill']
         if arrows in ("last", "both"):
-          end = self._create_arrow( self.paper.itemcget( item, 'arrowshape'), coords[-4:-2], coords[-2:], color)
+          end = self._create_arrow( options['arrowshape'], coords[-4:-2], coords[-2:], color)
         if arrows in ("first", "both"):
-          start = self._create_arrow( self.paper.itemcget( item, 'arrowshape'), coords[2:4], coords[0:2], color)
+          start = self._create_arrow( options['arrowshape'], coords[2:4], coords[0:2], color)
 
-      coords = self.transformer.transform_xy_flat_list( self.paper.coords( item))
+      coords = self.transformer.transform_xy_flat_list( coords)
       if start:
         coords[0] = start[0]
         coords[1] = start[1]
@@ -125,19 +188,17 @@ class tk2cairo(object):
         coords[-1] = end[1]
 
       # cap style
-      cap = self.paper.itemcget( item, 'capstyle')
-      self.context.set_line_cap( self._caps[ cap])
+      self.context.set_line_cap( self._caps[ options['capstyle']])
       # join style
-      join = self.paper.itemcget( item, 'joinstyle')
-      self.context.set_line_join( self._joins[ join])
+      self.context.set_line_join( self._joins[ options['joinstyle']])
       # color
-      is_visible = self.set_cairo_color( self.paper.itemcget( item, 'fill'))
+      is_visible = self.set_cairo_color( options['fill'])
       # line width
-      width = self.p2c_width( float( self.paper.itemcget( item, 'width')))
+      width = self.p2c_width( float( options['width']))
       self.context.set_line_width( width)
       # the path itself
       cs = self._flat_list_to_list_of_tuples( coords)
-      if self.paper.itemcget( item, 'smooth') != "0":
+      if options['smooth'] not in ("0", "false"):
         # smooth lines
         xycoords = self._flat_list_to_list_of_tuples( coords)
         beziers = geometry.tkspline_to_cubic_bezier( xycoords)
@@ -152,18 +213,17 @@ class tk2cairo(object):
       pass #transparent things
 
 
-  def _draw_text( self, item):
-    text = self.paper.itemcget(item, 'text')
-    x1, y1, x2, y2 = self.paper.bbox( item)
+  def _draw_text( self, coords, options):
+    text = options['text']
+    x1, y1, x2, y2 = options['bbox']
     x1, y1, x2, y2 = self.transformer.transform_4( (x1+1, y1, x2-2, y2))
-    afont = tkFont.Font( font=self.paper.itemcget( item, 'font'))
-    conf = afont.config()
-    font_family = conf['family']
-    slant =  'italic' in conf['slant'] and cairo.FONT_SLANT_ITALIC or cairo.FONT_SLANT_NORMAL
-    weight = 'bold' in conf['weight'] and cairo.FONT_WEIGHT_BOLD or cairo.FONT_WEIGHT_NORMAL
+    font = options['font']
+    font_family = font['family']
+    slant =  'italic' in font['slant'] and cairo.FONT_SLANT_ITALIC or cairo.FONT_SLANT_NORMAL
+    weight = 'bold' in font['weight'] and cairo.FONT_WEIGHT_BOLD or cairo.FONT_WEIGHT_NORMAL
 
     # color
-    is_visible = self.set_cairo_color( self.paper.itemcget( item, 'fill'))
+    is_visible = self.set_cairo_color( options['fill'])
     # helvetica which is often used does not work for me - therefore I use remap
     font_name = self._font_remap.get( font_family, font_family)
     self.context.select_font_face( font_name, slant, weight)
@@ -171,13 +231,13 @@ class tk2cairo(object):
     # here we compute the font_size so that it matches what is on the screen
     # it the text is short, we use scaling based on some sample text, otherwise we compute it exactly for the string
     if len( text) <= 5:
-      cairo_size = self._get_cairo_font_size( afont)
+      cairo_size = self._get_cairo_font_size( font)
     else:
-      cairo_size = self._compute_cairo_font_size( afont, text=text)
+      cairo_size = self._compute_cairo_font_size( font, text=text, tk_length=options['text_length'])
     self.context.set_font_size( cairo_size)
 
     xbearing, ybearing, width, height, x_advance, y_advance = self.context.text_extents( text)
-    y = max(y1,y2)- self.transformer.get_scaling_xy()[1] * afont.metrics()['descent'] # * cairo_size / conf['size']
+    y = max(y1,y2)- self.transformer.get_scaling_xy()[1] * font['descent'] # * cairo_size / conf['size']
     if is_visible:
       if self.text_to_curves:
         self.context.new_path()
@@ -189,11 +249,11 @@ class tk2cairo(object):
         self.context.show_text( text)
 
 
-  def _draw_rectangle( self, item):
-    coords = self.transformer.transform_4( self.paper.coords( item))
-    outline = self.paper.itemcget( item, 'outline')
-    fill = self.paper.itemcget( item, 'fill')
-    width = self.p2c_width( float( self.paper.itemcget( item, 'width')))
+  def _draw_rectangle( self, coords, options):
+    coords = self.transformer.transform_4( coords)
+    outline = options['outline']
+    fill = options['fill']
+    width = self.p2c_width( float( options['width']))
     x1, y1, x2, y2 = coords
     self.context.set_line_join( cairo.LINE_JOIN_MITER)
     self.context.rectangle( x1, y1, x2-x1, y2-y1)
@@ -208,16 +268,15 @@ class tk2cairo(object):
       self.context.new_path()
 
 
-  def _draw_polygon( self, item):
-    coords = self.transformer.transform_xy_flat_list( self.paper.coords( item))
-    outline = self.paper.itemcget( item, 'outline')
-    fill = self.paper.itemcget( item, 'fill')
-    width = self.p2c_width( float( self.paper.itemcget( item, 'width')))
+  def _draw_polygon( self, coords, options):
+    coords = self.transformer.transform_xy_flat_list( coords)
+    outline = options['outline']
+    fill = options['fill']
+    width = self.p2c_width( float( options['width']))
     cs = self._flat_list_to_list_of_tuples( coords)
 
     # join style
-    join = self.paper.itemcget( item, 'joinstyle')
-    self.context.set_line_join( self._joins[ join])
+    self.context.set_line_join( self._joins[ options['joinstyle']])
 
     self._create_cairo_path( cs, closed=True)
     is_visible = self.set_cairo_color( fill)
@@ -231,11 +290,11 @@ class tk2cairo(object):
       self.context.new_path()
 
 
-  def _draw_oval( self, item):
-    coords = self.transformer.transform_4( self.paper.coords( item))
-    outline = self.paper.itemcget( item, 'outline')
-    fill = self.paper.itemcget( item, 'fill')
-    width = self.p2c_width( float( self.paper.itemcget( item, 'width')))
+  def _draw_oval( self, coords, options):
+    coords = self.transformer.transform_4( coords)
+    outline = options['outline']
+    fill = options['fill']
+    width = self.p2c_width( float( options['width']))
     x1, y1, x2, y2 = coords
     w = x2 - x1
     h = y2 - y1
@@ -314,27 +373,29 @@ class tk2cairo(object):
 
 
   # the following methods deal with font_size remapping between cairo and Tk
-  def _get_cairo_font_size( self, tk_font):
-    conf = tk_font.config()
-    family = conf['family']
-    tk_font_size = conf['size']
+  def _get_cairo_font_size( self, font):
+    family = font['family']
+    tk_font_size = font['size']
     if family in self._font_size_remap_cache:
       if tk_font_size in self._font_size_remap_cache[family]:
         return self._font_size_remap_cache[family][tk_font_size]
     else:
       self._font_size_remap_cache[family] = {}
-    cairo_size = self._compute_cairo_font_size( tk_font)
+    cairo_size = self._compute_cairo_font_size( font)
     self._font_size_remap_cache[family][tk_font_size] = cairo_size
     return cairo_size
 
 
-  def _compute_cairo_font_size( self, tk_font, text=""):
+  def _compute_cairo_font_size( self, font, text="", tk_length=None):
+    """font is the font description from the display list, tk_length the width of text
+    measured by Tk; without text the sample text measured in the description is used"""
     if text:
       test_string = text
     else:
       test_string = string.ascii_letters + string.punctuation
-    tk_length = self.p2c_width( tk_font.measure( test_string))
-    cairo_size = self.p2c_width(abs(tk_font.config()['size']))
+      tk_length = font['sample_length']
+    tk_length = self.p2c_width( tk_length)
+    cairo_size = self.p2c_width(abs(font['size']))
     self.context.set_font_size( cairo_size)
     for i in range(2): # two iterations should be enough
       xbearing, ybearing, width, height, x_advance, y_advance = self.context.text_extents( test_string)
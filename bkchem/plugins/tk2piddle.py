@@ -19,11 +19,6 @@
 
 from __future__ import print_function
 
-try:
-  import tkinter.font as tkFont
-except ImportError:
-  import tkFont
-
 from oasa import transform
 from oasa import geometry
 
@@ -135,7 +130,7 @@ class tk2piddle(object):
     text = self.paper.itemcget( item, 'text')
     #x, y = map( self.convert, self.paper.coords( item))
     x1, y1, x2, y2 = self.transformer.transform_4( self.paper.bbox( item))
-    afont = tkFont.Font( font=self.paper.itemcget( item, 'font'))
+    afont = self.paper.create_font( font=self.paper.itemcget( item, 'font'))
     conf = afont.config()
     font_family = conf['family']
     font_size = conf[ 'size']
@@ -0,0 +1,105 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Redraw scheduler of the paper.
+
+Objects that need to be redrawn are collected and each of them is redrawn
+only once, when Tk gets idle (or when flush is called explicitly), no matter
+how many times it was scheduled in the meantime.
+"""
+
+import collections
+
+
+
+class redraw_scheduler(object):
+
+  def __init__( self, paper):
+    self.paper = paper
+    self._dirty = collections.OrderedDict() # object -> (was drawn, redraw keyword arguments)
+    self._after_id = None
+    self._scheduled = False
+    self.reset_stats()
+
+
+  def schedule( self, o, **kw):
+    """schedules redraw of o, kw are passed to its redraw method"""
+    self.requested += 1
+    if o in self._dirty:
+      self._dirty[ o][1].update( kw)
+    else:
+      self._dirty[ o] = (is_drawn( o), kw)
+    if not self._scheduled:
+      self._scheduled = True
+      self._after_id = self.paper.after_idle( self._on_idle)
+
+
+  def flush( self):
+    """redraws all the scheduled objects now"""
+    if self._after_id is not None:
+      self.paper.after_cancel( self._after_id)
+      self._after_id = None
+    self._scheduled = False
+    if not self._dirty:
+      return
+    self.flushes += 1
+    while self._dirty:
+      o, (was_drawn, kw) = self._dirty.popitem( last=False)
+      if was_drawn and not is_drawn( o):
+        # deleted after it was scheduled, do not draw it again
+        continue
+      o.redraw( **kw)
+      self.performed += 1
+
+
+  def _on_idle( self):
+    self._after_id = None
+    self.flush()
+
+
+  def cancel( self):
+    """forgets all the scheduled redraws"""
+    if self._after_id is not None:
+      self.paper.after_cancel( self._after_id)
+      self._after_id = None
+    self._scheduled = False
+    self._dirty.clear()
+
+
+  def is_pending( self):
+    return bool( self._dirty)
+
+
+  def get_stats( self):
+    return {'requested': self.requested,
+            'performed': self.performed,
+            'flushes': self.flushes,
+            'pending': len( self._dirty)}
+
+
+  def reset_stats( self):
+    self.requested = 0
+    self.performed = 0
+    self.flushes = 0
+
+
+
+def is_drawn( o):
+  """returns true if o has some items on the canvas"""
+  return getattr( o, 'item', None) is not None or bool( getattr( o, 'items', None))
@@ -0,0 +1,159 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Cache of rendered structures used by the http servers.
+
+The entries are addressed by a hash of the normalized input and the render
+options, the same hash serves as the ETag of the response. Recently used
+entries are kept in memory (up to max_size bytes), all of them optionally
+on the disk.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+import collections
+
+import config
+import os_support
+
+
+
+class render_cache(object):
+
+  def __init__( self, max_size=32*1024*1024, directory=None):
+    self.max_size = max_size
+    self.directory = directory
+    self.size = 0
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    if directory and not os.path.isdir( directory):
+      os.makedirs( directory)
+
+
+  @staticmethod
+  def make_key( kind, data, **options):
+    """returns the cache key for the input data of kind and the render options"""
+    data = data.strip()
+    if kind == 'inchi' and data.startswith( "InChI="):
+      data = data[6:]
+    parts = [config.current_BKChem_version, kind, data]
+    parts.extend( "%s=%s" % (k, options[k]) for k in sorted( options))
+    text = "\n".join( parts)
+    if not isinstance( text, bytes):
+      text = text.encode( 'utf-8')
+    return hashlib.sha1( text).hexdigest()
+
+
+  @staticmethod
+  def get_standard_fingerprint( standard):
+    """returns a short hash of the drawing standard (classes.standard) to be used
+    as a render option, the rendering depends on it"""
+    text = "\n".join( "%s=%s" % (k, v) for k, v in sorted( standard.__dict__.items()))
+    return hashlib.sha1( text.encode( 'utf-8')).hexdigest()[:16]
+
+
+  def get( self, key):
+    """returns the cached data or None"""
+    with self._lock:
+      if key in self._entries:
+        data = self._entries.pop( key)
+        self._entries[ key] = data
+        self.hits += 1
+        return data
+    data = self._read_file( key)
+    with self._lock:
+      if data is None:
+        self.misses += 1
+      else:
+        self.disk_hits += 1
+        self._store( key, data)
+    return data
+
+
+  def put( self, key, data):
+    with self._lock:
+      self._store( key, data)
+    self._write_file( key, data)
+
+
+  def _store( self, key, data):
+    if key in self._entries:
+      self.size -= len( self._entries.pop( key))
+    if len( data) > self.max_size:
+      return
+    self._entries[ key] = data
+    self.size += len( data)
+    while self.size > self.max_size:
+      k, d = self._entries.popitem( last=False)
+      self.size -= len( d)
+
+
+  def clear( self):
+    with self._lock:
+      self._entries.clear()
+      self.size = 0
+
+
+  def get_stats( self):
+    with self._lock:
+      requests = self.hits + self.disk_hits + self.misses
+      return {'hits': self.hits,
+              'disk_hits': self.disk_hits,
+              'misses': self.misses,
+              'hit_rate': requests and float( self.hits + self.disk_hits) / requests or 0.0,
+              'entries': len( self._entries),
+              'size': self.size}
+
+
+  # disk storage
+
+  def _get_file_name( self, key):
+    return os.path.join( self.directory, key[:2], key)
+
+
+  def _read_file( self, key):
+    if not self.directory:
+      return None
+    try:
+      with open( self._get_file_name( key), "rb") as f:
+        return f.read()
+    except (IOError, OSError):
+      return None
+
+
+  def _write_file( self, key, data):
+    if not self.directory:
+      return
+    name = self._get_file_name( key)
+    d = os.path.dirname( name)
+    try:
+      if not os.path.isdir( d):
+        os.makedirs( d)
+      # write to a temporary file first so that readers never see a partial file
+      handle, tmp_name = tempfile.mkstemp( dir=d)
+      with os.fdopen( handle, "wb") as f:
+        f.write( data)
+      os_support.replace_file( tmp_name, name)
+    except (IOError, OSError):
+      pass
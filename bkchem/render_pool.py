@@ -0,0 +1,386 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Pool of worker processes rendering structures, each on its own headless paper.
+
+The application wide singletons (Store) make it impossible to draw on more
+papers from different threads, therefore every worker is a separate process
+with its own headless application. The pool limits the number of jobs waiting
+for a free worker, jobs over the limit are refused with pool_busy_error.
+
+The workers measure the time spent in the phases of rendering (parse,
+layout, draw and serialize), the pool passes it to its observer and keeps
+the statistics of the load returned by get_stats.
+"""
+
+import os
+import sys
+import time
+import itertools
+import functools
+import threading
+import tempfile
+import traceback
+import multiprocessing
+
+import oasa_bridge
+
+from singleton_store import Store
+
+
+
+class render_error(Exception):
+  """the rendering failed in the worker, the message comes from the worker"""
+  pass
+
+
+
+class pool_busy_error(Exception):
+  """all the workers are busy and the queue of waiting jobs is full"""
+  pass
+
+
+
+class render_pool(object):
+
+  def __init__( self, workers=None, max_queue=None, timeout=30, observer=None):
+    """observer is called with the dict of phase timings of every finished job"""
+    self.workers = workers or multiprocessing.cpu_count()
+    if max_queue is None:
+      max_queue = 4 * self.workers
+    self.max_queue = max_queue
+    self.timeout = timeout
+    self.observer = observer
+    self._slots = threading.Semaphore( self.workers + self.max_queue)
+    # notified on every release of a slot, a batch waits on it for a free place
+    self._slot_released = threading.Condition()
+    self._pool = multiprocessing.Pool( self.workers, initializer=init_worker)
+    # the jobs holding a slot, job id -> (AsyncResult, time of submission)
+    self._jobs = {}
+    self._job_ids = itertools.count()
+    # a job not finished after this time was most probably lost with a dead worker
+    # (the pool replaces the worker but not its job), its slot is then taken back
+    self.reclaim_after = 2 * self.timeout * (1 + self.max_queue // self.workers)
+    # statistics
+    self._lock = threading.Lock()
+    self._started = time.time()
+    self.in_flight = 0
+    self.jobs = 0
+    self.refused = 0
+    self.busy_time = 0.0
+
+
+  def render( self, kind, data, format='svg', size=None, timings=None, standard=None):
+    """renders the structure given as data of kind (one of 'smiles', 'inchi', 'molfile', 'gtml')
+    to format ('svg' or 'png' with the longer side of size pixels), returns the image data as string;
+    the phase timings of the job are added to the dict timings when given; standard is the drawing
+    standard (classes.standard) to use, by default the worker uses the one it loaded at startup"""
+    if not self._acquire():
+      self._refuse()
+      raise pool_busy_error()
+    ok, result, job_timings = self._submit( (kind, data, format, size, standard)).get( self.timeout)
+    self._add_timings( job_timings, timings)
+    if not ok:
+      raise render_error( result)
+    return result
+
+
+  def render_batch( self, items, format='svg', size=None, timings=None, standard=None):
+    """renders all the items given as (kind, data) in parallel; every submitted job holds
+    a place in the queue like a single render, the items are submitted as the places
+    get free, so a batch never queues more than the pool allows; returns the list of
+    (True, image) or (False, error message) in the order of items, the items not rendered
+    in time get an error as well; standard is used as in render"""
+    if not items:
+      return []
+    if not self._acquire():
+      self._refuse()
+      raise pool_busy_error()
+    rounds = (len( items) + self.workers - 1) // self.workers
+    deadline = time.time() + self.timeout * rounds
+    kind, data = items[0]
+    pending = [self._submit( (kind, data, format, size, standard))]
+    submitted = 1
+    results = []
+    try:
+      while len( results) < len( items):
+        while submitted < len( items) and self._acquire():
+          kind, data = items[ submitted]
+          pending.append( self._submit( (kind, data, format, size, standard)))
+          submitted += 1
+        if not pending:
+          # all the places are taken by other requests
+          if not self._wait_for_slot( deadline):
+            raise multiprocessing.TimeoutError()
+          kind, data = items[ submitted]
+          pending.append( self._submit( (kind, data, format, size, standard)))
+          submitted += 1
+        ok, result, job_timings = pending.pop( 0).get( max( 0, deadline - time.time()))
+        self._add_timings( job_timings, timings)
+        results.append( (ok, result))
+    except multiprocessing.TimeoutError:
+      # the items rendered so far are kept, the jobs still running free their places when done
+      results.extend( [(False, "the rendering took too long")] * (len( items) - len( results)))
+    return results
+
+
+  def _wait_for_slot( self, deadline):
+    """waits until a slot is released and takes it, returns False when none was free before deadline"""
+    with self._slot_released:
+      while not self._acquire():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return False
+        # the slots of lost jobs are not released by anyone, they are reclaimed by _acquire
+        self._slot_released.wait( min( remaining, 1.0))
+      return True
+
+
+  def _submit( self, args):
+    """submits one job to the pool, the caller must hold a slot for it; the slot is released
+    when the worker finishes the job, not when the caller stops waiting for it, so that
+    the jobs left running after a timeout still count"""
+    job = next( self._job_ids)
+    with self._lock:
+      # registered before the submission, the job may finish before apply_async returns
+      self._jobs[ job] = None
+    self._change_in_flight( 1)
+    kw = {'callback': functools.partial( self._job_done, job)}
+    if sys.version_info[0] > 2:
+      kw['error_callback'] = functools.partial( self._job_failed, job)
+    try:
+      result = self._pool.apply_async( render_job, args, **kw)
+    except Exception:
+      if self._forget( job):
+        self._release()
+      raise
+    with self._lock:
+      if job in self._jobs:
+        self._jobs[ job] = (result, time.time())
+    return result
+
+
+  def _job_done( self, job, result):
+    # runs in the result handler thread of the pool
+    if self._forget( job):
+      self._release()
+    self._finish_job( result[2])
+
+
+  def _job_failed( self, job, exc):
+    # the job raised in the worker (e.g. its result could not be pickled)
+    if self._forget( job):
+      self._release()
+
+
+  def _forget( self, job):
+    """removes the job from the jobs holding a slot, returns False if it was not there
+    (its slot was already released)"""
+    with self._lock:
+      if job in self._jobs:
+        del self._jobs[ job]
+        return True
+      return False
+
+
+  def _acquire( self):
+    """takes a slot for a new job without waiting, returns False when there is none"""
+    if self._slots.acquire( False):
+      return True
+    return self._reclaim() > 0 and self._slots.acquire( False)
+
+
+  def _reclaim( self):
+    """releases the slots of jobs that will never call back - jobs that failed in Python 2,
+    where apply_async has no error_callback, and jobs lost with a dead worker;
+    returns the number of released slots"""
+    now = time.time()
+    with self._lock:
+      lost = []
+      for job, entry in self._jobs.items():
+        if entry:
+          result, submitted = entry
+          if result.ready():
+            if not result.successful():
+              lost.append( job)
+          elif now - submitted > self.reclaim_after:
+            lost.append( job)
+      for job in lost:
+        del self._jobs[ job]
+    for job in lost:
+      self._release()
+    return len( lost)
+
+
+  def _release( self):
+    self._change_in_flight( -1)
+    self._slots.release()
+    with self._slot_released:
+      self._slot_released.notify_all()
+
+
+  def _refuse( self):
+    with self._lock:
+      self.refused += 1
+
+
+  def _change_in_flight( self, n):
+    with self._lock:
+      self.in_flight += n
+
+
+  def _finish_job( self, job_timings):
+    with self._lock:
+      self.jobs += 1
+      self.busy_time += sum( job_timings.values())
+    if self.observer:
+      self.observer( job_timings)
+
+
+  def _add_timings( self, job_timings, timings):
+    if timings is not None:
+      for phase, t in job_timings.items():
+        timings[ phase] = timings.get( phase, 0) + t
+
+
+  def get_stats( self):
+    """returns the statistics of the load of the pool; the jobs waiting for a worker
+    are estimated from the number of jobs in flight"""
+    self._reclaim()
+    with self._lock:
+      running = min( self.in_flight, self.workers)
+      elapsed = time.time() - self._started
+      return {'workers': self.workers,
+              'in_flight': self.in_flight,
+              'running': running,
+              'queued': self.in_flight - running,
+              'jobs': self.jobs,
+              'refused': self.refused,
+              'busy_time': self.busy_time,
+              'utilization': elapsed and self.busy_time / (elapsed * self.workers) or 0.0}
+
+
+  def close( self):
+    self._pool.terminate()
+    self._pool.join()
+
+
+
+## the worker part
+
+def init_worker():
+  import headless
+  headless.headless_app()
+
+
+def render_job( kind, data, format, size=None, standard=None):
+  """runs in the worker, returns (True, image, phase timings) or (False, error message, phase timings)"""
+  timings = {}
+  try:
+    return True, render( kind, data, format=format, size=size, timings=timings, standard=standard), timings
+  except Exception:
+    return False, traceback.format_exc().strip().splitlines()[-1], timings
+
+
+def render( kind, data, format='svg', size=None, timings=None, standard=None):
+  """renders the structure, the time (in seconds) spent in the phases parse, layout, draw
+  and serialize is stored in the dict timings when given; molfile and gtml are read
+  and drawn by the import plugins, their reading and drawing counts as parse;
+  standard replaces the drawing standard of the paper for this rendering"""
+  if timings is None:
+    timings = {}
+  app = Store.app
+  paper = app.paper
+  t = time.time()
+  default_standard = paper.standard
+  if standard is not None:
+    paper.standard = standard
+  paper.clean_paper()
+  paper.create_background()
+  try:
+    if kind in ('smiles', 'inchi'):
+      if kind == 'smiles':
+        mol = oasa_bridge.smiles_to_oasa_mol( data, calc_coords=False)
+      else:
+        mol = oasa_bridge.inchi_to_oasa_mol( data, calc_coords=False)
+      t = _end_phase( timings, 'parse', t)
+      oasa_bridge.calculate_coords( mol)
+      t = _end_phase( timings, 'layout', t)
+      app.add_oasa_mol( mol)
+      t = _end_phase( timings, 'draw', t)
+    elif kind == 'molfile':
+      read_molfile( data)
+      t = _end_phase( timings, 'parse', t)
+    elif kind == 'gtml':
+      app.plugin_import( 'GTML', data)
+      t = _end_phase( timings, 'parse', t)
+    else:
+      raise ValueError( "unknown kind of input '%s'" % kind)
+    image = get_image( paper, format, size=size)
+    _end_phase( timings, 'serialize', t)
+    return image
+  finally:
+    paper.clean_paper()
+    paper.standard = default_standard
+
+
+def _end_phase( timings, phase, start):
+  """adds the time from start to phase in timings, returns the current time"""
+  now = time.time()
+  timings[ phase] = timings.get( phase, 0) + now - start
+  return now
+
+
+def read_molfile( text):
+  """reads the molfile text to the paper of the application"""
+  handle, name = tempfile.mkstemp( suffix=".mol")
+  os.close( handle)
+  try:
+    with open( name, "w") as f:
+      f.write( text)
+    if not Store.app.plugin_import( 'Molfile', name):
+      raise ValueError( "molfile import failed")
+  finally:
+    os.remove( name)
+
+
+def get_image( paper, format='svg', size=None):
+  """returns the content of paper as SVG or PNG data, size is the length of the
+  longer side of the PNG image in pixels (by default it is the size of the drawing)"""
+  if format == 'svg':
+    import xml_writer
+    exporter = xml_writer.SVG_writer( paper)
+    exporter.construct_dom_tree( paper.top_levels)
+    return exporter.document.toxml( 'utf-8')
+  elif format == 'png' and size:
+    images = Store.app.render_png_sizes( [size], jobs=1)
+    if not images:
+      raise ValueError( "there is nothing to export")
+    return images[0]
+  elif format == 'png':
+    handle, name = tempfile.mkstemp( suffix=".png")
+    os.close( handle)
+    try:
+      if not Store.app.plugin_export( "PNG (Cairo)", name):
+        raise ValueError( "PNG export failed")
+      with open( name, "rb") as f:
+        return f.read()
+    finally:
+      os.remove( name)
+  raise ValueError( "unknown image format '%s'" % format)
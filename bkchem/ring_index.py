@@ -0,0 +1,53 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Index of the rings of a molecule used for fast lookup of rings containing a bond.
+
+"""
+
+
+
+class ring_index(object):
+  """Maps bonds to the rings (the smallest independent cycles) both their atoms lie in.
+
+  The index is built from the cycles as returned by
+  molecule.get_smallest_independent_cycles_dangerous_and_cached() and it is
+  valid as long as oasa returns the same cycles object, which it does until
+  the topology of the molecule changes, see molecule.get_ring_index().
+  """
+  def __init__( self, cycles):
+    self.cycles = cycles
+    self.rings = [frozenset( ring) for ring in cycles]
+    self._bond_rings = {}
+    for ring in self.rings:
+      for a in ring:
+        for b, n in a.get_neighbor_edge_pairs():
+          if n in ring:
+            rings = self._bond_rings.setdefault( b, [])
+            if not rings or rings[-1] is not ring:
+              rings.append( ring)
+
+
+  def get_rings_with_bond( self, b):
+    """returns the list of rings (frozensets of atoms) containing both atoms of b"""
+    return self._bond_rings.get( b, [])
+
+
+  def is_in_ring( self, b):
+    return b in self._bond_rings
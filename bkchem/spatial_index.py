@@ -0,0 +1,93 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Spatial index used for fast proximity queries on atoms.
+
+"""
+
+import math
+
+
+
+class grid_index(object):
+  """Uniform grid of square cells, each storing the objects placed inside it.
+
+  Objects must have x and y attributes. Their positions are read when they
+  are inserted, the index does not follow later moves of the objects.
+  """
+  def __init__( self, cell_size=4, objects=()):
+    self.cell_size = float( cell_size)
+    self._cells = {}
+    self._positions = {}
+    for o in objects:
+      self.insert( o)
+
+
+  def __len__( self):
+    return len( self._positions)
+
+
+  def __contains__( self, obj):
+    return obj in self._positions
+
+
+  def _cell( self, x, y):
+    return int( math.floor( x / self.cell_size)), int( math.floor( y / self.cell_size))
+
+
+  def insert( self, obj):
+    if obj in self._positions:
+      self.remove( obj)
+    x, y = obj.x, obj.y
+    key = self._cell( x, y)
+    self._cells.setdefault( key, []).append( obj)
+    self._positions[ obj] = (x, y, key)
+
+
+  def remove( self, obj):
+    x, y, key = self._positions.pop( obj)
+    cell = self._cells[ key]
+    cell.remove( obj)
+    if not cell:
+      del self._cells[ key]
+
+
+  def find_near( self, x, y, distance):
+    """returns objects for which both |obj.x-x| < distance and |obj.y-y| < distance"""
+    x1, y1 = self._cell( x - distance, y - distance)
+    x2, y2 = self._cell( x + distance, y + distance)
+    ret = []
+    for i in range( x1, x2+1):
+      for j in range( y1, y2+1):
+        for o in self._cells.get( (i, j), ()):
+          ox, oy, key = self._positions[ o]
+          if abs( ox - x) < distance and abs( oy - y) < distance:
+            ret.append( o)
+    return ret
+
+
+  def find_close_pairs( self, distance):
+    """yields all pairs of objects closer than distance (in the sense of find_near),
+    each pair is reported only once"""
+    seen = set()
+    for o, (x, y, key) in list( self._positions.items()):
+      seen.add( o)
+      for o2 in self.find_near( x, y, distance):
+        if o2 not in seen:
+          yield o, o2
@@ -20,11 +20,6 @@
 import oasa
 import operator
 import xml.dom.minidom as dom
-try:
-  import tkinter.font as tkFont
-except ImportError:
-  import tkFont
-
 from oasa import geometry
 from math import sin, cos, sqrt, pi
 
@@ -32,6 +27,7 @@ import misc
 import marks
 
 from ftext import ftext
+from item_pool import item_pool
 from tuning import Tuning
 from singleton_store import Store, Screen
 from parents import meta_enabled, area_colored, point_drawable, text_like, child_with_paper
@@ -315,6 +311,7 @@ class drawable_chem_vertex(oasa.chem_vertex,
     self._selected = 0 #used to keep track whether this is selected or not
     self.item = None
     self.ftext = None
+    self._item_pool = None # items reused during redraw
 
     self.pos = None
     self.focus_item = None
@@ -457,17 +454,17 @@ class drawable_chem_vertex(oasa.chem_vertex,
       self.decide_pos()
     # we use self.text to force undo when it is changed (e.g. when atom is added to OH so it changes to O)
     self.ftext = ftext( self.paper, (self.x, self.y), self.xml_ftext, font=self.font, pos=self.pos, fill=self.line_color)
-    self.ftext.draw()
+    self.ftext.draw( item_pool=self._item_pool)
     # should we want a complete bbox? (yes only for atoms in linear form)
     if len( [x for x in self.molecule.get_fragments_with_vertex( self) if x.type=="linear_form" and x.properties.get('bond_length',0)>20]):
       complete = True
     else:
       complete = False
     x1, y1, x2, y2 = self.ftext.bbox( complete=complete)
-    self.item = self.paper.create_rectangle( x1, y1, x2, y2, fill='', outline='', tags=('atom','no_export'))
+    self.item = self._create_item( 'rectangle', (x1, y1, x2, y2), fill='', outline='', tags=('atom','no_export'))
     ## shrink the selector according to the font size and properties
     hack_y = self.font.metrics()['descent'] - 1
-    self.selector = self.paper.create_rectangle( x1, y1, x2, y2-hack_y, fill=self.area_color, outline='',tags=('helper_a','no_export'))
+    self.selector = self._create_item( 'rectangle', (x1, y1, x2, y2-hack_y), fill=self.area_color, outline='',tags=('helper_a','no_export'))
     if not redraw:
       [m.draw() for m in self.marks]
 
@@ -477,22 +474,31 @@ class drawable_chem_vertex(oasa.chem_vertex,
     self._reposition_on_redraw = 0
 
 
+  def _create_item( self, type, coords, **kw):
+    """creates a canvas item, during redraw an old item is reused when possible"""
+    if self._item_pool:
+      return self._item_pool.create( type, coords, **kw)
+    return getattr( self.paper, "create_"+type)( coords, **kw)
+
+
   def redraw( self, suppress_reposition=0):
     if self._reposition_on_redraw and not suppress_reposition:
       self.reposition_marks()
       self._reposition_on_redraw = 0
 
     self.update_font()
-    # at first we delete everything...
+    # the old canvas items are reused by draw instead of being created again
     self.paper.unregister_id( self.item)
-    self.paper.delete( self.item)
-    if self.selector:
-      self.paper.delete( self. selector)
+    items = [self.item, self.selector]
     if self.ftext:
-      self.ftext.delete()
+      items.extend( i.item for i in self.ftext.items)
+    self._item_pool = item_pool( self.paper, items)
     self.item = None # to ensure that warning in draw() is not triggered when redrawing
-    # ...then we draw it again
-    self.draw( redraw=True)
+    try:
+      self.draw( redraw=True)
+    finally:
+      self._item_pool.delete()
+      self._item_pool = None
     [m.redraw() for m in self.marks]
 
     if self._selected:
@@ -598,7 +604,7 @@ class drawable_chem_vertex(oasa.chem_vertex,
 
 
   def update_font( self):
-    self.font = tkFont.Font( family=self.font_family, size=self.font_size)
+    self.font = self.paper.create_font( family=self.font_family, size=self.font_size)
 
 
   def scale_font( self, ratio):
@@ -622,7 +628,12 @@ class drawable_chem_vertex(oasa.chem_vertex,
 
 
   def transform( self, tr):
-    x, y, z = tr.transform_xyz( self.x, self.y, self.z)
+    self.transform_to( tr, *tr.transform_xyz( self.x, self.y, self.z))
+
+
+  def transform_to( self, tr, x, y, z):
+    """finishes the transformation tr with x, y, z already computed
+    (used when the coordinates are transformed in bulk)"""
     self.move_to( x, y, dont_move_marks=1)
     self.z = z
     for m in self.marks:
@@ -0,0 +1,113 @@
+#--------------------------------------------------------------------------
+#     This file is part of BKChem - a chemical drawing program
+#     Copyright (C) 2002-2009 Beda Kosata <beda@zirael.org>
+
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 2 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     Complete text of GNU GPL can be found in the file gpl.txt in the
+#     main directory of the program
+
+#--------------------------------------------------------------------------
+
+"""Profiling of the application startup.
+
+It is switched on by the --profile-startup command line option or by the
+BKCHEM_PROFILE_STARTUP environment variable. The time spent importing every
+module (with and without the modules it imports) and in the initialization
+phases marked by mark() is printed to stderr by report().
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+if sys.version_info[0] > 2:
+  import builtins
+else:
+  import __builtin__ as builtins
+
+
+
+enabled = False
+
+_start = time.time()
+_last_mark = _start
+_phases = []   # (name, time)
+_imports = []  # (module name, total time, own time)
+_import_stack = []
+_original_import = builtins.__import__
+
+
+def enable():
+  global enabled
+  if enabled:
+    return
+  enabled = True
+  builtins.__import__ = _profiled_import
+
+
+def mark( name):
+  """records the time since the previous mark as the phase name"""
+  global _last_mark
+  if not enabled:
+    return
+  t = time.time()
+  _phases.append( (name, t - _last_mark))
+  _last_mark = t
+
+
+def record( name, duration):
+  """records a phase that took duration seconds"""
+  if enabled:
+    _phases.append( (name, duration))
+
+
+def report( file=None, limit=30):
+  if not enabled:
+    return
+  file = file or sys.stderr
+  print( "startup took %.3fs" % (time.time() - _start), file=file)
+  print( "\n%-40s %10s" % ("phase", "time [ms]"), file=file)
+  for name, t in _phases:
+    print( "%-40s %10.1f" % (name, 1000*t), file=file)
+  print( "\n%-40s %10s %10s" % ("module", "total [ms]", "self [ms]"), file=file)
+  for name, total, own in sorted( _imports, key=lambda x: -x[2])[:limit]:
+    print( "%-40s %10.1f %10.1f" % (name, 1000*total, 1000*own), file=file)
+
+
+def _profiled_import( name, *args, **kw):
+  before = len( sys.modules)
+  _import_stack.append( 0.0)
+  t = time.time()
+  try:
+    return _original_import( name, *args, **kw)
+  finally:
+    total = time.time() - t
+    children = _import_stack.pop()
+    if _import_stack:
+      _import_stack[-1] += total
+    # only real imports are interesting, not lookups in sys.modules
+    if len( sys.modules) > before:
+      level = len( args) > 3 and args[3] or kw.get( 'level', 0)
+      if level > 0:
+        g = args and args[0] or kw.get( 'globals') or {}
+        fromlist = len( args) > 2 and args[2] or kw.get( 'fromlist') or ()
+        name = "%s.%s" % (g.get( '__package__') or '', name or ",".join( fromlist))
+      _imports.append( (name, total, total - children))
+
+
+
+if os.environ.get( "BKCHEM_PROFILE_STARTUP") or "--profile-startup" in sys.argv:
+  if "--profile-startup" in sys.argv:
+    sys.argv.remove( "--profile-startup")
+  enable()
@@ -19,10 +19,18 @@
 
 """Template manager resides here.
 
+The template files are compiled into a list of (name, molecule element as XML)
+and the result is cached in the personal config directory, the cache is valid
+as long as the file modification time and size (or its SHA1 hash) are the same.
+The molecules are built only when the template is used.
 """
 
+import copy
 import math
+import pickle
+import hashlib
 import os.path
+import tempfile
 import xml.sax
 import xml.dom.minidom as dom
 
@@ -32,18 +40,24 @@ from oasa.transform import transform
 import misc
 import config
 import os_support
+import cdml_reader
+import bulk_transform
 
 from molecule import molecule
 from singleton_store import Store, Screen
 
 
+# increase when the format of the cache changes
+cache_format = 1
+
 
 class template_manager(object):
-  templates = []
 
   def __init__( self):
-    self.templates = []
-    self._prepared_templates = []
+    self._names = []
+    self._sources = []
+    self._packages = {}
+    self._prepared_templates = {}
 
 
   def add_template_from_CDML( self, file):
@@ -53,41 +67,66 @@ class template_manager(object):
         warn( "template file %s does not exist - ignoring" % file)
         return
     try:
-      doc = dom.parse( file).getElementsByTagName( 'cdml')[0]
+      templates = load_template_library( file)
     except xml.sax.SAXException:
       warn( "template file %s cannot be parsed - ignoring" % file)
       return
-    # when loading old versions of CDML try to convert them, but do nothing when they cannot be converted
-    import CDML_versions
-    CDML_versions.transform_dom_to_version( doc, config.current_CDML_version)
-    Store.app.paper.onread_id_sandbox_activate()
-    added = []
-    for tmp in doc.getElementsByTagName('molecule'):
-      self.templates.append( tmp)
-      m = molecule( Store.app.paper, package=tmp)
-      self._prepared_templates.append( m)
-      added.append( m)
-    Store.app.paper.onread_id_sandbox_finish( apply_to=[]) # just switch the id_managers, no id mangling
+    for name, source in templates:
+      self._names.append( name)
+      self._sources.append( source)
+
+
+  @property
+  def templates( self):
+    return [self.get_template( n) for n in range( len( self._sources))]
 
 
   def get_template( self, n):
-    return self.templates[n]
+    """returns the molecule element of template n, parsed on first use"""
+    if n not in self._packages:
+      self._packages[n] = dom.parseString( self._sources[n]).documentElement
+    return self._packages[n]
+
+
+  def get_prepared_template( self, n):
+    """returns the molecule of template n, built on first use"""
+    if n not in self._prepared_templates:
+      paper = Store.app.paper
+      paper.onread_id_sandbox_activate()
+      try:
+        self._prepared_templates[n] = molecule( paper, package=self.get_template( n))
+      finally:
+        paper.onread_id_sandbox_finish( apply_to=[]) # just switch the id_managers, no id mangling
+    return self._prepared_templates[n]
+
+
+  def instantiate_template( self, n, paper):
+    """returns a new copy of template n placed on paper, with new ids"""
+    proto = self.get_prepared_template( n)
+    # the prototype is never drawn, so a copy of it is a plain graph of python objects,
+    # only the paper has to be shared instead of copied
+    memo = {}
+    if proto.paper:
+      memo[ id( proto.paper)] = paper
+    current = copy.deepcopy( proto, memo)
+    current.paper = paper
+    current.generate_id()
+    [ch.generate_id() for ch in current.children]
+    return current
 
 
   def get_templates_valency( self, name):
-    return self._prepared_templates[ name].next_to_t_atom.occupied_valency -1
+    return self.get_prepared_template( name).next_to_t_atom.occupied_valency -1
 
 
   def get_template_names( self):
-    return [o.name for o in self._prepared_templates]
+    return list( self._names)
 
 
   def get_transformed_template( self, n, coords, type='empty', paper=None):
     """type is type of connection - 'bond', 'atom1'(for single atom), 'atom2'(for atom with more than 1 bond), 'empty'"""
     pap = paper or Store.app.paper
-    pap.onread_id_sandbox_activate() # must be here to mangle the ids
-    current = molecule( pap, package=self.templates[n])
-    pap.onread_id_sandbox_finish( apply_to= [current]) # id mangling
+    current = self.instantiate_template( n, pap)
     current.name = ''
     self._scale_ratio = 1
     trans = transform()
@@ -139,8 +178,11 @@ class template_manager(object):
 
 
   def transform_template( self, temp, trans):
-    for a in temp.atoms:
-      a.x, a.y = trans.transform_xy( a.x, a.y)
+    # all the coordinates are transformed at once
+    atoms = temp.atoms
+    xys = bulk_transform.transform_xy_flat_list( trans, [c for a in atoms for c in (a.x, a.y)])
+    for i, a in enumerate( atoms):
+      a.x, a.y = xys[2*i], xys[2*i+1]
       a.scale_font( self._scale_ratio)
     for b in temp.bonds:
       if b.order != 1:
@@ -150,3 +192,83 @@ class template_manager(object):
     # return the ready template
     return temp
 
+
+
+
+def load_template_library( file):
+  """returns the list of (name, XML source) of templates in file, from the cache when possible"""
+  st = os.stat( file)
+  cache_name = get_cache_name( file)
+  cached = _read_cache( cache_name)
+  if cached and (cached['mtime'], cached['size']) == (st.st_mtime, st.st_size):
+    return cached['templates']
+  with open( file, "rb") as f:
+    digest = hashlib.sha1( f.read()).hexdigest()
+  if cached and cached['sha1'] == digest:
+    templates = cached['templates']
+  else:
+    templates = compile_template_library( file)
+  _write_cache( cache_name, {'format': cache_format,
+                             'cdml_version': config.current_CDML_version,
+                             'mtime': st.st_mtime,
+                             'size': st.st_size,
+                             'sha1': digest,
+                             'templates': templates})
+  return templates
+
+
+def compile_template_library( file):
+  """reads the template file and returns the list of (name, XML source) of the templates
+  upgraded to the current CDML version"""
+  cdml, children = cdml_reader.read_CDML_file( file)
+  if not cdml:
+    return []
+  version = cdml.getAttribute( 'version')
+  ret = []
+  for el in children:
+    if el.nodeName == 'molecule':
+      if version != config.current_CDML_version:
+        # when loading old versions of CDML try to convert them, but do nothing when they cannot be converted
+        cdml_reader.upgrade_element( el, version)
+      ret.append( (el.getAttribute( 'name'), el.toxml( 'utf-8')))
+    el.unlink()
+  return ret
+
+
+def get_cache_name( file):
+  """returns the name of the cache file for the template file, None when there is no place for it"""
+  dir = os_support.create_personal_config_directory( "cache")
+  if not dir:
+    return None
+  path = os.path.abspath( file)
+  if not isinstance( path, bytes):
+    path = path.encode( 'utf-8')
+  key = hashlib.sha1( path).hexdigest()
+  return os.path.join( dir, "templates-%s.cache" % key)
+
+
+def _read_cache( name):
+  if not name:
+    return None
+  try:
+    with open( name, "rb") as f:
+      cached = pickle.load( f)
+  except Exception:
+    # missing, broken or written by an incompatible version
+    return None
+  if cached.get( 'format') != cache_format or cached.get( 'cdml_version') != config.current_CDML_version:
+    return None
+  return cached
+
+
+def _write_cache( name, cached):
+  if not name:
+    return
+  try:
+    # write to a temporary file first, more processes might start at once
+    handle, tmp_name = tempfile.mkstemp( dir=os.path.dirname( name))
+    with os.fdopen( handle, "wb") as f:
+      pickle.dump( cached, f, 2)
+    os_support.replace_file( tmp_name, name)
+  except (IOError, OSError, pickle.PickleError):
+    pass
@@ -22,15 +22,31 @@
 Should provide everything needed to perform undo management.
 state_record is used only inside of undo_manager and is not
 exported in __all__.
+
+Only the most recent state of the paper is stored whole (the "shadow"
+kept by undo_manager), the state_records themselves store only the
+differences between two consecutive states. Memory needed by one record
+is therefore proportional to the size of the edit, not the size of the
+document.
+
+The memory used by the history is limited - when the records exceed the
+limit, the oldest ones are spilled into a temporary file and are read
+back only when they are needed for undo or redo.
 """
 
 ## NOTE that undo uses a low-level access to objects in order to
 ## speed up the task.
 
+import sys
 import copy
 import inspect
+import tempfile
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
 
-import misc
+from singleton_store import Store
 
 
 
@@ -43,41 +59,63 @@ class undo_manager(object):
 
   """
   MAX_RECORDS = 50
+  # approximate number of bytes the records may occupy in memory before
+  # they are spilled to disk, can be overriden by "undo_memory_limit" preference
+  MAX_MEMORY = 16 * 1024 * 1024
+  # the spill file is compacted when the data no record uses exceed both this
+  # number of bytes and the size of the used data
+  MIN_SPILL_WASTE = 64 * 1024
 
   def __init__( self, paper):
     """well, init"""
     self.paper = paper
+    self.max_memory = self.MAX_MEMORY
+    if Store.pm and Store.pm.get_preference( "undo_memory_limit"):
+      self.max_memory = int( Store.pm.get_preference( "undo_memory_limit"))
     self._records = []
+    self._spill_file = None
     self.clean()
     self.start_new_record()
 
-  def start_new_record( self, name=''):
+  def start_new_record( self, name='', dirty=None):
     """starts new undo_record closing the recent
-    name may be set for a record"""
+    name may be set for a record;
+    dirty may be a list of objects that were changed since the last record,
+    in that case only these objects (and their children) are examined,
+    otherwise the whole paper is compared to the last recorded state"""
     if len( self._records)-1 > self._pos:
       del self._records[ (self._pos+1):]
     if len( self._records) >= self.MAX_RECORDS:
       del self._records[0]
       self._pos -= 1
-    self._records.append( state_record( self.paper, name=name))
+      # the oldest available state does not need to know how it was reached
+      self._records[0].forget_previous()
+    rec = state_record( self.paper, name=name)
+    rec.record_state( self._shadow, self._stack, dirty=dirty)
+    self._stack = rec.stack_after
+    self._records.append( rec)
     self._pos += 1
+    if self._pos == 0:
+      # there is nothing to return to from the first record
+      rec.forget_previous()
+    self._check_memory()
 
   def undo( self):
     """undoes the last step and returns the number of undo records available"""
-    self._pos -= 1
-    if self._pos >= 0:
-      self._records[ self._pos].undo( self._records[ self._pos+1])
-    else:
-      self._pos = 0
+    if self._pos > 0:
+      self._records[ self._pos].load()
+      self._records[ self._pos].undo( self._shadow)
+      self._stack = self._records[ self._pos].stack_before
+      self._pos -= 1
     return self._pos
 
   def redo( self):
     """redoes the last undone step, returns number of redos available"""
-    self._pos += 1
-    if self._pos < len( self._records):
-      self._records[ self._pos].undo( self._records[ self._pos-1])
-    else:
-      self._pos = len( self._records)-1
+    if self._pos < len( self._records)-1:
+      self._pos += 1
+      self._records[ self._pos].load()
+      self._records[ self._pos].redo( self._shadow)
+      self._stack = self._records[ self._pos].stack_after
     return len( self._records) - self._pos -1
 
   def clean( self):
@@ -87,12 +125,18 @@ class undo_manager(object):
       record.clean()
     del self._records
     self._records = []
+    self._shadow = {}
+    self._stack = []
+    if self._spill_file:
+      self._spill_file.close()
+      self._spill_file = None
 
 
   def mrproper( self):
     self.clean()
     del self.paper
     del self._records
+    del self._shadow
 
 
   def get_last_record_name( self):
@@ -107,8 +151,14 @@ class undo_manager(object):
     especially powerfull in combination with named records;
     use with care - it could cause problems"""
     if self._pos > 0:
+      # the changes of the deleted record must be passed to the following one
+      self._records[ self._pos-1].load()
+      self._records[ self._pos].load()
+      self._records[ self._pos].merge_previous( self._records[ self._pos-1])
       del self._records[ self._pos-1]
       self._pos -= 1
+      if self._pos == 0:
+        self._records[0].forget_previous()
 
   def get_number_of_records( self):
     return len( self._records)
@@ -121,48 +171,84 @@ class undo_manager(object):
     return bool( self.get_number_of_records() - self._pos - 1)
 
 
-  def compare_records( self, o, state_rec1, state_rec2):
-    """returns True if the object o changed between ref1 and ref2"""
-    x1 = o in state_rec1.objects
-    x2 = o in state_rec2.objects
-    if (x1 and not x2) or (x2 and not x1):
-      # one record does not have o
-      return False
-    if not x1 and not x2:
-      # no record has o - they are the same then
+  def get_memory_footprint( self):
+    """returns a dict describing the (approximate) size of the undo history in bytes,
+    'shadow' is the size of the recent state, 'memory' of the records held in memory
+    and 'disk' of the records spilled to disk"""
+    ret = {'shadow': _estimate_size( self._shadow),
+           'memory': 0,
+           'disk': 0,
+           'records': len( self._records),
+           'spilled_records': 0}
+    for r in self._records:
+      if r.spilled:
+        ret['disk'] += r.size
+        ret['spilled_records'] += 1
+      else:
+        ret['memory'] += r.size
+    return ret
+
+
+  def _check_memory( self):
+    """spills the oldest records to disk when the memory limit is exceeded,
+    records that cannot be spilled are evicted from the history"""
+    in_memory = [r for r in self._records if not r.spilled]
+    used = sum( r.size for r in in_memory)
+    # the recent record is kept in memory, it is most likely to be used
+    for r in in_memory[:-1]:
+      if used <= self.max_memory:
+        break
+      if self._spill_file is None:
+        self._spill_file = tempfile.TemporaryFile( prefix="bkchem-undo-")
+      if r.spill( self._spill_file):
+        used -= r.size
+      else:
+        # cannot be stored, we have to forget all the records up to this one
+        i = self._records.index( r)
+        if i >= self._pos:
+          break
+        del self._records[:i+1]
+        self._pos -= i+1
+        self._records[0].forget_previous()
+        used = sum( x.size for x in self._records if not x.spilled)
+    self._compact_spill_file()
+
+
+  def _compact_spill_file( self):
+    """rewrites the spill file without the data of records that were removed,
+    loaded and changed, or truncated by redo"""
+    f = self._spill_file
+    if f is None:
+      return
+    f.seek( 0, 2)
+    total = f.tell()
+    live = sum( r.get_spill_size() for r in self._records)
+    if total - live <= max( live, self.MIN_SPILL_WASTE):
+      return
+    new = tempfile.TemporaryFile( prefix="bkchem-undo-")
+    for r in self._records:
+      if r.get_spill_size():
+        r.move_spill( new)
+    f.close()
+    self._spill_file = new
+
+
+  def object_changed( self, o):
+    """returns True if the object o differs from the last recorded state"""
+    rec = self._shadow.get( o)
+    if rec is None:
+      return True
+    if _get_values( o) != rec:
       return True
-    rec1 = state_rec1.records[ state_rec1.objects.index( o)]
-    rec2 = state_rec2.records[ state_rec2.objects.index( o)]
-    for a in o.meta__undo_fake + o.meta__undo_simple + o.meta__undo_properties:
-      if rec1[a] != rec2[a]:
-        return False
-    for a in o.meta__undo_copy:
-      if rec1[a] != rec2[a]:
-        return False
     # process the chidren
-    for a in o.meta__undo_children_to_record:
-      obj = getattr( o, a)
-      if isinstance(obj, (list, set)):
-        for i in obj:
-          if not self.compare_records( i, state_rec1, state_rec2):
-            return False
-      elif isinstance(obj, dict):
-        for i in obj.itervalues():
-          if not self.compare_records( i, state_rec1, state_rec2):
-            return False
-      else:
-        if not self.compare_records( obj, state_rec1, state_rec2):
-          return False
-    return True
+    for ch in _children_of( o):
+      if self.object_changed( ch):
+        return True
+    return False
 
 
   def get_changed_molecules( self):
-    rec = self._records[ self._pos]
-    ret = []
-    for m in self.paper.molecules:
-      if rec.object_changed( m):
-        ret.append( m)
-    return ret
+    return [m for m in self.paper.molecules if self.object_changed( m)]
 
   def get_last_record( self):
     if self._pos >= 1:
@@ -174,87 +260,250 @@ class undo_manager(object):
 ##-------------------- STATE RECORD --------------------
 
 class state_record(object):
-  """Class for storing and setting state of the whole system.
+  """Class storing the difference between two consecutive states of the paper.
 
   """
   def __init__( self, paper, name=''):
     """hmmm, what is supposed to be in comment for __init__?"""
     self.paper = paper
-    self.objects = []
-    self.records = []
     self.name = name
-    self.stack = []
-    self.record_state()
+    # values (of changed attributes only) before and after the change
+    self.before = {}
+    self.after = {}
+    # objects that appeared and disappeared with this change
+    self.added = set()
+    self.removed = set()
+    self.stack_before = []
+    self.stack_after = []
+    # approximate size in bytes
+    self.size = 0
+    # when spilled to disk, the before and after values are stored in a file;
+    # the copy on disk is kept after load until the values change
+    self.spilled = False
+    self._spill = None  # (file, start, length, objects referenced from the data)
 
 
   def clean( self):
-    del self.stack
     del self.paper
-    del self.objects
-    del self.records
     del self.name
+    del self.before
+    del self.after
+    del self.added
+    del self.removed
+    del self.stack_before
+    del self.stack_after
+
+
+  def forget_previous( self):
+    """makes this record the first one in the history - it is no longer
+    possible to return to the state preceding it"""
+    self.before = {}
+    self.after = {}
+    self.added = set()
+    self.removed = set()
+    self.stack_before = self.stack_after
+    self.size = 0
+    self.spilled = False
+    self._spill = None
+
+
+  def spill( self, f):
+    """stores the values into the file f and frees them from memory,
+    returns False when the values cannot be stored"""
+    if self.spilled:
+      return True
+    if self._spill and self._spill[0] is f:
+      # loaded before and not changed since, the data on disk are still valid
+      self.before = None
+      self.after = None
+      self.spilled = True
+      return True
+    objects = []
+    index = {}
+    def persistent_id( obj):
+      if type( obj) in _plain_types:
+        return None
+      if id( obj) not in index:
+        index[ id( obj)] = len( objects)
+        objects.append( obj)
+      return index[ id( obj)]
+    f.seek( 0, 2)
+    start = f.tell()
+    pickler = pickle.Pickler( f, 2)
+    pickler.persistent_id = persistent_id
+    try:
+      pickler.dump( (list( self.before.items()), list( self.after.items())))
+    except (pickle.PicklingError, TypeError):
+      f.truncate( start)
+      return False
+    self._spill = (f, start, f.tell() - start, objects)
+    self.before = None
+    self.after = None
+    self.spilled = True
+    return True
 
 
-  def record_state( self):
-    """stores all necessary information about the system, so that its than able to
-    fully recover that state."""
-    self.stack = copy.copy( self.paper.stack)
+  def load( self):
+    """reads back the values spilled to disk"""
+    if not self.spilled:
+      return
+    f, start, length, objects = self._spill
+    f.seek( start)
+    unpickler = pickle.Unpickler( f)
+    unpickler.persistent_load = lambda pid: objects[ int( pid)]
+    before, after = unpickler.load()
+    self.before = dict( before)
+    self.after = dict( after)
+    self.spilled = False
+
+
+  def get_spill_size( self):
+    """returns the number of bytes of the spill file used by this record"""
+    return self._spill and self._spill[2] or 0
+
+
+  def move_spill( self, f):
+    """copies the data of this record from the spill file to the end of the file f"""
+    old, start, length, objects = self._spill
+    old.seek( start)
+    data = old.read( length)
+    f.seek( 0, 2)
+    self._spill = (f, f.tell(), length, objects)
+    f.write( data)
+
+
+  def merge_previous( self, previous):
+    """joins the changes of the previous record with the changes in this one,
+    the previous record could then be safely removed"""
+    # objects that lived only between the two records
+    transient = previous.added & self.removed
+    # objects that were removed and returned back
+    returned = previous.removed & self.added
+    before = {}
+    for o in set( previous.before) | set( self.before):
+      rec = dict( self.before.get( o, {}))
+      rec.update( previous.before.get( o, {}))
+      before[ o] = rec
+    after = {}
+    for o in set( previous.after) | set( self.after):
+      rec = dict( previous.after.get( o, {}))
+      rec.update( self.after.get( o, {}))
+      after[ o] = rec
+    self.added = (previous.added | self.added) - transient - returned
+    self.removed = (previous.removed | self.removed) - transient - returned
+    for o in self.added | transient:
+      before.pop( o, None)
+    for o in self.removed | transient:
+      after.pop( o, None)
+    self.before = before
+    self.after = after
+    # the copy on disk is outdated
+    self._spill = None
+    self.stack_before = previous.stack_before
+    self.size = _estimate_size( self.before) + _estimate_size( self.after)
+
+
+  def record_state( self, shadow, stack, dirty=None):
+    """compares the paper with the last recorded state (shadow) and stores the
+    differences; the shadow is updated to reflect the recent state"""
+    self.stack_before = stack
+    self.stack_after = copy.copy( self.paper.stack)
+    if self.stack_after == stack:
+      self.stack_after = stack
+    # objects that were seen during this recording
+    self._seen = set()
+    # objects that might have been removed - they are removed only
+    # when not found anywhere else (they could be moved to a different container)
+    after = set( self.stack_after)
+    self._maybe_removed = [o for o in stack if o not in after]
+    if dirty is None:
+      for o in self.stack_after:
+        self._record_object( o, shadow)
+    else:
+      for o in self.stack_after:
+        if o not in shadow:
+          self._record_object( o, shadow)
+      gone = set( self._maybe_removed)
+      for o in dirty:
+        if o in shadow and o not in self._seen and o not in gone:
+          self._record_object( o, shadow)
+    for o in self._maybe_removed:
+      self._record_removal( o, shadow)
+    del self._seen
+    del self._maybe_removed
+    self.size = _estimate_size( self.before) + _estimate_size( self.after)
+
+
+  def _record_object( self, o, shadow):
+    self._seen.add( o)
+    rec = _get_values( o)
+    old = shadow.get( o)
+    if old is None:
+      self.added.add( o)
+      self.after[ o] = rec
+    else:
+      before, after = {}, {}
+      for a, v in rec.items():
+        if old[a] != v:
+          before[a] = old[a]
+          after[a] = v
+      if after:
+        self.before[ o] = before
+        self.after[ o] = after
+      # process the children that are no longer present
+      now = set( _recorded_children( o, rec))
+      self._maybe_removed.extend( ch for ch in _recorded_children( o, old) if ch not in now)
+    shadow[ o] = rec
+    # process the chidren
+    for ch in _recorded_children( o, rec):
+      if ch not in self._seen:
+        self._record_object( ch, shadow)
 
-    for o in self.paper.top_levels:
-      self.record_object( o)
 
+  def _record_removal( self, o, shadow):
+    if o in self._seen:
+      return
+    rec = shadow.pop( o, None)
+    if rec is None:
+      return
+    self.removed.add( o)
+    self.before[ o] = rec
+    for ch in _recorded_children( o, rec):
+      self._record_removal( ch, shadow)
 
-  def record_object( self, o):
-    rec = {}
-    for a in o.meta__undo_fake:
-      rec[a] = getattr( o, a)
-    for a in o.meta__undo_simple:
-      rec[a] = getattr( o, a)
-    for a in o.meta__undo_properties:
-      rec[a] = getattr( o, a)
-    for a in o.meta__undo_copy:
-      rec[a] = copy.copy( o.__dict__[a])
-    self.objects.append( o)
-    self.records.append( rec)
-    # process the chidren
-    for a in o.meta__undo_children_to_record:
-      obj = getattr( o, a)
-      if isinstance(obj, (list, set)):
-        [self.record_object( i) for i in obj]
-      elif isinstance(obj, dict):
-        [self.record_object( i) for i in obj.itervalues() if i]
-      else:
-        self.record_object( obj)
 
+  def undo( self, shadow):
+    """returns the paper to the state before this record"""
+    self.set_state( self.before, self.removed, self.added, self.stack_before, shadow)
 
-  def undo( self, previous):
-    """does undo, actually only calls self.set_state"""
-    self.set_state( previous)
 
+  def redo( self, shadow):
+    """returns the paper to the state recorded by this record"""
+    self.set_state( self.after, self.added, self.removed, self.stack_after, shadow)
 
-  def set_state( self, previous):
+
+  def set_state( self, values, appearing, disappearing, stack, shadow):
     """sets the system to the recorded state (update is done only where necessary,
     not changed values are not touched)."""
     # we need to know about deleted bonds before we try to redraw them (when updating atom)
-    deleted = misc.difference( self.objects, previous.objects)
-    added = misc.difference( previous.objects, self.objects)
+    deleted = appearing
+    added = disappearing
     to_redraw = set()
     ## CHANGED OBJECTS
-    i = 0
-    for o in self.objects:
+    for o, rec in values.items():
       changed = 0
       for a in o.meta__undo_fake:
         # fakes serve only to force redraw in some cases however do not perform any undo
-        if self.records[i][a] != getattr( o, a):
+        if a in rec and rec[a] != getattr( o, a):
           changed = 1
       for a in o.meta__undo_simple:
-        if self.records[i][a] != o.__dict__[a]:
-          o.__dict__[a] = self.records[i][a]
+        if a in rec and rec[a] != o.__dict__[a]:
+          o.__dict__[a] = rec[a]
           if a != 'molecule':  # this jumps a little from the clean, meta-driven design, however saves much time
             changed = 1
       for a in o.meta__undo_copy:
-        if self.records[i][a] != o.__dict__[a]:
-          o.__dict__[a] = copy.copy( self.records[i][a])
+        if a in rec and rec[a] != o.__dict__[a]:
+          o.__dict__[a] = copy.copy( rec[a])
           changed = 1
           # this part is not meta driven, I have to rewrite it one day
           if a == 'bonds':
@@ -263,11 +512,16 @@ class state_record(object):
             o.vertices = o.atoms
           # / end of the shitty patch
       for a in o.meta__undo_properties:
-        if hasattr( o, a):
-          if self.records[i][a] != getattr( o, a):
-            setattr( o, a, self.records[i][a])
+        if a in rec and hasattr( o, a):
+          if rec[a] != getattr( o, a):
+            setattr( o, a, rec[a])
             changed = 1
 
+      # the stored dicts are shared with records and must not be changed in place
+      new = dict( shadow.get( o, {}))
+      new.update( rec)
+      shadow[ o] = new
+
       if changed:
         to_redraw.add( o)
         # some hacks needed to ensure complete redraw
@@ -286,10 +540,8 @@ class state_record(object):
           to_redraw.add( o)
           to_redraw.add( o.parent)
 
-      i += 1
-
     ## DELETED OBJECTS
-    # deleted are known from the top of this def
+    # deleted are the objects that were deleted after the target state was recorded
     for o in deleted:
       if o.object_type not in ( 'molecule','mark') and hasattr( o, 'draw'):
         # no_automatic where possible
@@ -307,8 +559,9 @@ class state_record(object):
         to_redraw.add( o.parent)
 
     ## ADDED OBJECTS
-    # added are known from the top of this def
+    # added are the objects that were created after the target state was recorded
     for o in added:
+      shadow.pop( o, None)
       if o.object_type != 'molecule' and hasattr( o, "delete"):
         o.delete()
 
@@ -316,57 +569,87 @@ class state_record(object):
     # sort the to_redraw
     to_redraw = list( to_redraw)
     to_redraw.sort(key=_redraw_sorting)
+    scheduler = self.paper.redraw_scheduler
     for o in to_redraw:
       if o not in deleted and o.object_type != 'molecule' and hasattr(o,'redraw'):
         if hasattr( o, "after_undo"):
           o.after_undo()
         if o.object_type == 'atom':
-          o.redraw( suppress_reposition=1)
+          scheduler.schedule( o, suppress_reposition=1)
         else:
-          o.redraw()
+          scheduler.schedule( o)
+    # the redraws must be done before the stacking order is restored by add_bindings
+    scheduler.flush()
 
-    self.paper.stack = copy.copy( self.stack)
+    self.paper.stack = copy.copy( stack)
     self.paper.add_bindings()
 
 
-  def get_record( self, o):
-    if o in self.objects:
-      i = self.objects.index(o)
-      return self.records[i]
-    else:
-      return None
 
-  def object_changed( self, o):
-    """returns True if the object o differs from the state recorded here"""
-    rec = self.get_record( o)
-    if rec is None:
-      return True
-    for a in o.meta__undo_fake + o.meta__undo_simple + o.meta__undo_properties:
-      if getattr( o, a) != rec[a]:
-        return True
-    for a in o.meta__undo_copy:
-      if getattr( o, a) != rec[a]:
-        return True
-    # process the chidren
-    for a in o.meta__undo_children_to_record:
+def _get_values( o):
+  """returns a dict of all the undo related values of object o"""
+  rec = {}
+  for a in o.meta__undo_fake:
+    rec[a] = getattr( o, a)
+  for a in o.meta__undo_simple:
+    rec[a] = getattr( o, a)
+  for a in o.meta__undo_properties:
+    rec[a] = getattr( o, a)
+  for a in o.meta__undo_copy:
+    rec[a] = copy.copy( o.__dict__[a])
+  return rec
+
+
+def _recorded_children( o, rec):
+  """returns the children of o as they are stored in the record rec"""
+  ret = []
+  for a in o.meta__undo_children_to_record:
+    if a in rec:
+      obj = rec[a]
+    else:
       obj = getattr( o, a)
-      if isinstance(obj, (list, set)):
-        for i in obj:
-          if self.object_changed( i):
-            return True
-      elif isinstance(obj, dict):
-        for i in obj.itervalues():
-          if self.object_changed( i):
-            return True
-      else:
-        if self.object_changed( obj):
-          return True
-    return False
+    _extend_children( ret, obj)
+  return ret
+
+
+def _children_of( o):
+  ret = []
+  for a in o.meta__undo_children_to_record:
+    _extend_children( ret, getattr( o, a))
+  return ret
+
+
+def _extend_children( ret, obj):
+  if isinstance(obj, (list, set)):
+    ret.extend( obj)
+  elif isinstance(obj, dict):
+    ret.extend( i for i in obj.values() if i)
+  else:
+    ret.append( obj)
+
+
+
+if sys.version_info[0] > 2:
+  _plain_types = (int, float, str, bytes, bool, type(None), tuple, list, dict, set, frozenset)
+else:
+  _plain_types = (int, long, float, str, unicode, bool, type(None), tuple, list, dict, set, frozenset)
+
+
+def _estimate_size( records):
+  """returns approximate size of a dict of records {object: {attr: value}} in bytes,
+  only the containers and the directly stored values are counted"""
+  size = sys.getsizeof( records)
+  for rec in records.values():
+    size += sys.getsizeof( rec)
+    for v in rec.values():
+      size += sys.getsizeof( v)
+  return size
 
 
 
 REDRAW_PREFERENCES = ("atom", "bond")
 
+
 def cmp_to_key(mycmp):
     """Convert a cmp= function into a key= function.
 
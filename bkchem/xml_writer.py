@@ -53,8 +53,8 @@ class XML_writer(object):
     pass
 
 
-  def write_xml_to_file(self, file):
-    """Write XML representation of entire 'paper' to 'file'.
+  def write_xml_to_file(self, file, top_levels):
+    """Write XML representation of top_levels to the binary 'file'.
 
     """
     pass
@@ -90,6 +90,36 @@ class SVG_writer(XML_writer):
     """Construct the SVG dom from all top_levels.
 
     """
+    self._construct_top()
+    for o in self._sort_top_levels( top_levels):
+      self.add_object( o)
+
+
+  def write_xml_to_file(self, file, top_levels, tail=None, dont_indent=("text","ftext","user-data")):
+    """Write SVG of top_levels to the binary 'file' without building the whole dom.
+
+    Elements of only one top level object exist at a time, tail(out) may write
+    more elements (e.g. the CDML package) to the end of the svg element using
+    the dom_extensions.xml_stream_writer out.
+    """
+    self._construct_top()
+    out = dom_extensions.xml_stream_writer( file, dont_indent=dont_indent)
+    out.start( self.top)
+    out.start( self.group)
+    for o in self._sort_top_levels( top_levels):
+      self.add_object( o)
+      for el in self.group.childNodes[:]:
+        self.group.removeChild( el)
+        out.write( el)
+        el.unlink()
+    out.end()
+    if tail:
+      tail( out)
+    out.end()
+
+
+  def _construct_top(self):
+    """Create the svg element and the group for the drawing."""
     # the constants
     border_size = self.paper.get_paper_property( 'crop_margin')
 
@@ -125,32 +155,37 @@ class SVG_writer(XML_writer):
     if not self.full_size:
       self.group.setAttribute( 'transform', 'translate(%d,%d)' % (-x1+border_size, -y1+border_size))
 
-    # sort the top_levels according to paper.stack
-    cs = []
-    for c in self.paper.stack:
-      if c in top_levels:
-        cs.append( c)
-    for o in cs:
-      if o.object_type == 'molecule':
-        for b in o.bonds:
-          self.add_bond( b)
-        for a in o.atoms:
-          self.add_atom( a)
-      elif o.object_type == 'arrow':
-        self.add_arrow( o)
-      elif o.object_type == 'text':
-        self.add_text( o)
-      elif o.object_type == 'plus':
-        self.add_plus( o)
-      elif o.object_type in data.vector_graphics_types:
-        if o.object_type == 'rect':
-          self.add_rect( o)
-        elif o.object_type == 'oval':
-          self.add_oval( o)
-        elif o.object_type == 'polygon':
-          self.add_polygon( o)
-        elif o.object_type == 'polyline':
-          self.add_polyline( o)
+
+  def _sort_top_levels(self, top_levels):
+    """Return top_levels sorted according to paper.stack."""
+    top_levels = set( top_levels)
+    return [c for c in self.paper.stack if c in top_levels]
+
+
+  def add_object(self, o):
+    """Add top level object to SVG document.
+
+    """
+    if o.object_type == 'molecule':
+      for b in o.bonds:
+        self.add_bond( b)
+      for a in o.atoms:
+        self.add_atom( a)
+    elif o.object_type == 'arrow':
+      self.add_arrow( o)
+    elif o.object_type == 'text':
+      self.add_text( o)
+    elif o.object_type == 'plus':
+      self.add_plus( o)
+    elif o.object_type in data.vector_graphics_types:
+      if o.object_type == 'rect':
+        self.add_rect( o)
+      elif o.object_type == 'oval':
+        self.add_oval( o)
+      elif o.object_type == 'polygon':
+        self.add_polygon( o)
+      elif o.object_type == 'polyline':
+        self.add_polyline( o)
 
 
   def add_bond(self, b):
@@ -0,0 +1,45 @@
+"""Benchmark of the id_manager.
+
+Registers, looks up and re-registers (as is done when a file is read
+into the id sandbox) increasing numbers of objects. The time per object
+should stay constant when the number of objects grows.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__)), "..", "bkchem"))
+
+from id_manager import id_manager
+
+
+
+class dummy(object):
+  pass
+
+
+def run( n):
+  objs = [dummy() for i in range( n)]
+  t = time.time()
+  # reading of a file
+  sandbox = id_manager()
+  for i, o in enumerate( objs):
+    sandbox.register_id( o, "a%d" % i)
+  # onread_id_sandbox_finish
+  manager = id_manager()
+  for o in objs:
+    sandbox.unregister_object( o)
+    manager.generate_and_register_id( o, prefix="atom")
+  for o in objs:
+    manager.get_object_with_id( manager.get_id_of_object( o))
+  return time.time() - t
+
+
+if __name__ == '__main__':
+  print("%10s %12s %16s" % ("objects", "time [s]", "per object [us]"))
+  for n in (1000, 2000, 5000, 10000, 20000, 50000):
+    t = run( n)
+    print("%10d %12.4f %16.2f" % (n, t, 1000000*t/n))
@@ -0,0 +1,55 @@
+"""Benchmark of molecule redraw.
+
+Draws a chain of template molecules on a headless paper, redraws all of
+them repeatedly (as happens during dragging or rotation) and reports the
+time per redraw together with the number of canvas items created by it.
+Since redraw reuses the old canvas items, only the first drawing should
+create any.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__)), "..", "bkchem"))
+
+import headless
+
+from singleton_store import Store
+
+
+
+def prepare( count):
+  paper = Store.app.paper
+  tm = Store.tm
+  names = tm.get_template_names()
+  mols = []
+  for i in range( count):
+    m = tm.instantiate_template( i % len( names), paper)
+    m.move( 80 * (i % 10), 80 * (i // 10))
+    paper.stack.append( m)
+    m.draw()
+    mols.append( m)
+  return mols
+
+
+def run( mols, repeat):
+  paper = Store.app.paper
+  created = paper._last_item_id
+  t = time.time()
+  for i in range( repeat):
+    [m.redraw() for m in mols]
+  t = time.time() - t
+  return t, paper._last_item_id - created
+
+
+if __name__ == '__main__':
+  headless.headless_app()
+  print("%10s %14s %14s" % ("molecules", "redraw [ms]", "new items"))
+  for count in (10, 50, 100):
+    mols = prepare( count)
+    t, created = run( mols, 20)
+    print("%10d %14.3f %14d" % (count, 1000*t/20, created))
+    Store.app.paper.clean_paper()
@@ -0,0 +1,56 @@
+"""Benchmark of template instantiation.
+
+Stamps every template from templates.cdml many times onto a headless paper
+the way template_mode does it and compares the time per instantiation of
+copying the prebuilt prototype with building the molecule from its CDML
+element (as was done before).
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__)), "..", "bkchem"))
+
+import headless
+
+from molecule import molecule
+from singleton_store import Store
+
+
+
+def from_package( tm, n, paper):
+  paper.onread_id_sandbox_activate()
+  current = molecule( paper, package=tm.get_template( n))
+  paper.onread_id_sandbox_finish( apply_to=[current])
+  return current
+
+
+def run( instantiate, count, draw=False):
+  tm = Store.tm
+  paper = Store.app.paper
+  names = tm.get_template_names()
+  t = time.time()
+  for i in range( count):
+    n = i % len( names)
+    m = instantiate( tm, n, paper)
+    if draw:
+      paper.stack.append( m)
+      m.draw()
+  t = time.time() - t
+  paper.clean_paper()
+  return t
+
+
+if __name__ == '__main__':
+  headless.headless_app()
+  # the prototypes are built on first use, do it before measuring
+  [Store.tm.get_prepared_template( n) for n in range( len( Store.tm.get_template_names()))]
+  print("%10s %14s %14s %14s" % ("templates", "package [ms]", "prototype [ms]", "with draw [ms]"))
+  for count in (100, 500, 1000, 2000):
+    t1 = run( from_package, count)
+    t2 = run( lambda tm, n, paper: tm.instantiate_template( n, paper), count)
+    t3 = run( lambda tm, n, paper: tm.instantiate_template( n, paper), count, draw=True)
+    print("%10d %14.3f %14.3f %14.3f" % (count, 1000*t1/count, 1000*t2/count, 1000*t3/count))